@@ -0,0 +1,303 @@
+"""
+ACEest Fitness & Gym Management System - Activity File Importer
+Description: Streaming parsers for wearable exports, and a CLI that imports them
+
+Reads GPX, TCX and CSV activity files, plain, gzipped (.gz) or bundled in
+.zip archives, and yields one activity per track / TCX activity / CSV row:
+
+    {'source': 'run.gpx', 'sport': 'running', 'start': '2026-10-01T07:30:00',
+     'duration_seconds': 1815.0, 'heart_rate': [[0.0, 121], [1.0, 122], ...]}
+
+XML is parsed with iterparse and each trackpoint is discarded once read, and
+archive members are decompressed as streams, so memory stays bounded by one
+activity however large the archive. The web app turns activities into
+workouts (POST /api/workouts/import); the CLI parses files locally and posts
+the activities in batches, so large archives never need uploading.
+
+Usage:
+    python activity_import.py export.zip --url http://localhost:5000 --username alice
+"""
+
+import argparse
+import csv
+import getpass
+import gzip
+import io
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+ACTIVITY_EXTENSIONS = ('.gpx', '.tcx', '.csv')
+
+# Sport names found in exports -> (exercise, workout category)
+SPORT_EXERCISES = {
+    'running': ('Running', 'Cardio'),
+    'run': ('Running', 'Cardio'),
+    'trailrunning': ('Running', 'Cardio'),
+    'jogging': ('Jogging', 'Cardio'),
+    'walking': ('Walking', 'Cardio'),
+    'walk': ('Walking', 'Cardio'),
+    'hiking': ('Hiking', 'Cardio'),
+    'cycling': ('Cycling', 'Cardio'),
+    'biking': ('Cycling', 'Cardio'),
+    'ride': ('Cycling', 'Cardio'),
+    'virtualride': ('Stationary Bike', 'Cardio'),
+    'swimming': ('Swimming', 'Cardio'),
+    'swim': ('Swimming', 'Cardio'),
+    'rowing': ('Rowing Machine', 'Cardio'),
+    'elliptical': ('Elliptical', 'Cardio'),
+    'strengthtraining': ('Strength Training', 'Strength'),
+    'weighttraining': ('Strength Training', 'Strength'),
+    'workout': ('Circuit Training', 'Workout'),
+    'hiit': ('HIIT', 'Workout'),
+    'yoga': ('Yoga', 'Flexibility'),
+    'pilates': ('Pilates', 'Flexibility')
+}
+
+# CSV header aliases (normalised: lower case, non-alphanumerics as _)
+CSV_START = ('start', 'start_time', 'timestamp', 'date', 'activity_date')
+CSV_SPORT = ('sport', 'activity', 'activity_type', 'type', 'exercise')
+CSV_MINUTES = ('duration', 'duration_minutes', 'minutes')
+CSV_SECONDS = ('duration_seconds', 'elapsed_time', 'moving_time')
+CSV_DATE_FORMATS = ('%b %d, %Y, %I:%M:%S %p', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S')
+
+
+def sport_exercise(sport):
+    """(exercise, category) for an export's sport name"""
+    key = re.sub(r'[^0-9a-z]', '', str(sport).lower())
+    if key in SPORT_EXERCISES:
+        return SPORT_EXERCISES[key]
+    return (' '.join(str(sport).replace('_', ' ').split()).title() or 'Workout', 'Workout')
+
+
+def parse_time(value):
+    """Local naive datetime for an export timestamp (ISO 8601, 'Z' or offset aware)"""
+    value = value.strip()
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        for date_format in CSV_DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format)
+            except ValueError:
+                pass
+        raise ValueError(f'Unrecognised timestamp: {value!r}')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_elements(stream):
+    """iterparse() start and end events, dropping each element once it has closed.
+    
+    Closed elements are removed from their parent after the caller has seen
+    them, so a file of a million trackpoints holds only the open ones.
+    """
+    stack = []
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            yield event, element
+            continue
+        stack.pop()
+        yield event, element
+        if stack:
+            del stack[-1][-1]  # the element just closed is its parent's last child
+
+
+def activity(source, sport, start, end, heart_rate, duration=None):
+    return {
+        'source': source,
+        'sport': sport,
+        'start': start.isoformat(),
+        'duration_seconds': duration if duration is not None else (end - start).total_seconds(),
+        'heart_rate': [[round((moment - start).total_seconds(), 3), bpm] for moment, bpm in heart_rate]
+    }
+
+
+def parse_gpx(stream, source='activity.gpx'):
+    """One activity per <trk>, timed by its first and last trackpoints"""
+    sport, first, last, heart_rate = None, None, None, []
+    point_time = point_hr = None
+    for event, element in iter_elements(stream):
+        name = local_name(element.tag)
+        if event == 'start':
+            if name == 'trk':
+                sport, first, last, heart_rate = 'workout', None, None, []
+            elif name == 'trkpt':
+                point_time = point_hr = None
+            continue
+        
+        if name == 'type' and first is None:
+            sport = (element.text or '').strip() or sport
+        elif name == 'time' and element.text:
+            point_time = parse_time(element.text)
+        elif name == 'hr' and element.text:
+            point_hr = int(float(element.text))
+        elif name == 'trkpt' and point_time is not None:
+            first = first or point_time
+            last = point_time
+            if point_hr is not None:
+                heart_rate.append((point_time, point_hr))
+        elif name == 'trk' and first is not None:
+            yield activity(source, sport, first, last, heart_rate)
+
+
+def parse_tcx(stream, source='activity.tcx'):
+    """One activity per <Activity>, timed by its laps' TotalTimeSeconds"""
+    sport, start, laps, heart_rate = None, None, 0.0, []
+    point_time = point_hr = None
+    first = last = None
+    for event, element in iter_elements(stream):
+        name = local_name(element.tag)
+        if event == 'start':
+            if name == 'Activity':
+                sport, start, laps, heart_rate = element.get('Sport', 'workout'), None, 0.0, []
+                first = last = None
+            elif name == 'Trackpoint':
+                point_time = point_hr = None
+            continue
+        
+        if name == 'Id' and element.text and start is None:
+            start = parse_time(element.text)
+        elif name == 'TotalTimeSeconds' and element.text:
+            laps += float(element.text)
+        elif name == 'Time' and element.text:
+            point_time = parse_time(element.text)
+        elif name == 'Value' and element.text:
+            point_hr = int(float(element.text))  # HeartRateBpm; lap averages are reset per Trackpoint
+        elif name == 'Trackpoint' and point_time is not None:
+            first = first or point_time
+            last = point_time
+            if point_hr is not None:
+                heart_rate.append((point_time, point_hr))
+        elif name == 'Activity':
+            start = start or first
+            if start is not None:
+                yield activity(source, sport, start, last or start, heart_rate, duration=laps or None)
+
+
+def parse_csv(stream, source='activities.csv'):
+    """One activity per row of a start / sport / duration table"""
+    reader = csv.DictReader(stream)
+    columns = {re.sub(r'[^0-9a-z]+', '_', (name or '').strip().lower()).strip('_'): name
+               for name in reader.fieldnames or ()}
+    
+    def column(aliases):
+        return next((columns[alias] for alias in aliases if alias in columns), None)
+    
+    start_column, sport_column = column(CSV_START), column(CSV_SPORT)
+    minutes_column, seconds_column = column(CSV_MINUTES), column(CSV_SECONDS)
+    if start_column is None or (minutes_column is None and seconds_column is None):
+        raise ValueError(f'{source}: needs a start column and a duration column')
+    
+    for row in reader:
+        if seconds_column is not None and row.get(seconds_column):
+            duration = float(row[seconds_column])
+        else:
+            duration = float(row[minutes_column]) * 60
+        start = parse_time(row[start_column])
+        yield {
+            'source': source,
+            'sport': (row.get(sport_column) if sport_column else None) or 'workout',
+            'start': start.isoformat(),
+            'duration_seconds': duration,
+            'heart_rate': []
+        }
+
+
+PARSERS = {'.gpx': parse_gpx, '.tcx': parse_tcx, '.csv': parse_csv}
+
+
+def parse_stream(stream, name):
+    """Activities in one (binary) file stream, by its name's extension"""
+    if name.lower().endswith('.gz'):
+        with gzip.open(stream) as inner:
+            yield from parse_stream(inner, name[:-3])
+        return
+    
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        yield from parse_csv(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), os.path.basename(name))
+    elif extension in PARSERS:
+        yield from PARSERS[extension](stream, os.path.basename(name))
+
+
+def iter_files(path):
+    """(name, opener) for each activity file in a path, archive or directory"""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            yield from iter_files(os.path.join(path, name))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.filename.lower().endswith(tuple(ext + suffix for ext in ACTIVITY_EXTENSIONS
+                                                          for suffix in ('', '.gz'))):
+                    yield member.filename, lambda member=member: archive.open(member)
+    else:
+        yield path, lambda: open(path, 'rb')
+
+
+def iter_activities(path, errors=None):
+    """Every activity under a path; files that fail to parse are recorded in `errors`"""
+    for name, opener in iter_files(path):
+        try:
+            with opener() as stream:
+                yield from parse_stream(stream, name)
+        except (ET.ParseError, ValueError, KeyError, OSError, EOFError, zipfile.BadZipFile) as e:
+            if errors is None:
+                raise
+            errors.append(f'{os.path.basename(name)}: {e}')
+
+
+def main():
+    import requests
+    
+    parser = argparse.ArgumentParser(description='Import GPX/TCX/CSV activity files as workouts')
+    parser.add_argument('paths', nargs='+', help='activity files, .zip archives or directories')
+    parser.add_argument('--url', default='http://localhost:5000', help='base URL of the ACEest app')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', default=os.environ.get('ACEEST_PASSWORD'),
+                        help='defaults to $ACEEST_PASSWORD, else prompts')
+    parser.add_argument('--batch-size', type=int, default=200, help='activities per request')
+    args = parser.parse_args()
+    
+    session = requests.Session()
+    login = session.post(f'{args.url}/login', json={
+        'username': args.username, 'password': args.password or getpass.getpass()})
+    if not login.ok or not login.json().get('success'):
+        parser.exit(1, f'Login failed: {login.text}\n')
+    
+    totals = {'imported': 0, 'skipped': 0}
+    errors = []
+
+    def send(batch):
+        response = session.post(f'{args.url}/api/workouts/import', json={'activities': batch})
+        response.raise_for_status()
+        result = response.json()
+        for key in totals:
+            totals[key] += result[key]
+    
+    batch = []
+    for path in args.paths:
+        for parsed in iter_activities(path, errors):
+            batch.append(parsed)
+            if len(batch) >= args.batch_size:
+                send(batch)
+                batch = []
+    if batch:
+        send(batch)
+    
+    print(f"{totals['imported']} workouts imported, {totals['skipped']} already present")
+    for error in errors:
+        print(f'  skipped file {error}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+ACEest Fitness & Gym Management System - Offline Analytics Batch Job
+Description: Monthly business-review analytics over exported workout logs
+
+Reads NDJSON workout exports (one row per workout with user_id, timestamp,
+category, exercise, duration and calories, as produced by
+POST /api/workouts/export?format=ndjson; .gz files are accepted) and
+computes, map-reduce style over a local process pool:
+
+    cohorts.csv          retention by first-active month
+    category_trends.csv  sessions, minutes and calories per month and category
+    churn_signals.csv    per-member activity and churn-risk flags
+    summary.json         run metadata and headline numbers
+
+Work is partitioned by user: a split phase streams every input file into
+per-partition files by a hash of user_id, then each partition is analysed
+independently and the partial results are merged. Memory per worker is
+bounded by one partition's members, and the phases scale with cores.
+
+Usage:
+    python analytics_batch.py exports/ --output reports/2026-10 --workers 8
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+# A member with no workout for this many days is at risk of churning
+CHURN_INACTIVE_DAYS = 14
+# ...as is one whose last 28 days have under half the sessions of the 28 before
+CHURN_ACTIVITY_DROP = 0.5
+CHURN_WINDOW_DAYS = 28
+
+CHURN_COLUMNS = ('user_id', 'first_active', 'last_active', 'days_inactive',
+                 'sessions_last_28d', 'sessions_prev_28d', 'churn_risk')
+
+
+def open_input(path):
+    """Open an NDJSON export, transparently decompressing .gz files"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def find_inputs(paths):
+    """Expand directories into the NDJSON files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.ndjson', '.ndjson.gz', '.jsonl', '.jsonl.gz')):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def partition_of(user_id, partitions):
+    # crc32 rather than hash(): stable across worker processes
+    return zlib.crc32(str(user_id).encode()) % partitions
+
+
+def split_file(path, file_index, partitions, workdir):
+    """Map phase 1: stream one input file into per-partition files.
+    
+    Returns the latest workout date seen, so the run can default its
+    as-of date to the end of the data.
+    """
+    outputs = {}
+    latest = None
+    try:
+        with open_input(path) as source:
+            for line in source:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                day = row['timestamp'][:10]
+                if latest is None or day > latest:
+                    latest = day
+                
+                partition = partition_of(row['user_id'], partitions)
+                out = outputs.get(partition)
+                if out is None:
+                    out = outputs[partition] = open(
+                        os.path.join(workdir, f'part-{partition:04d}.{file_index:05d}.ndjson'), 'w', encoding='utf-8')
+                out.write(line if line.endswith('\n') else line + '\n')
+    finally:
+        for out in outputs.values():
+            out.close()
+    return latest
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_label(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def analyse_partition(partition, workdir, as_of):
+    """Map phase 2: per-member analytics for every user in one partition.
+    
+    Writes the partition's churn rows to its own CSV and returns the
+    partial aggregates the reduce phase merges.
+    """
+    as_of = date.fromisoformat(as_of)
+    recent_start = as_of - timedelta(days=CHURN_WINDOW_DAYS)
+    previous_start = recent_start - timedelta(days=CHURN_WINDOW_DAYS)
+    
+    members = {}  # user_id -> [first day, last day, active months, sessions recent, sessions previous]
+    trends = {}   # (month, category) -> [sessions, minutes, calories]
+    prefix = f'part-{partition:04d}.'
+    for name in sorted(os.listdir(workdir)):
+        if not name.startswith(prefix):
+            continue
+        with open(os.path.join(workdir, name), encoding='utf-8') as source:
+            for line in source:
+                row = json.loads(line)
+                day = date.fromisoformat(row['timestamp'][:10])
+                
+                member = members.get(row['user_id'])
+                if member is None:
+                    member = members[row['user_id']] = [day, day, set(), 0, 0]
+                member[0] = min(member[0], day)
+                member[1] = max(member[1], day)
+                member[2].add(month_index(day))
+                if recent_start < day <= as_of:
+                    member[3] += 1
+                elif previous_start < day <= recent_start:
+                    member[4] += 1
+                
+                trend = trends.setdefault((month_index(day), row.get('category') or 'Unknown'), [0, 0, 0.0])
+                trend[0] += 1
+                trend[1] += row.get('duration', 0)
+                trend[2] += row.get('calories', 0)
+    
+    cohorts = {}  # (cohort month, months since) -> members active
+    at_risk = 0
+    with open(os.path.join(workdir, f'churn-{partition:04d}.csv'), 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        for user_id, (first, last, months, recent, previous) in sorted(members.items()):
+            cohort = month_index(first)
+            for month in months:
+                key = (cohort, month - cohort)
+                cohorts[key] = cohorts.get(key, 0) + 1
+            
+            days_inactive = (as_of - last).days
+            risk = days_inactive >= CHURN_INACTIVE_DAYS or (
+                previous > 0 and recent < previous * CHURN_ACTIVITY_DROP)
+            at_risk += risk
+            writer.writerow([user_id, first.isoformat(), last.isoformat(), days_inactive,
+                             recent, previous, int(risk)])
+    
+    return {'members': len(members), 'at_risk': at_risk, 'cohorts': cohorts, 'trends': trends}
+
+
+def merge_partials(partials):
+    """Reduce phase: add up the partition aggregates"""
+    merged = {'members': 0, 'at_risk': 0, 'cohorts': {}, 'trends': {}}
+    for partial in partials:
+        merged['members'] += partial['members']
+        merged['at_risk'] += partial['at_risk']
+        for key, count in partial['cohorts'].items():
+            merged['cohorts'][key] = merged['cohorts'].get(key, 0) + count
+        for key, values in partial['trends'].items():
+            total = merged['trends'].setdefault(key, [0, 0, 0.0])
+            for i, value in enumerate(values):
+                total[i] += value
+    return merged
+
+
+def write_outputs(merged, partitions, workdir, output, as_of, inputs):
+    os.makedirs(output, exist_ok=True)
+    
+    with open(os.path.join(output, 'cohorts.csv'), 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['cohort', 'months_since_first', 'active_members', 'retention'])
+        for (cohort, offset), count in sorted(merged['cohorts'].items()):
+            size = merged['cohorts'][(cohort, 0)]
+            writer.writerow([month_label(cohort), offset, count, round(count / size, 4)])
+    
+    with open(os.path.join(output, 'category_trends.csv'), 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['month', 'category', 'sessions', 'minutes', 'calories'])
+        for (month, category), (sessions, minutes, calories) in sorted(merged['trends'].items()):
+            writer.writerow([month_label(month), category, sessions, minutes, round(calories, 2)])
+    
+    # Partitions already wrote their churn rows; concatenate them in order
+    with open(os.path.join(output, 'churn_signals.csv'), 'w', newline='', encoding='utf-8') as out:
+        csv.writer(out).writerow(CHURN_COLUMNS)
+        for partition in range(partitions):
+            with open(os.path.join(workdir, f'churn-{partition:04d}.csv'), encoding='utf-8') as part:
+                shutil.copyfileobj(part, out)
+    
+    with open(os.path.join(output, 'summary.json'), 'w', encoding='utf-8') as out:
+        json.dump({
+            'generated_at': datetime.now().isoformat(),
+            'as_of': as_of,
+            'inputs': len(inputs),
+            'members': merged['members'],
+            'members_at_risk': merged['at_risk'],
+            'months': sorted({month_label(month) for month, _ in merged['trends']})
+        }, out, indent=2)
+
+
+def run_batch(paths, output, workers=None, partitions=None, as_of=None):
+    """Run the whole split / analyse / merge pipeline; returns the summary"""
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+    inputs = find_inputs(paths)
+    
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='aceest-analytics-') as workdir, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        latest = list(pool.map(split_file, inputs, range(len(inputs)),
+                               [partitions] * len(inputs), [workdir] * len(inputs)))
+        if as_of is None:
+            as_of = max((day for day in latest if day), default=date.today().isoformat())
+        
+        partials = pool.map(analyse_partition, range(partitions),
+                            [workdir] * partitions, [as_of] * partitions)
+        merged = merge_partials(partials)
+        write_outputs(merged, partitions, workdir, output, as_of, inputs)
+    
+    with open(os.path.join(output, 'summary.json'), encoding='utf-8') as summary:
+        return json.load(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline retention, category and churn analytics over workout exports')
+    parser.add_argument('inputs', nargs='+', help='NDJSON export files or directories of them')
+    parser.add_argument('--output', required=True, help='directory for the result files')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--partitions', type=int, default=None, help='user partitions (default: 4 per worker)')
+    parser.add_argument('--as-of', default=None, help='reference date YYYY-MM-DD (default: last workout date)')
+    args = parser.parse_args()
+    
+    summary = run_batch(args.inputs, args.output, args.workers, args.partitions, args.as_of)
+    print(f"{summary['members']} members analysed as of {summary['as_of']}, "
+          f"{summary['members_at_risk']} at risk -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,19 +5,66 @@ Author: DevOps Team
 Description: Web-based fitness tracking and gym management system
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.utils import secure_filename
+from datetime import date, datetime, timedelta
+import atexit
+import base64
+import bisect
+import csv
+import hashlib
+import hmac
+import io
 import json
 import os
+import heapq
+import itertools
+import math
+import multiprocessing
+import multiprocessing.connection
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
+import numpy as np
+
+from activity_import import ACTIVITY_EXTENSIONS, iter_activities, parse_time, sport_exercise
+from meal_planner import DIETS, plan_meals
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['JSON_SORT_KEYS'] = False
+# scrypt cost for password hashes (N must be a power of two; memory is 128 * N * r bytes)
+app.config['PASSWORD_SCRYPT_N'] = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+app.config['PASSWORD_SCRYPT_R'] = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+# Usernames allowed to use the /api/admin endpoints
+app.config['ADMIN_USERS'] = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+
+# Behind nginx/ingress, take the client address from X-Forwarded-For so
+# per-IP rate limits apply to real clients rather than the proxy
+# (docker-compose.yml and k8s/configmap.yaml set this to 1)
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT, x_proto=TRUSTED_PROXY_COUNT)
 
 # In-memory data storage (replace with database in production)
 users_db = {}
 workouts_db = {}
+data_versions = {}  # user_id -> counter bumped on every write to that user's data
+jobs_db = {}  # job_id -> background job record
+workout_ids = {}  # workout id -> (user_id, workout entry)
+workout_samples_db = {}  # (workout id, metric) -> SampleSeries
+workout_plans_db = {}  # user_id -> next week's workout plan
 
 # MET Values for calorie calculation
 MET_VALUES = {
@@ -29,6 +76,195 @@ MET_VALUES = {
     "Flexibility": 2.5
 }
 
+# Keytel et al. (2005) heart-rate energy expenditure, kJ/min:
+# intercept + per_bpm * heart rate + per_kg * weight + per_year * age
+KEYTEL_COEFFICIENTS = {
+    'male': (-55.0969, 0.6309, 0.1988, 0.2017),
+    'female': (-20.4022, 0.4472, -0.1263, 0.074)
+}
+KJ_PER_KCAL = 4.184
+
+# Gender values the registration form offers and profile edits accept
+GENDERS = ('male', 'female', 'other')
+
+# Exercise catalog: (name, category, MET) from the Compendium of Physical Activities
+EXERCISE_CATALOG = [
+    ("Jumping Jacks", "Warm-up", 7.7),
+    ("Arm Circles", "Warm-up", 2.8),
+    ("High Knees", "Warm-up", 8.0),
+    ("Dynamic Stretching", "Warm-up", 2.8),
+    ("Running", "Cardio", 9.8),
+    ("Jogging", "Cardio", 7.0),
+    ("Brisk Walking", "Cardio", 4.3),
+    ("Walking", "Cardio", 3.5),
+    ("Cycling", "Cardio", 7.5),
+    ("Stationary Bike", "Cardio", 6.8),
+    ("Rowing Machine", "Cardio", 7.0),
+    ("Swimming", "Cardio", 8.0),
+    ("Jump Rope", "Cardio", 12.3),
+    ("Elliptical", "Cardio", 5.0),
+    ("Stair Climber", "Cardio", 9.0),
+    ("Treadmill", "Cardio", 8.0),
+    ("Burpees", "Workout", 8.0),
+    ("Circuit Training", "Workout", 8.0),
+    ("HIIT", "Workout", 8.0),
+    ("Kettlebell Swings", "Workout", 9.8),
+    ("Boxing", "Workout", 7.8),
+    ("Bench Press", "Strength", 6.0),
+    ("Squat", "Strength", 5.0),
+    ("Deadlift", "Strength", 6.0),
+    ("Overhead Press", "Strength", 6.0),
+    ("Barbell Row", "Strength", 6.0),
+    ("Lunges", "Strength", 3.8),
+    ("Leg Press", "Strength", 5.0),
+    ("Bicep Curls", "Strength", 3.5),
+    ("Tricep Dips", "Strength", 3.8),
+    ("Push-ups", "Strength", 8.0),
+    ("Pull-ups", "Strength", 8.0),
+    ("Plank", "Strength", 3.8),
+    ("Crunches", "Strength", 3.8),
+    ("Yoga", "Flexibility", 2.5),
+    ("Pilates", "Flexibility", 3.0),
+    ("Stretching", "Flexibility", 2.3),
+    ("Foam Rolling", "Flexibility", 2.0),
+    ("Tai Chi", "Flexibility", 3.0),
+    ("Cool-down Walk", "Cool-down", 2.5),
+    ("Static Stretching", "Cool-down", 2.3),
+    ("Breathing Exercises", "Cool-down", 1.3)
+]
+# Custom exercises show up in other members' suggestions once this many have logged them
+CATALOG_SHARE_MIN_USERS = 3
+# Typeahead keeps the most used exercises for each prefix up to this long;
+# longer prefixes rank the short stretch of the index they match
+CATALOG_PREFIX_CHARS = 4
+CATALOG_PREFIX_CANDIDATES = 32
+
+# Fields that can be requested with ?fields= (sparse fieldsets)
+WORKOUT_FIELDS = ('workouts', 'total_workouts', 'total_duration', 'total_calories')
+SUMMARY_FIELDS = ('total_workouts', 'total_duration', 'total_calories', 'by_category', 'weekly_stats',
+                  'streaks', 'consistency', 'personal_records')
+
+# Idempotency-Key replay window for workout POSTs
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000))
+
+# Weekly report renders kept for reuse while a member's data and profile are unchanged
+REPORT_CACHE_MAX_KEYS = int(os.environ.get('REPORT_CACHE_MAX_KEYS', 10000))
+
+# Threads that hash/verify passwords off the request path (0 = hash inline)
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+
+# Token-bucket limits: (burst capacity, tokens refilled per second)
+RATE_LIMITS = {
+    'login_ip': (20, 20 / 60),
+    'login_user': (5, 5 / 60),
+    'register_ip': (5, 5 / 3600)
+}
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+# Admission control: concurrent requests per worker, wait queue and deadline
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 32))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+
+# Request priorities by endpoint: higher is shed later. None bypasses the limiter.
+PRIORITY_CRITICAL = 2
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 0
+ROUTE_PRIORITIES = {
+    'health_check': PRIORITY_CRITICAL,
+    'login': PRIORITY_CRITICAL,
+    'logout': PRIORITY_CRITICAL,
+    'metrics': PRIORITY_CRITICAL,
+    'static': None,
+    'workout_stream': None,  # long-lived; would pin a slot for its whole life
+    'export_workouts': PRIORITY_LOW,
+    'weekly_report': PRIORITY_LOW,
+    'admin_export_columnar': PRIORITY_LOW,
+    'import_workouts': PRIORITY_LOW,
+    'admin_generate_plans': PRIORITY_LOW
+}
+# Fraction of the wait queue each priority may fill before it is shed
+QUEUE_SHARE = {
+    PRIORITY_CRITICAL: 1.0,
+    PRIORITY_NORMAL: 0.75,
+    PRIORITY_LOW: 0.25
+}
+
+# Background jobs: worker processes and how long finished jobs are kept
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 24 * 60 * 60))
+
+# Columns of exported workout rows (CSV header / NDJSON keys)
+EXPORT_COLUMNS = ('user_id', 'timestamp', 'category', 'exercise', 'duration', 'calories')
+
+# Columnar (Arrow IPC / Parquet) bulk exports: output directory and rows per record batch
+COLUMNAR_EXPORT_DIR = os.environ.get('COLUMNAR_EXPORT_DIR', os.path.join(os.getcwd(), 'exports'))
+COLUMNAR_BATCH_ROWS = int(os.environ.get('COLUMNAR_BATCH_ROWS', 65536))
+
+# Activity file imports: spool directory for uploads, largest upload, and
+# most activities accepted per JSON request / inserted per batch
+IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join(tempfile.gettempdir(), 'aceest-imports'))
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 200 * 1024 * 1024))
+IMPORT_BATCH_SIZE = 500
+
+# Gym-wide admin statistics: days of active-user counts kept and BMI bands
+GYM_STATS_DAYS = int(os.environ.get('GYM_STATS_DAYS', 30))
+BMI_BANDS = (('underweight', 18.5), ('normal', 25), ('overweight', 30), ('obese', float('inf')))
+
+# Trending exercises: Space-Saving capacity per time bucket and buckets retained
+TRENDING_CAPACITY = int(os.environ.get('TRENDING_CAPACITY', 200))
+TRENDING_HOURS = 48
+TRENDING_DAYS = 30
+
+# Leaderboards: entries kept per board and how many ISO weeks are retained
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 50))
+LEADERBOARD_WEEKS = int(os.environ.get('LEADERBOARD_WEEKS', 8))
+LEADERBOARD_METRICS = ('minutes', 'calories', 'sessions')
+
+# Body measurements members can log, smoothed with this half-life
+BODY_METRICS = ('weight', 'body_fat', 'waist', 'hips', 'chest', 'arm')
+BODY_METRIC_HALF_LIFE_DAYS = float(os.environ.get('BODY_METRIC_HALF_LIFE_DAYS', 7))
+BODY_METRIC_WEEKS = 12  # weekly rollups returned with a trend
+
+# Weeks covered by the consistency score, and the workout fields personal records track
+CONSISTENCY_WEEKS = int(os.environ.get('CONSISTENCY_WEEKS', 12))
+RECORD_METRICS = ('duration', 'calories')
+
+# Goals members can set per calendar week and month; new members start with
+# the desktop app's weekly calorie goal
+GOAL_PERIODS = ('week', 'month')
+GOAL_METRICS = ('calories', 'minutes', 'sessions')
+DEFAULT_GOALS = {'week': {'calories': 2000}}
+
+# Workout plans: the categories a week is built from and each one's share of
+# the minutes when training is balanced
+PLAN_CATEGORIES = ('Cardio', 'Strength', 'Flexibility', 'Workout')
+PLAN_BALANCE = (0.40, 0.35, 0.15, 0.10)
+FEATURE_FIELDS = tuple(f'minutes:{category}' for category in MET_VALUES) + ('sessions', 'load', 'calories')
+PLAN_ACUTE_DAYS = 7  # time constants of the acute and chronic training averages
+PLAN_CHRONIC_DAYS = 28
+PLAN_PROGRESSION = 1.10  # weekly minutes grow by at most 10% a week...
+PLAN_MAX_LOAD_RATIO = 1.3  # ...and hold while acute load runs this far above chronic
+PLAN_MINUTES = (90, 600)  # weekly minutes, beginners start at the low end
+PLAN_SESSIONS = (3, 6)  # sessions per week when no sessions goal is set
+PLAN_SESSION_MINUTES = (20, 90)
+PLAN_REBALANCE = 0.5  # how hard a plan pulls recent training back towards PLAN_BALANCE
+PLAN_KCAL_PER_MINUTE = 7.0  # converts a calorie goal for members without history
+PLAN_DIR = os.environ.get('PLAN_DIR', os.path.join(tempfile.gettempdir(), 'aceest-plans'))
+PLAN_CHUNK_MEMBERS = 5000  # members the nightly batch snapshots, and builds, at a time
+
+# Sensor series that can be attached to a workout, with the integer steps
+# per unit they are quantised to (speed in cm/s, altitude in decimetres)
+SAMPLE_METRICS = {'heart_rate': 1, 'cadence': 1, 'power': 1, 'speed': 100, 'altitude': 10}
+SAMPLE_CHUNK_SIZE = 512
+SAMPLE_MAX_UPLOAD = 100000  # samples per request
+SAMPLE_MAX_POINTS = 5000  # downsampled points per read
+
+# Seconds between keep-alive comments on idle Server-Sent Events streams
+SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+
 
 # Decorator for login required
 def login_required(f):
@@ -40,6 +276,1879 @@ def login_required(f):
     return decorated_function
 
 
+# Decorator for gym staff (admin) endpoints
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        if session['user_id'] not in app.config['ADMIN_USERS']:
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# Registry of background job handlers, keyed by job kind
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for a kind of background job.
+
+    Handlers run in a worker process as handler(params, progress): params
+    must be picklable and progress(fraction, message=None) reports how far
+    along the job is. They return either a JSON-serialisable value or a
+    file as {'content': ..., 'mimetype': ..., 'filename': ...}.
+    """
+    def register(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return register
+
+
+# Web-process steps run when a job of a kind succeeds, keyed by job kind
+JOB_FINISHERS = {}
+
+
+def job_finisher(kind):
+    """Register a function to complete successful jobs of a kind in the web process.
+    
+    Worker processes can't reach the in-memory stores, so a job that has to
+    write to them returns its output and finisher(job, result) applies it;
+    what the finisher returns becomes the job's result. The job is only
+    marked done once the finisher has run.
+    """
+    def register(f):
+        JOB_FINISHERS[kind] = f
+        return f
+    return register
+
+
+# Web-process steps run before a job of a kind is queued, keyed by job kind
+JOB_PREPARERS = {}
+
+
+def job_preparer(kind):
+    """Register a function that gathers a job's input in the web process.
+    
+    For jobs that need the whole of an in-memory store: submit() returns
+    at once and preparer(job, params) runs in a background thread, reading
+    the store a chunk at a time (yielding to requests in between) into a
+    spool file. What it returns is passed to the handler as its params.
+    """
+    def register(f):
+        JOB_PREPARERS[kind] = f
+        return f
+    return register
+
+
+class EventBroker:
+    """Publish/subscribe hub for live update events.
+
+    Local stand-in for a shared broker such as Redis pub/sub: publishers push
+    events to a channel and every subscription on that channel receives them.
+    Like the in-memory databases above, delivery only reaches subscribers in
+    this process, so the app must run as a single web process (the Dockerfile
+    starts one gevent worker). Swap in a shared broker before adding workers.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channel):
+        """Register a new subscription queue on a channel"""
+        subscription = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channel, subscription):
+        """Remove a subscription queue from a channel"""
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def publish(self, channel, event_type, data):
+        """Deliver an event to every subscriber, returning how many received it"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait((event_type, data))
+            except queue.Full:
+                # Slow consumer: drop its backlog and ask it to resynchronise
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(('resync', {}))
+        return len(subscribers)
+
+    def subscriber_count(self, channel=None):
+        """Number of open subscriptions, overall or for one channel"""
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(s) for s in self._channels.values())
+
+    def clear(self):
+        with self._lock:
+            self._channels.clear()
+
+
+event_broker = EventBroker()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical computations into one in-flight call.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and share its result (or its exception).
+    Nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the identical call already running"""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls)
+            }
+
+    def reset(self):
+        with self._lock:
+            self.calls = self.executions = self.coalesced = 0
+
+
+single_flight = SingleFlight()
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire a fixed time after being stored.
+
+    Every entry shares the same TTL, so insertion order is also expiry order
+    and both expiry and capacity eviction pop from the oldest end. Entries
+    live in this process only: as the idempotency store it dedupes retries
+    because the app runs as a single web process (see the Dockerfile).
+    """
+
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            self._expire()
+            entry = self._data.get(key)
+            return None if entry is None else entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self._clock() + self.ttl_seconds, value)
+            self._expire()
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _expire(self):
+        now = self._clock()
+        while self._data:
+            oldest = next(iter(self._data.values()))
+            if oldest[0] > now:
+                break
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, priority-ordered wait queue.
+
+    Up to max_concurrent requests run at once. Others wait in a queue that
+    releases the highest priority first; a priority may only occupy its
+    QUEUE_SHARE of the queue, and when the queue is full a higher priority
+    arrival displaces the lowest priority waiter. Waiters that are not
+    admitted within the deadline are shed.
+    """
+
+    class _Waiter:
+        def __init__(self, priority):
+            self.priority = priority
+            self.state = 'waiting'  # -> admitted | displaced | timeout
+            self.ready = threading.Event()
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._heap = []  # (-priority, seq, waiter); finished waiters are skipped lazily
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._shed = {}
+
+    def acquire(self, priority):
+        """Wait for a slot; returns None when admitted or the reason it was shed"""
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._queued:
+                self._in_flight += 1
+                self._admitted += 1
+                return None
+            
+            if self._queued >= self.max_queue * QUEUE_SHARE.get(priority, 1.0):
+                if self._queued < self.max_queue or not self._displace_below(priority):
+                    self._count_shed('queue_full', priority)
+                    return 'queue_full'
+            
+            waiter = self._Waiter(priority)
+            heapq.heappush(self._heap, (-priority, next(self._seq), waiter))
+            self._queued += 1
+        
+        waiter.ready.wait(self.queue_timeout)
+        
+        with self._lock:
+            if waiter.state == 'waiting':
+                waiter.state = 'timeout'
+                self._queued -= 1
+                self._count_shed('timeout', priority)
+            return None if waiter.state == 'admitted' else waiter.state
+
+    def release(self):
+        """Free a slot and hand it to the highest priority waiter"""
+        with self._lock:
+            self._in_flight -= 1
+            while self._heap and self._in_flight < self.max_concurrent:
+                waiter = heapq.heappop(self._heap)[2]
+                if waiter.state != 'waiting':
+                    continue
+                waiter.state = 'admitted'
+                self._queued -= 1
+                self._in_flight += 1
+                self._admitted += 1
+                waiter.ready.set()
+
+    def _displace_below(self, priority):
+        # Evict the newest of the lowest priority waiters, if it ranks below priority
+        victim = None
+        for neg_priority, seq, waiter in self._heap:
+            if waiter.state != 'waiting' or -neg_priority >= priority:
+                continue
+            if victim is None or (-neg_priority, -seq) < (victim[0], -victim[1]):
+                victim = (-neg_priority, seq, waiter)
+        if victim is None:
+            return False
+        
+        waiter = victim[2]
+        waiter.state = 'displaced'
+        self._queued -= 1
+        self._count_shed('displaced', waiter.priority)
+        waiter.ready.set()
+        return True
+
+    def _count_shed(self, reason, priority):
+        key = f'{reason}:{priority}'
+        self._shed[key] = self._shed.get(key, 0) + 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queue_depth': self._queued,
+                'admitted': self._admitted,
+                'shed': dict(self._shed)
+            }
+
+
+class TokenBucketStore:
+    """In-memory token-bucket state, keyed by limit name and client.
+
+    consume() is the whole contract: a shared backend (e.g. a Redis script)
+    only has to refill and take tokens atomically per key. Wall-clock time is
+    used so buckets stay meaningful when the state is shared between hosts.
+    At most max_keys buckets are kept: past that, full buckets and then
+    the ones closest to refilling are dropped, found through a heap ordered
+    by full_at rather than by scanning.
+
+    The buckets are per process, so limits hold because the app runs as one
+    worker in one pod (see the Dockerfile and k8s/deployment.yaml).
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.time):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._by_full_at = []  # (full_at, key); entries for superseded full_at values are skipped lazily
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Take cost tokens; returns 0 if allowed, else seconds until it would be"""
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            full_at = now + (capacity - tokens) / rate
+            self._buckets[key] = (tokens, now, full_at)
+            heapq.heappush(self._by_full_at, (full_at, key))
+            
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+            if len(self._by_full_at) > 2 * len(self._buckets) + 64:
+                self._by_full_at = [(bucket[2], key) for key, bucket in self._buckets.items()]
+                heapq.heapify(self._by_full_at)
+            return 0 if allowed else (cost - tokens) / rate
+
+    def _evict(self, now):
+        # A bucket that has refilled completely is the same as no bucket at all;
+        # if none has, the one closest to full goes to stay within max_keys
+        heap = self._by_full_at
+        while heap and (len(self._buckets) > self.max_keys or heap[0][0] <= now):
+            full_at, key = heapq.heappop(heap)
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket[2] == full_at:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._by_full_at.clear()
+
+
+# Rate-limit buckets for login and register attempts
+rate_limit_db = TokenBucketStore()
+
+
+def gevent_patched():
+    """Whether gevent has monkey-patched threading (gunicorn's gevent workers)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def run_blocking(fn, *args):
+    """Call fn(*args), on one of gevent's real OS threads when running under gevent.
+    
+    Calls that block in C (multiprocessing pipes and locks) can't yield to
+    other greenlets; on a native thread only the calling greenlet waits.
+    """
+    if gevent_patched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def make_password_pool(workers):
+    """Bounded pool of OS threads for password hashing.
+
+    hashlib.scrypt releases the GIL, so hashes run in parallel while the
+    worker keeps serving other requests. Under gevent the stdlib threads are
+    greenlets, so gevent's real-thread pool is used instead.
+    """
+    if workers <= 0:
+        return None
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+
+password_pool = make_password_pool(PASSWORD_HASH_WORKERS)
+
+
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
+
+class TopK:
+    """Highest-scoring K members of a board, maintained as scores change.
+
+    Every member's score is kept, but only the top K are ordered. Raising a
+    score touches at most the K-entry list; a score that drops inside the top
+    K (rare: recomputed calories) marks the list for a rebuild on next read.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+        self._top = []  # [(score, member)] best first
+        self._stale = False
+
+    def set(self, member, score):
+        previous = self.scores.get(member)
+        self.scores[member] = score
+        
+        position = next((i for i, (_, m) in enumerate(self._top) if m == member), None)
+        if position is not None:
+            if previous is not None and score < previous and len(self.scores) > len(self._top):
+                self._stale = True  # someone outside the top K may now rank higher
+            self._top[position] = (score, member)
+        elif len(self._top) < self.k:
+            self._top.append((score, member))
+        elif score > self._top[-1][0]:
+            self._top[-1] = (score, member)
+        else:
+            return
+        self._top.sort(key=lambda entry: (-entry[0], entry[1]))
+
+    def add(self, member, amount):
+        self.set(member, self.scores.get(member, 0) + amount)
+
+    def top(self, limit=None):
+        if self._stale:
+            self._top = sorted(((score, member) for member, score in self.scores.items()),
+                               key=lambda entry: (-entry[0], entry[1]))[:self.k]
+            self._stale = False
+        return self._top[:limit]
+
+
+class Leaderboards:
+    """Weekly gym-wide leaderboards per metric and category.
+
+    Boards are keyed by ISO week, metric and category ('all' plus each
+    MET_VALUES category) and updated as workouts are logged, so reading a
+    board costs O(K) whatever the number of members. Weeks older than the
+    retention window roll off as new weeks start.
+    """
+
+    def __init__(self, k, retention_weeks):
+        self.k = k
+        self.retention_weeks = retention_weeks
+        self._lock = threading.Lock()
+        self._weeks = {}  # 'YYYY-Www' -> {(metric, category): TopK}
+
+    @staticmethod
+    def week_key(moment):
+        year, week, _ = moment.isocalendar()
+        return f'{year}-W{week:02d}'
+
+    def record(self, user_id, workout_entry):
+        """Add a logged workout to its week's boards"""
+        week = self.week_key(datetime.fromisoformat(workout_entry['timestamp']))
+        categories = ['all']
+        if workout_entry['category'] in MET_VALUES:
+            categories.append(workout_entry['category'])
+        amounts = {
+            'minutes': workout_entry['duration'],
+            'calories': workout_entry['calories'],
+            'sessions': 1
+        }
+        
+        with self._lock:
+            boards = self._weeks.get(week)
+            if boards is None:
+                if self._weeks and week < min(self._weeks) and len(self._weeks) >= self.retention_weeks:
+                    return  # backfill older than anything retained
+                boards = self._weeks[week] = {}
+                self._roll_over()
+            for metric, amount in amounts.items():
+                for category in categories:
+                    board = boards.get((metric, category))
+                    if board is None:
+                        board = boards[(metric, category)] = TopK(self.k)
+                    board.add(user_id, amount)
+
+    def adjust(self, user_id, workout_entry, metric, delta):
+        """Apply a change to an already-recorded workout (e.g. recomputed calories)"""
+        week = self.week_key(datetime.fromisoformat(workout_entry['timestamp']))
+        with self._lock:
+            boards = self._weeks.get(week, {})
+            for category in ('all', workout_entry['category']):
+                board = boards.get((metric, category))
+                if board is not None and user_id in board.scores:
+                    board.add(user_id, delta)
+    
+    def _roll_over(self):
+        for week in sorted(self._weeks)[:-self.retention_weeks]:
+            del self._weeks[week]
+
+    def top(self, week, metric, category='all', limit=None):
+        """[(member, score)] best first for one board"""
+        with self._lock:
+            board = self._weeks.get(week, {}).get((metric, category))
+            if board is None:
+                return []
+            return [(member, score) for score, member in board.top(limit)]
+
+    def clear(self):
+        with self._lock:
+            self._weeks.clear()
+
+
+leaderboards = Leaderboards(LEADERBOARD_SIZE, LEADERBOARD_WEEKS)
+
+
+class HyperLogLog:
+    """Fixed-size distinct counter (4 KB at p=12, ~1.6% standard error).
+
+    Two sketches merge by taking the register-wise maximum, so sketches
+    kept separately combine into one distinct count of their union.
+    """
+
+    _INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._count = 0
+
+    def add(self, item):
+        h = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._count = None
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._count = None
+
+    def count(self):
+        # Cached between changes: most days stop changing once they are over
+        if self._count is None:
+            alpha = 0.7213 / (1 + 1.079 / self.m)
+            estimate = alpha * self.m * self.m / sum(map(self._INVERSE_POWERS.__getitem__, self.registers))
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * self.m and zeros:
+                estimate = self.m * math.log(self.m / zeros)  # linear counting for small sets
+            self._count = round(estimate)
+        return self._count
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters summary over a stream of items.
+
+    Tracks at most `capacity` items. When full, a new item replaces the one
+    with the smallest count and inherits that count as its error. After N
+    items every estimate satisfies true <= estimate <= true + N / capacity,
+    and every item with true frequency above N / capacity is tracked.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counters = {}  # item -> [estimate, max overestimate]
+
+    def add(self, item, count=1):
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def floor(self):
+        """Largest count an untracked item could have"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+
+class TrendingExercises:
+    """Gym-wide popular exercises over sliding hour and day windows.
+
+    Every logged workout adds its (normalised) exercise name to a
+    Space-Saving summary for its hour and for its day; memory is fixed at
+    TRENDING_CAPACITY counters per bucket. A window query merges the
+    buckets it covers: estimates add up, and so do the per-bucket error
+    floors, giving for each item true count in [estimate - max_error, estimate].
+    """
+
+    def __init__(self, capacity, hours, days):
+        self.capacity = capacity
+        self.retained = {'hour': hours, 'day': days}
+        self._lock = threading.Lock()
+        self._buckets = {'hour': {}, 'day': {}}
+
+    @staticmethod
+    def bucket_key(granularity, moment):
+        return moment.strftime('%Y-%m-%dT%H' if granularity == 'hour' else '%Y-%m-%d')
+
+    def record(self, exercise, moment):
+        item = normalize_exercise_name(exercise)
+        if not item:
+            return
+        with self._lock:
+            for granularity, buckets in self._buckets.items():
+                key = self.bucket_key(granularity, moment)
+                summary = buckets.get(key)
+                if summary is None:
+                    if len(buckets) >= self.retained[granularity] and key < min(buckets):
+                        continue  # backfill older than the retained window
+                    summary = buckets[key] = SpaceSaving(self.capacity)
+                    for expired in sorted(buckets)[:-self.retained[granularity]]:
+                        del buckets[expired]
+                summary.add(item)
+
+    def top(self, granularity, periods, now=None, limit=10):
+        """Merged heavy hitters of the last `periods` hours or days"""
+        now = now or datetime.now()
+        step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+        keys = [self.bucket_key(granularity, now - step * i) for i in range(periods)]
+        
+        with self._lock:
+            summaries = [self._buckets[granularity][key] for key in keys if key in self._buckets[granularity]]
+            merged = {}
+            error_floor = 0
+            total = 0
+            for summary in summaries:
+                floor = summary.floor()
+                error_floor += floor
+                total += summary.total
+                for item, (estimate, error) in summary.counters.items():
+                    entry = merged.setdefault(item, [0, 0, 0])
+                    entry[0] += estimate
+                    entry[1] += error
+                    entry[2] += floor
+        
+        # An item missing from a bucket may still have up to that bucket's floor there
+        ranked = []
+        for item, (estimate, error, present_floor) in merged.items():
+            missing_floor = error_floor - present_floor
+            ranked.append({'exercise': item, 'count': estimate + missing_floor,
+                           'max_error': error + missing_floor})
+        ranked.sort(key=lambda entry: (-entry['count'], entry['exercise']))
+        return {'total': total, 'error_bound': error_floor, 'exercises': ranked[:limit]}
+
+    def clear(self):
+        with self._lock:
+            for buckets in self._buckets.values():
+                buckets.clear()
+
+
+def catalog_key(name):
+    """Catalog identity of an exercise name: lower case, letters and digits only"""
+    return re.sub(r'[^0-9a-z]', '', str(name).lower())
+
+
+class ExerciseCatalog:
+    """Normalised exercise names with a prefix index for typeahead.
+    
+    Names are keyed by catalog_key(), so "Bench press", "bench Press" and
+    "benchpress" are the same exercise. A sorted list of index keys (the
+    whole name and each later word of it) answers a prefix query with a
+    bisection; matches are ranked by the member's own usage, then
+    gym-wide usage, then index order. Exercises members type that are not
+    in the bundled table are added on first use and join the index once
+    CATALOG_SHARE_MIN_USERS members have logged them; until then only
+    those members see them, through their own usage.
+    
+    Ranking never scans the whole catalog: used exercises are scored from
+    the member's own history plus, for short prefixes, a list of the most
+    used exercises kept up to date per prefix, or for longer ones the index
+    range they match.
+    """
+
+    def __init__(self, entries):
+        self._lock = threading.Lock()
+        self._exercises = {}  # key -> {'name', 'category', 'met', 'custom', 'index_keys'}
+        self._index = []      # sorted [(index key, exercise key)] of shared exercises
+        self._global_counts = {}
+        self._user_counts = {}  # user_id -> {exercise key: count}
+        self._custom_users = {}  # custom exercise key -> set of user ids
+        self._top = {}  # prefix of up to CATALOG_PREFIX_CHARS -> most used shared exercise keys, best first
+        for name, category, met in entries:
+            self._publish(self._add(name, category, met, custom=False))
+    
+    def _add(self, name, category, met, custom):
+        key = catalog_key(name)
+        words = [catalog_key(word) for word in name.split()]
+        index_keys = {''.join(words[i:]) for i in range(len(words))} - {''}
+        self._exercises[key] = {'name': name, 'category': category, 'met': met,
+                                'custom': custom, 'index_keys': index_keys}
+        return key
+    
+    def _publish(self, key):
+        for index_key in self._exercises[key]['index_keys']:
+            bisect.insort(self._index, (index_key, key))
+    
+    def _shared(self, key):
+        return not self._exercises[key]['custom'] or \
+            len(self._custom_users.get(key, ())) >= CATALOG_SHARE_MIN_USERS
+    
+    def lookup(self, name):
+        """Catalog entry for a free-text exercise name, or None"""
+        return self._exercises.get(catalog_key(name))
+    
+    def record_use(self, user_id, name, category):
+        """Count a logged exercise and return its canonical name (adding it if new)"""
+        key = catalog_key(name)
+        if not key:
+            return name
+        with self._lock:
+            entry = self._exercises.get(key)
+            if entry is None:
+                display = ' '.join(str(name).split())
+                self._add(display, category, MET_VALUES.get(category, 4.0), custom=True)
+                entry = self._exercises[key]
+            if entry['custom']:
+                users = self._custom_users.setdefault(key, set())
+                if user_id not in users:
+                    users.add(user_id)
+                    # Someone's private spelling stays private until enough members use it
+                    if len(users) == CATALOG_SHARE_MIN_USERS:
+                        self._publish(key)
+            self._global_counts[key] = self._global_counts.get(key, 0) + 1
+            if self._shared(key):
+                self._promote(key)
+            user_counts = self._user_counts.setdefault(user_id, {})
+            user_counts[key] = user_counts.get(key, 0) + 1
+            return entry['name']
+    
+    def _promote(self, key):
+        # Re-rank a key whose gym-wide count just went up in each short prefix's list
+        rank = (-self._global_counts[key], self._exercises[key]['name'])
+        prefixes = {index_key[:length] for index_key in self._exercises[key]['index_keys']
+                    for length in range(1, min(len(index_key), CATALOG_PREFIX_CHARS) + 1)}
+        for prefix in prefixes:
+            top = self._top.setdefault(prefix, [])
+            if key in top:
+                top.remove(key)
+            position = 0
+            while position < len(top) and (-self._global_counts[top[position]],
+                                           self._exercises[top[position]]['name']) <= rank:
+                position += 1
+            if position < CATALOG_PREFIX_CANDIDATES:
+                top.insert(position, key)
+                del top[CATALOG_PREFIX_CANDIDATES:]
+    
+    def suggest(self, query, user_id=None, limit=8):
+        """Catalog entries matching a prefix, most used first"""
+        prefix = catalog_key(query)
+        if not prefix:
+            return []
+        with self._lock:
+            user_counts = self._user_counts.get(user_id, {})
+
+            # Used exercises rank first; only they need scoring
+            if len(prefix) <= CATALOG_PREFIX_CHARS:
+                used = set(self._top.get(prefix, ()))
+            else:
+                # Index keys are [0-9a-z], so '{' sorts after every key with this prefix
+                start = bisect.bisect_left(self._index, (prefix,))
+                end = bisect.bisect_left(self._index, (prefix + '{',), start)
+                used = {key for _, key in self._index[start:end] if key in self._global_counts}
+            used.update(key for key in user_counts
+                        if any(index_key.startswith(prefix) for index_key in self._exercises[key]['index_keys']))
+            ranked = sorted(used, key=lambda key: (-user_counts.get(key, 0), -self._global_counts[key],
+                                                   self._exercises[key]['name']))[:limit]
+            
+            seen = set(ranked)
+            position = bisect.bisect_left(self._index, (prefix,))
+            while len(ranked) < limit and position < len(self._index):
+                index_key, key = self._index[position]
+                if not index_key.startswith(prefix):
+                    break
+                if key not in seen:
+                    seen.add(key)
+                    ranked.append(key)
+                position += 1
+            
+            return [{'name': self._exercises[key]['name'], 'category': self._exercises[key]['category'],
+                     'met': self._exercises[key]['met']} for key in ranked]
+    
+    def favourites(self, user_id):
+        """{category: [exercise names]} the member has logged, most used first"""
+        with self._lock:
+            ranked = sorted(self._user_counts.get(user_id, {}).items(), key=lambda item: (-item[1], item[0]))
+            favourites = {}
+            for key, _ in ranked:
+                entry = self._exercises.get(key)
+                if entry is not None:
+                    favourites.setdefault(entry['category'], []).append(entry['name'])
+            return favourites
+    
+    def reset_usage(self):
+        """Forget usage counts and custom exercises (bundled entries stay)"""
+        with self._lock:
+            for key in [key for key, entry in self._exercises.items() if entry['custom']]:
+                del self._exercises[key]
+            self._index = [item for item in self._index if item[1] in self._exercises]
+            self._global_counts.clear()
+            self._user_counts.clear()
+            self._custom_users.clear()
+            self._top.clear()
+
+
+def search_tokens(text):
+    """Lower-case words of a free-text field, for the workout search index"""
+    return re.findall(r'[0-9a-z]+', str(text).lower())
+
+
+class WorkoutSearchIndex:
+    """Per-user inverted index over workout exercise names.
+    
+    Each token maps to a posting list of (timestamp, seq, workout) kept
+    sorted by timestamp, so a since/until window is two bisections and
+    backdated workouts are insorted into place. A multi-word query walks
+    the shortest list in the window and bisects into the others, which
+    keeps it proportional to the rarest term rather than the history.
+    """
+    
+    ALL = ''  # posting list of every workout, for queries without terms
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}  # user_id -> {token: [(timestamp, seq, workout)]}
+        self._seq = itertools.count()
+    
+    def add(self, user_id, workout):
+        posting = (workout['timestamp'], next(self._seq), workout)
+        with self._lock:
+            postings = self._postings.setdefault(user_id, {})
+            for token in set(search_tokens(workout['exercise'])) | {self.ALL}:
+                entries = postings.setdefault(token, [])
+                if not entries or entries[-1] <= posting:
+                    entries.append(posting)
+                else:
+                    bisect.insort(entries, posting)
+    
+    def search(self, user_id, query, since=None, until=None, limit=100):
+        """Matching workouts, newest first, and how many matched in total.
+        
+        since and until are ISO timestamp prefixes compared as strings;
+        until is inclusive of anything it prefixes.
+        """
+        tokens = set(search_tokens(query)) or {self.ALL}
+        with self._lock:
+            postings = self._postings.get(user_id, {})
+            windows = []
+            for token in tokens:
+                entries = postings.get(token)
+                if not entries:
+                    return [], 0
+                start = bisect.bisect_left(entries, (since,)) if since else 0
+                end = bisect.bisect_left(entries, (until + '\uffff',)) if until else len(entries)
+                windows.append((entries, start, end))
+            
+            windows.sort(key=lambda window: window[2] - window[1])
+            (driver, start, end), others = windows[0], windows[1:]
+            matches = []
+            for i in range(end - 1, start - 1, -1):
+                posting = driver[i]
+                for entries, lo, hi in others:
+                    j = bisect.bisect_left(entries, posting[:2], lo, hi)
+                    if j == hi or entries[j][1] != posting[1]:
+                        break
+                else:
+                    matches.append(posting[2])
+            return matches[:limit], len(matches)
+    
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+
+
+class MetricSeries:
+    """One member's readings of one body metric, with running aggregates.
+    
+    Readings are kept in parallel arrays sorted by time, alongside the
+    exponential moving average at each reading. Appending extends the
+    average in O(1); a backdated reading re-smooths only the readings after
+    it, and a reading at the same moment as an existing one corrects it
+    rather than adding a second. Weekly rollups (count, sum, min, max,
+    closing average) are kept up to date the same way, so reading a trend
+    never scans the history.
+    """
+
+    def __init__(self, half_life_seconds):
+        self.half_life = half_life_seconds
+        self.times = array('d')
+        self.values = array('d')
+        self.smoothed = array('d')
+        self.weeks = {}  # 'YYYY-Www' -> [count, total, low, high, closing average]
+        self.week_keys = []  # sorted
+    
+    def add(self, moment, value):
+        when = moment.timestamp()
+        week = Leaderboards.week_key(moment)
+        position = bisect.bisect_left(self.times, when)
+        if position < len(self.times) and self.times[position] == when:
+            self.values[position] = value
+            # The old value may have been the week's low or high: redo the week's readings
+            first = last = position
+            while first and self._week(first - 1) == week:
+                first -= 1
+            while last + 1 < len(self.times) and self._week(last + 1) == week:
+                last += 1
+            readings = self.values[first:last + 1]
+            self.weeks[week][1:4] = [sum(readings), min(readings), max(readings)]
+        else:
+            self.times.insert(position, when)
+            self.values.insert(position, value)
+            self.smoothed.insert(position, value)
+        
+            rollup = self.weeks.get(week)
+            if rollup is None:
+                rollup = self.weeks[week] = [0, 0.0, value, value, value]
+                bisect.insort(self.week_keys, week)
+            rollup[0] += 1
+            rollup[1] += value
+            rollup[2] = min(rollup[2], value)
+            rollup[3] = max(rollup[3], value)
+        
+        # Irregular intervals: decay by the time elapsed, not per reading
+        average = self.smoothed[position - 1] if position else value
+        for i in range(position, len(self.times)):
+            if i:
+                weight = 1 - 0.5 ** ((self.times[i] - self.times[i - 1]) / self.half_life)
+                average += weight * (self.values[i] - average)
+            self.smoothed[i] = average
+            self.weeks[self._week(i)][4] = average
+    
+    def _week(self, i):
+        return Leaderboards.week_key(datetime.fromtimestamp(self.times[i]))
+    
+    def trend(self, weeks):
+        """Latest and smoothed values plus the last `weeks` weekly rollups"""
+        closing = self.weeks[self.week_keys[-1]][4]
+        previous = self.weeks[self.week_keys[-2]][4] if len(self.week_keys) > 1 else self.values[0]
+        weekly = []
+        for week in self.week_keys[-weeks:]:
+            count, total, low, high, week_closing = self.weeks[week]
+            weekly.append({'week': week, 'count': count, 'average': round(total / count, 2),
+                           'min': low, 'max': high, 'smoothed': round(week_closing, 2)})
+        return {
+            'latest': self.values[-1],
+            'latest_at': datetime.fromtimestamp(self.times[-1]).isoformat(),
+            'first': self.values[0],
+            'smoothed': round(self.smoothed[-1], 2),
+            'weekly_change': round(closing - previous, 2),
+            'readings': len(self.values),
+            'weekly': weekly
+        }
+
+
+class Measurements:
+    """Per-member body-metric series, maintained as readings are logged"""
+
+    def __init__(self, half_life_days, weeks):
+        self.half_life_seconds = half_life_days * 86400
+        self.weeks = weeks
+        self._lock = threading.Lock()
+        self._series = {}  # user_id -> {metric: MetricSeries}
+    
+    def record(self, user_id, metric, value, moment):
+        with self._lock:
+            metrics = self._series.setdefault(user_id, {})
+            series = metrics.get(metric)
+            if series is None:
+                series = metrics[metric] = MetricSeries(self.half_life_seconds)
+            series.add(moment, value)
+    
+    def trends(self, user_id):
+        """{metric: trend} for every metric the member has logged"""
+        with self._lock:
+            return {metric: series.trend(self.weeks)
+                    for metric, series in self._series.get(user_id, {}).items()}
+    
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class TrainingHistory:
+    """One member's active days, streaks and personal records.
+    
+    Active days are merged into runs of consecutive days as workouts
+    arrive, so a backfilled day that bridges two streaks joins them with
+    one bisect. Personal records are running maxima per exercise and do
+    not depend on the order workouts are logged in.
+    """
+
+    def __init__(self):
+        self.days = {}  # date ordinal -> workouts that day
+        self.run_starts = []  # sorted first days of each streak
+        self.run_ends = {}  # first day -> last day
+        self.longest = (0, None)  # (length, first day)
+        self.weeks = {}  # ordinal of the week's Monday -> active days
+        self.records = {}  # exercise -> {'sessions': n, metric: workout entry}
+    
+    def add_day(self, day):
+        if day in self.days:
+            self.days[day] += 1
+            return
+        self.days[day] = 1
+        monday = day - date.fromordinal(day).weekday()
+        self.weeks[monday] = self.weeks.get(monday, 0) + 1
+        
+        i = bisect.bisect_left(self.run_starts, day)
+        joins_previous = i > 0 and self.run_ends[self.run_starts[i - 1]] == day - 1
+        joins_next = i < len(self.run_starts) and self.run_starts[i] == day + 1
+        if joins_previous and joins_next:
+            start = self.run_starts[i - 1]
+            self.run_ends[start] = self.run_ends.pop(self.run_starts.pop(i))
+        elif joins_previous:
+            start = self.run_starts[i - 1]
+            self.run_ends[start] = day
+        elif joins_next:
+            start = self.run_starts[i] = day
+            self.run_ends[day] = self.run_ends.pop(day + 1)
+        else:
+            start = day
+            self.run_starts.insert(i, day)
+            self.run_ends[day] = day
+        
+        length = self.run_ends[start] - start + 1
+        if length > self.longest[0]:
+            self.longest = (length, start)
+    
+    def add_record(self, workout_entry, metric):
+        entry = self.records.setdefault(workout_entry['exercise'], {'sessions': 0})
+        holder = entry.get(metric)
+        if holder is None or (workout_entry[metric], holder['timestamp']) > (holder[metric], workout_entry['timestamp']):
+            entry[metric] = workout_entry  # ties go to the earliest workout
+    
+    def run_at(self, day):
+        """(first, last) day of the streak containing a day, or None"""
+        i = bisect.bisect_right(self.run_starts, day) - 1
+        if i >= 0 and self.run_ends[self.run_starts[i]] >= day:
+            return self.run_starts[i], self.run_ends[self.run_starts[i]]
+        return None
+    
+    def streaks(self, today):
+        # A streak is still current until a whole day passes without a workout
+        current = self.run_at(today) or self.run_at(today - 1)
+        length, start = self.longest
+        last_active = self.run_ends[self.run_starts[-1]] if self.run_starts else None  # end of the latest run
+        return {
+            'current': current[1] - current[0] + 1 if current else 0,
+            'longest': length,
+            'longest_from': date.fromordinal(start).isoformat() if start is not None else None,
+            'longest_to': date.fromordinal(start + length - 1).isoformat() if start is not None else None,
+            'last_active': date.fromordinal(last_active).isoformat() if last_active is not None else None
+        }
+    
+    def consistency(self, today, weeks):
+        """Active days per week over the last `weeks` weeks, this week included"""
+        this_monday = today - date.fromordinal(today).weekday()
+        mondays = [this_monday - 7 * i for i in range(weeks - 1, -1, -1)]
+        active = [self.weeks.get(monday, 0) for monday in mondays]
+        
+        # This week still counts towards the run while it is in progress
+        week_streak = 0
+        for count in reversed(active[:-1] if not active[-1] else active):
+            if not count:
+                break
+            week_streak += 1
+        
+        return {
+            'weeks': weeks,
+            'active_weeks': sum(1 for count in active if count),
+            'ratio': round(sum(1 for count in active if count) / weeks, 2),
+            'average_days': round(sum(active) / weeks, 2),
+            'week_streak': week_streak,
+            'by_week': [{'week': Leaderboards.week_key(date.fromordinal(monday)), 'days': count}
+                        for monday, count in zip(mondays, active)]
+        }
+    
+    def personal_records(self):
+        return {
+            exercise: dict({'sessions': entry['sessions']}, **{
+                metric: {'value': entry[metric][metric], 'date': entry[metric]['timestamp'][:10]}
+                for metric in RECORD_METRICS if metric in entry})
+            for exercise, entry in sorted(self.records.items())
+        }
+
+
+class WorkoutRecords:
+    """Per-member streaks, weekly consistency and personal records.
+    
+    Updated as workouts are stored, so summaries and the dashboard read
+    them without scanning the workout history.
+    """
+
+    def __init__(self, consistency_weeks):
+        self.consistency_weeks = consistency_weeks
+        self._lock = threading.Lock()
+        self._history = {}  # user_id -> TrainingHistory
+    
+    def record(self, user_id, workout_entry):
+        day = datetime.fromisoformat(workout_entry['timestamp']).toordinal()
+        with self._lock:
+            history = self._history.get(user_id)
+            if history is None:
+                history = self._history[user_id] = TrainingHistory()
+            history.add_day(day)
+            for metric in RECORD_METRICS:
+                history.add_record(workout_entry, metric)
+            history.records[workout_entry['exercise']]['sessions'] += 1
+    
+    def adjust(self, user_id, workout_entry, metric):
+        """Re-rank a recorded workout after one of its metrics changed.
+        
+        Returns True when the workout holds the record, in which case the
+        runner-up may now be ahead and the caller rebuilds it with rebuild().
+        """
+        with self._lock:
+            history = self._history.get(user_id)
+            entry = history.records.get(workout_entry['exercise'], {}) if history else {}
+            holder = entry.get(metric)
+            if holder is None:
+                return False
+            if holder is workout_entry:
+                return True
+            history.add_record(workout_entry, metric)
+            return False
+    
+    def rebuild(self, user_id, exercise, metric, workouts):
+        """Recompute one exercise's record for a metric from its workouts"""
+        with self._lock:
+            entry = self._history[user_id].records[exercise]
+            entry.pop(metric, None)
+            for workout in workouts:
+                self._history[user_id].add_record(workout, metric)
+    
+    def summary(self, user_id, fields, today=None):
+        """The requested parts of 'streaks', 'consistency' and 'personal_records'"""
+        today = (today or datetime.now().date()).toordinal()
+        with self._lock:
+            history = self._history.get(user_id) or TrainingHistory()
+            parts = {
+                'streaks': lambda: history.streaks(today),
+                'consistency': lambda: history.consistency(today, self.consistency_weeks),
+                'personal_records': history.personal_records
+            }
+            return {name: build() for name, build in parts.items() if name in fields}
+    
+    def clear(self):
+        with self._lock:
+            self._history.clear()
+
+
+class GoalTracker:
+    """Per-member totals towards weekly and monthly goals.
+    
+    Each stored workout bumps the counters of the week and month it falls
+    in. Counters for a period are dropped once the calendar has moved past
+    it, so a new week or month starts from zero without recomputing
+    anything from the workout history.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # user_id -> {(period, key): {metric: total}}
+    
+    @staticmethod
+    def period_key(period, moment):
+        return Leaderboards.week_key(moment) if period == 'week' else moment.strftime('%Y-%m')
+    
+    @staticmethod
+    def period_bounds(period, moment):
+        """(first day, day after the last) of the week or month containing a moment"""
+        day = moment.date() if isinstance(moment, datetime) else moment
+        if period == 'week':
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7)
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    
+    def record(self, user_id, workout_entry, now=None):
+        now = now or datetime.now()
+        moment = datetime.fromisoformat(workout_entry['timestamp'])
+        amounts = {'calories': workout_entry['calories'], 'minutes': workout_entry['duration'], 'sessions': 1}
+        with self._lock:
+            totals = self._totals.setdefault(user_id, {})
+            self._roll_over(totals, now)
+            for period in GOAL_PERIODS:
+                key = self.period_key(period, moment)
+                if key < self.period_key(period, now):
+                    continue  # backfill into a period that has already closed
+                counters = totals.setdefault((period, key), dict.fromkeys(GOAL_METRICS, 0))
+                for metric, amount in amounts.items():
+                    counters[metric] += amount
+    
+    def adjust(self, user_id, workout_entry, metric, delta):
+        """Apply a change to an already-recorded workout (e.g. recomputed calories)"""
+        moment = datetime.fromisoformat(workout_entry['timestamp'])
+        with self._lock:
+            totals = self._totals.get(user_id, {})
+            for period in GOAL_PERIODS:
+                counters = totals.get((period, self.period_key(period, moment)))
+                if counters is not None:
+                    counters[metric] += delta
+    
+    def _roll_over(self, totals, now):
+        for period, key in list(totals):
+            if key < self.period_key(period, now):
+                del totals[(period, key)]
+    
+    def status(self, user_id, goals, now=None):
+        """Progress towards each of a member's {period: {metric: target}} goals this period.
+        
+        A goal is on track when its progress is at least the share of the
+        target that the elapsed part of the period calls for.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            totals = self._totals.get(user_id, {})
+            self._roll_over(totals, now)
+            current = {period: dict(totals.get((period, self.period_key(period, now)), {}))
+                       for period in GOAL_PERIODS}
+        
+        status = {}
+        for period in GOAL_PERIODS:
+            targets = goals.get(period)
+            if not targets:
+                continue
+            start, end = self.period_bounds(period, now)
+            elapsed = (now - datetime.combine(start, datetime.min.time())) / (end - start)
+            status[period] = {
+                'period': self.period_key(period, now),
+                'starts': start.isoformat(),
+                'ends': (end - timedelta(days=1)).isoformat(),
+                'goals': {}
+            }
+            for metric, target in targets.items():
+                progress = round(current[period].get(metric, 0), 2)
+                status[period]['goals'][metric] = {
+                    'target': target,
+                    'progress': progress,
+                    'remaining': round(max(target - progress, 0), 2),
+                    'percent': round(min(progress / target, 1) * 100, 1),
+                    'on_track': progress >= target * elapsed
+                }
+        return status
+    
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+
+
+class TrainingFeatures:
+    """Per-member training features for plan generation, one matrix row per member.
+    
+    Each of FEATURE_FIELDS (minutes per category, sessions, MET-minute load
+    and calories) is kept as an exponentially decaying sum at an acute and
+    a chronic time constant, updated in O(1) as a workout is stored. A
+    backdated workout is added already decayed, so the sums do not depend
+    on logging order. Rows share one numpy matrix, so the nightly batch
+    decays every member to the same moment in one array operation.
+    """
+
+    def __init__(self, acute_days, chronic_days):
+        width = len(FEATURE_FIELDS)
+        self._tau = np.repeat([acute_days * 86400.0, chronic_days * 86400.0], width)
+        self._lock = threading.Lock()
+        self._rows = {}  # user_id -> row
+        self._values = np.zeros((64, 2 * width))
+        self._as_of = np.zeros(64)  # epoch seconds each row's sums are decayed to
+        self._since = np.full(64, np.inf)  # each member's earliest workout
+    
+    def _row(self, user_id):
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._rows[user_id] = len(self._rows)
+            if row == len(self._as_of):
+                self._values = np.vstack([self._values, np.zeros_like(self._values)])
+                self._as_of = np.concatenate([self._as_of, np.zeros_like(self._as_of)])
+                self._since = np.concatenate([self._since, np.full_like(self._since, np.inf)])
+        return row
+    
+    def _add(self, user_id, moment, amounts):
+        when = moment.timestamp()
+        amounts = np.tile(amounts, 2)
+        with self._lock:
+            row = self._row(user_id)
+            self._since[row] = min(self._since[row], when)
+            as_of = self._as_of[row]
+            if when >= as_of:
+                self._values[row] *= np.exp((as_of - when) / self._tau)
+                self._values[row] += amounts
+                self._as_of[row] = when
+            else:
+                self._values[row] += amounts * np.exp((when - as_of) / self._tau)
+    
+    def record(self, user_id, workout_entry):
+        amounts = np.zeros(len(FEATURE_FIELDS))
+        minutes = f"minutes:{workout_entry['category']}"
+        if minutes in FEATURE_FIELDS:
+            amounts[FEATURE_FIELDS.index(minutes)] = workout_entry['duration']
+        amounts[FEATURE_FIELDS.index('sessions')] = 1
+        amounts[FEATURE_FIELDS.index('load')] = workout_entry['duration'] * exercise_met(
+            workout_entry['exercise'], workout_entry['category'])
+        amounts[FEATURE_FIELDS.index('calories')] = workout_entry['calories']
+        self._add(user_id, datetime.fromisoformat(workout_entry['timestamp']), amounts)
+    
+    def adjust(self, user_id, workout_entry, field, delta):
+        """Apply a change to an already-recorded workout (e.g. recomputed calories)"""
+        amounts = np.zeros(len(FEATURE_FIELDS))
+        amounts[FEATURE_FIELDS.index(field)] = delta
+        self._add(user_id, datetime.fromisoformat(workout_entry['timestamp']), amounts)
+    
+    def snapshot(self, user_ids, now=None):
+        """(members, 2 * len(FEATURE_FIELDS)) matrix, acute sums then chronic, decayed to `now`.
+        
+        Sums are scaled up for members whose history is shorter than a time
+        constant (at least a week is assumed), so a new member's chronic
+        average is not mistaken for a low one.
+        """
+        now = (now or datetime.now()).timestamp()
+        with self._lock:
+            rows = np.array([self._rows.get(user_id, -1) for user_id in user_ids], dtype=int)
+            known = rows >= 0
+            features = np.zeros((len(rows), self._values.shape[1]))
+            elapsed = np.maximum(now - self._as_of[rows[known]], 0)
+            history = np.maximum(now - self._since[rows[known]], self._tau[0])
+            features[known] = self._values[rows[known]] * np.exp(-elapsed[:, None] / self._tau) \
+                / (1 - np.exp(-history[:, None] / self._tau))
+        return features
+    
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._values[:] = 0
+            self._as_of[:] = 0
+            self._since[:] = np.inf
+
+
+def encode_deltas(values):
+    """Zigzag deltas of an int64 array after its first value, byte-shuffled and compressed.
+    
+    Shuffling groups the bytes of equal significance, so the long runs of
+    zero high bytes in small deltas compress away.
+    """
+    deltas = np.diff(values)
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+    return zlib.compress(zigzag.view(np.uint8).reshape(-1, 8).T.tobytes())
+
+
+def decode_deltas(first, payload, count):
+    """Inverse of encode_deltas(): the chunk's values as int64"""
+    shuffled = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(8, count - 1)
+    zigzag = np.ascontiguousarray(shuffled.T).view(np.uint64).ravel()
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return np.concatenate(([first], first + np.cumsum(deltas))).astype(np.int64)
+
+
+class SampleSeries:
+    """High-frequency sensor samples attached to one workout.
+    
+    Samples are (offset in ms from the workout start, value quantised by
+    the metric's scale) and are stored in chunks of a fixed number of
+    samples, each delta-encoded and compressed. Every chunk keeps its first
+    sample and min/max/sum beside the payload, so stats never decompress
+    and an append re-encodes only the last, partial chunk. An hour of
+    per-second heart rate takes a few kilobytes.
+    """
+
+    def __init__(self, scale, chunk_size):
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self.chunks = []  # [first offset, first value, count, low, high, total, times payload, values payload]
+        self.end = -1  # offset in ms of the last sample
+    
+    @property
+    def count(self):
+        return sum(chunk[2] for chunk in self.chunks)
+    
+    def append(self, offsets_seconds, values):
+        """Add samples that follow every stored one (offsets strictly increasing)"""
+        times = np.round(np.asarray(offsets_seconds, dtype=float) * 1000).astype(np.int64)
+        quantised = np.round(np.asarray(values, dtype=float) * self.scale).astype(np.int64)
+        if len(times) != len(quantised) or not len(times):
+            raise ValueError('offsets and values must be non-empty and the same length')
+        if times[0] <= self.end or np.any(np.diff(times) <= 0):
+            raise ValueError('sample offsets must be increasing and after existing samples')
+        self.end = int(times[-1])
+        
+        if self.chunks and self.chunks[-1][2] < self.chunk_size:
+            last_times, last_values = self._decode_chunk(self.chunks.pop())
+            times = np.concatenate((last_times, times))
+            quantised = np.concatenate((last_values, quantised))
+        for start in range(0, len(times), self.chunk_size):
+            self.chunks.append(self._encode_chunk(times[start:start + self.chunk_size],
+                                                  quantised[start:start + self.chunk_size]))
+    
+    @staticmethod
+    def _encode_chunk(times, values):
+        return [int(times[0]), int(values[0]), len(times), int(values.min()), int(values.max()),
+                int(values.sum()), encode_deltas(times), encode_deltas(values)]
+    
+    @staticmethod
+    def _decode_chunk(chunk):
+        first_time, first_value, count, _, _, _, times, values = chunk
+        if count == 1:
+            return np.array([first_time], dtype=np.int64), np.array([first_value], dtype=np.int64)
+        return decode_deltas(first_time, times, count), decode_deltas(first_value, values, count)
+    
+    def decode(self):
+        """(offsets in seconds, values) for every sample"""
+        parts = [self._decode_chunk(chunk) for chunk in self.chunks]
+        times = np.concatenate([part[0] for part in parts]) / 1000
+        values = np.concatenate([part[1] for part in parts]) / self.scale
+        return times, values
+    
+    def stats(self):
+        return {
+            'min': min(chunk[3] for chunk in self.chunks) / self.scale,
+            'max': max(chunk[4] for chunk in self.chunks) / self.scale,
+            'avg': round(sum(chunk[5] for chunk in self.chunks) / self.count / self.scale, 2)
+        }
+    
+    def nbytes(self):
+        return sum(len(chunk[6]) + len(chunk[7]) for chunk in self.chunks)
+
+
+def downsample_lttb(times, values, points):
+    """Largest-Triangle-Three-Buckets: `points` samples that keep the series' shape"""
+    count = len(times)
+    if points >= count or points < 3:
+        return times, values
+    
+    # First and last samples are kept; the rest is split into points - 2 buckets
+    edges = np.linspace(1, count - 1, points - 1).astype(int)
+    selected = [0]
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (or the last sample) is the third triangle vertex
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_start = end if bucket + 2 < len(edges) else count - 1
+        next_time = times[next_start:next_end].mean()
+        next_value = values[next_start:next_end].mean()
+        
+        previous = selected[-1]
+        areas = np.abs((times[previous] - next_time) * (values[start:end] - values[previous]) -
+                       (times[previous] - times[start:end]) * (next_value - values[previous]))
+        selected.append(start + int(np.argmax(areas)))
+    selected.append(count - 1)
+    return times[selected], values[selected]
+
+
+class GymStats:
+    """Gym-wide statistics maintained by register() and workout logging.
+
+    Counters are updated as members register and log workouts, so reads
+    never scan users_db; distinct active users per day are HyperLogLog
+    sketches. The counters are per process, like the stores they summarise,
+    and cover everything because the app runs as a single web process.
+    """
+
+    def __init__(self, days):
+        self.days = days
+        self._lock = threading.Lock()
+        self.clear()
+
+    def record_registration(self, user):
+        with self._lock:
+            self.members += 1
+            band = bmi_band(user['bmi'])
+            self.bmi_bands[band] = self.bmi_bands.get(band, 0) + 1
+            self.bmi_total += user['bmi']
+            week = Leaderboards.week_key(datetime.fromisoformat(user['registration_date']))
+            self.registrations[week] = self.registrations.get(week, 0) + 1
+
+    def record_bmi_change(self, old_bmi, new_bmi):
+        with self._lock:
+            for bmi, step in ((old_bmi, -1), (new_bmi, 1)):
+                band = bmi_band(bmi)
+                self.bmi_bands[band] = self.bmi_bands.get(band, 0) + step
+            self.bmi_total += new_bmi - old_bmi
+    
+    def record_workout(self, user_id, workout_entry):
+        day = workout_entry['timestamp'][:10]
+        with self._lock:
+            self.workouts += 1
+            category = workout_entry['category']
+            self.minutes_by_category[category] = self.minutes_by_category.get(category, 0) + workout_entry['duration']
+            
+            sketch = self.active_users.get(day)
+            if sketch is None:
+                sketch = self.active_users[day] = HyperLogLog()
+                for old_day in sorted(self.active_users)[:-self.days]:
+                    del self.active_users[old_day]
+            sketch.add(user_id)
+
+    def snapshot(self):
+        """The counters as one statistics document"""
+        with self._lock:
+            return {
+                'members': self.members,
+                'workouts': self.workouts,
+                'active_users_per_day': {day: self.active_users[day].count()
+                                         for day in sorted(self.active_users)[-self.days:]},
+                'minutes_by_category': dict(self.minutes_by_category),
+                'bmi': {
+                    'average': round(self.bmi_total / self.members, 2) if self.members else None,
+                    'bands': {name: self.bmi_bands.get(name, 0) for name, _ in BMI_BANDS}
+                },
+                'registrations_per_week': dict(sorted(self.registrations.items()))
+            }
+
+    def clear(self):
+        with self._lock:
+            self.members = 0
+            self.workouts = 0
+            self.active_users = {}  # 'YYYY-MM-DD' -> HyperLogLog of user ids
+            self.minutes_by_category = {}
+            self.bmi_bands = {}
+            self.bmi_total = 0.0
+            self.registrations = {}  # 'YYYY-Www' -> count
+
+
+gym_stats = GymStats(GYM_STATS_DAYS)
+exercise_catalog = ExerciseCatalog(EXERCISE_CATALOG)
+workout_search = WorkoutSearchIndex()
+measurements = Measurements(BODY_METRIC_HALF_LIFE_DAYS, BODY_METRIC_WEEKS)
+workout_records = WorkoutRecords(CONSISTENCY_WEEKS)
+goal_tracker = GoalTracker()
+training_features = TrainingFeatures(PLAN_ACUTE_DAYS, PLAN_CHRONIC_DAYS)
+trending_exercises = TrendingExercises(TRENDING_CAPACITY, TRENDING_HOURS, TRENDING_DAYS)
+
+
+_job_events = None  # (pipe, lock) a worker process reports job events on
+
+
+def _job_worker(tasks, events, events_lock):
+    """Main loop of a job worker process: run each job it is sent, one at a time"""
+    global _job_events
+    _job_events = (events, events_lock)
+    while True:
+        try:
+            job_id, kind, params = tasks.recv()
+        except EOFError:
+            return  # the web process has gone
+        try:
+            outcome = ('finished', _execute_job(job_id, kind, params))
+        except Exception as e:
+            outcome = ('error', str(e) or e.__class__.__name__)
+        try:
+            _report_job_event((job_id, *outcome))
+        except Exception as e:  # an unpicklable result
+            _report_job_event((job_id, 'error', str(e) or e.__class__.__name__))
+
+
+def _report_job_event(event):
+    events, lock = _job_events
+    with lock:
+        events.send(event)
+
+
+def _execute_job(job_id, kind, params):
+    """Entry point of a job inside a worker process"""
+    def progress(fraction, message=None):
+        _report_job_event((job_id, 'running', (round(min(max(fraction, 0.0), 1.0), 4), message)))
+    
+    progress(0.0)
+    return JOB_HANDLERS[kind](params, progress)
+
+
+class JobQueue:
+    """Runs registered job handlers in a local pool of worker processes.
+
+    Job records live in a store (jobs_db) so their status outlives the
+    request that created them. Each worker process takes one job at a time
+    over its own pipe and reports progress and the outcome on a shared one;
+    a listener thread applies those to the records and hands queued jobs to
+    idle workers. Workers are started on first use, so importing the app
+    never spawns processes.
+    
+    The pipes are only read and written through run_blocking(): under
+    gevent, multiprocessing's blocking calls would otherwise stall every
+    greenlet in the web worker.
+    """
+
+    class _Worker:
+        def __init__(self, context, events, events_lock):
+            reader, self.tasks = context.Pipe(duplex=False)
+            self.process = context.Process(target=_job_worker, args=(reader, events, events_lock),
+                                           name='job-worker', daemon=True)
+            self.process.start()
+            reader.close()  # the worker's end
+
+    def __init__(self, store, workers, retention_seconds):
+        self.store = store
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        # spawn: forking a process that already runs threads is unsafe
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._events = None
+        self._events_writer = None
+        self._events_lock = None
+        self._pending = deque()  # (job_id, kind, params) waiting for a worker
+        self._idle = []
+        self._running = {}  # worker -> job id
+        self._closed = False
+
+    def submit(self, user_id, kind, params):
+        """Record a new job and queue it for a worker"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        self._prune()
+        
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'user_id': user_id,
+            'kind': kind,
+            'status': 'queued',
+            'progress': 0.0,
+            'message': None,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None
+        }
+        self.store[job_id] = job
+        
+        self._ensure_started()
+        if kind in JOB_PREPARERS:
+            threading.Thread(target=self._prepare, args=(job_id, kind, params), daemon=True).start()
+        else:
+            self._enqueue(job_id, kind, params)
+        return job
+    
+    def _prepare(self, job_id, kind, params):
+        try:
+            params = JOB_PREPARERS[kind](self.store[job_id], params)
+        except Exception as e:
+            self._finish(job_id, error=e)
+            return
+        self._enqueue(job_id, kind, params)
+    
+    def _enqueue(self, job_id, kind, params):
+        with self._lock:
+            self._pending.append((job_id, kind, params))
+        self._dispatch()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._events is not None:
+                return
+            self._events, self._events_writer = self._context.Pipe(duplex=False)
+            self._events_lock = self._context.Lock()
+            self._idle = [run_blocking(self._start_worker) for _ in range(self.workers)]
+            atexit.register(self._shutdown)
+        threading.Thread(target=self._listen, name='job-events', daemon=True).start()
+
+    def _start_worker(self):
+        return self._Worker(self._context, self._events_writer, self._events_lock)
+    
+    def _dispatch(self):
+        """Send queued jobs to idle workers"""
+        while True:
+            with self._lock:
+                if not self._pending or not self._idle:
+                    return
+                task = self._pending.popleft()
+                worker = self._idle.pop()
+                self._running[worker] = task[0]
+            try:
+                run_blocking(worker.tasks.send, task)
+            except Exception as e:  # unpicklable params; nothing reached the worker
+                with self._lock:
+                    del self._running[worker]
+                    self._idle.append(worker)
+                self._finish(task[0], error=e)
+
+    def _listen(self):
+        while True:
+            with self._lock:
+                sentinels = {worker.process.sentinel: worker for worker in self._running}
+                sentinels.update((worker.process.sentinel, worker) for worker in self._idle)
+            worker, event = run_blocking(self._next_event, sentinels)
+            if worker is not None:
+                self._replace(worker)
+            else:
+                self._apply(event)
+            self._dispatch()
+    
+    def _next_event(self, sentinels):
+        # Blocking: the next job event, or the worker whose process has exited
+        ready = multiprocessing.connection.wait([self._events, *sentinels])
+        if self._events in ready:
+            return None, self._events.recv()
+        return sentinels[ready[0]], None
+    
+    def _replace(self, worker):
+        with self._lock:
+            job_id = self._running.pop(worker, None)
+            if worker in self._idle:
+                self._idle.remove(worker)
+        worker.tasks.close()
+        if self._closed:
+            return
+        replacement = run_blocking(self._start_worker)
+        with self._lock:
+            self._idle.append(replacement)
+        if job_id is not None:
+            self._finish(job_id, error=RuntimeError('Worker process exited unexpectedly'))
+    
+    def _apply(self, event):
+        job_id, status, payload = event
+        if status == 'running':
+            fraction, message = payload
+            with self._lock:
+                job = self.store.get(job_id)
+                if job is None or job['status'] in ('done', 'failed'):
+                    return
+                if job['started_at'] is None:
+                    job['started_at'] = datetime.now().isoformat()
+                job['status'] = status
+                job['progress'] = fraction
+                if message is not None:
+                    job['message'] = message
+            return
+        
+        with self._lock:
+            for worker, running in list(self._running.items()):
+                if running == job_id:
+                    del self._running[worker]
+                    self._idle.append(worker)
+        if status == 'error':
+            self._finish(job_id, error=RuntimeError(payload))
+        elif job_id in self.store and self.store[job_id]['kind'] in JOB_FINISHERS:
+            # Finishers can be slow; run them aside so other jobs keep reporting
+            threading.Thread(target=self._finish, args=(job_id, payload), daemon=True).start()
+        else:
+            self._finish(job_id, payload)
+    
+    def _finish(self, job_id, result=None, error=None):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        
+        if error is None and job['kind'] in JOB_FINISHERS:
+            try:
+                result = JOB_FINISHERS[job['kind']](job, result)
+            except Exception as e:
+                error = e
+        
+        with self._lock:
+            if job['status'] in ('done', 'failed'):
+                return
+            if error is not None:
+                job['status'] = 'failed'
+                job['error'] = str(error) or error.__class__.__name__
+            else:
+                job['result'] = result
+                job['status'] = 'done'
+                job['progress'] = 1.0
+            job['finished_at'] = datetime.now().isoformat()
+    
+    def _shutdown(self):
+        # Runs before multiprocessing stops the workers at exit, so none are replaced
+        self._closed = True
+
+    def _prune(self):
+        cutoff = (datetime.now() - timedelta(seconds=self.retention_seconds)).isoformat()
+        expired = [job_id for job_id, job in list(self.store.items())
+                   if job['finished_at'] is not None and job['finished_at'] < cutoff]
+        for job_id in expired:
+            self.store.pop(job_id, None)
+
+
+job_queue = JobQueue(jobs_db, JOB_WORKERS, JOB_RETENTION_SECONDS)
+
+
+# Stored responses for Idempotency-Key retries, keyed by (user_id, key); per process,
+# like the other stores, so a retry is only recognised by the worker that stored it
+idempotency_db = TTLCache(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL_SECONDS)
+
+# (user_id, week_start, format, data version, profile fields) -> job_id; a render
+# is useless once its job has been pruned, so entries live as long as jobs do
+report_cache = TTLCache(REPORT_CACHE_MAX_KEYS, JOB_RETENTION_SECONDS)
+
+
+@app.before_request
+def admit_request():
+    """Hold the request until a worker slot is free, or shed it with a fast 503"""
+    priority = ROUTE_PRIORITIES.get(request.endpoint, PRIORITY_NORMAL)
+    if priority is None:
+        return None
+    
+    rejection = admission.acquire(priority)
+    if rejection is not None:
+        response = jsonify({'success': False, 'message': 'Server is busy, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+        return response
+    request.environ['aceest.admitted'] = True
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    if request.environ.pop('aceest.admitted', False):
+        admission.release()
+
+
 @app.route('/')
 def index():
     """Home page - redirect to dashboard if logged in, else show landing page"""
@@ -55,12 +2164,27 @@ def login():
         data = request.get_json() if request.is_json else request.form
         username = data.get('username')
         password = data.get('password')
+        if not all(value is None or isinstance(value, str) for value in (username, password)):
+            return jsonify({'success': False, 'message': 'Username and password must be text'}), 400
+        
+        limited = rate_limit('login_ip', request.remote_addr)
+        if not limited and username:
+            limited = rate_limit('login_user', username.lower())
+        if limited:
+            return limited
         
         if not username or not password:
             return jsonify({'success': False, 'message': 'Username and password required'}), 400
         
-        # Simple authentication (replace with proper auth in production)
-        if username in users_db and users_db[username]['password'] == password:
+        user = users_db.get(username)
+        # Unknown users still pay for a hash so response times don't reveal them
+        stored = user['password'] if user else DUMMY_PASSWORD_HASH
+        valid, needs_rehash = verify_password(password, stored)
+        
+        if user and valid:
+            if needs_rehash:
+                # Upgrade plaintext or outdated hashes now that we know the password
+                user['password'] = hash_password(password)
             session['user_id'] = username
             session['user_name'] = users_db[username]['name']
             return jsonify({'success': True, 'message': 'Login successful', 'redirect': url_for('dashboard')})
@@ -74,6 +2198,10 @@ def login():
 def register():
     """User registration endpoint"""
     if request.method == 'POST':
+        limited = rate_limit('register_ip', request.remote_addr)
+        if limited:
+            return limited
+        
         data = request.get_json() if request.is_json else request.form
         
         username = data.get('username')
@@ -86,35 +2214,36 @@ def register():
         
         if not all([username, password, name, age, gender, height, weight]):
             return jsonify({'success': False, 'message': 'All fields are required'}), 400
+        if not all(isinstance(value, str) for value in (username, password, name, gender)):
+            return jsonify({'success': False, 'message': 'Username, password, name and gender must be text'}), 400
         
         if username in users_db:
             return jsonify({'success': False, 'message': 'Username already exists'}), 400
         
         # Calculate BMI and BMR
         try:
-            height_m = float(height) / 100
             weight_kg = float(weight)
             age_int = int(age)
-            bmi = weight_kg / (height_m ** 2)
-            
-            # Mifflin-St Jeor Equation for BMR
-            if gender.lower() == 'male':
-                bmr = 10 * weight_kg + 6.25 * float(height) - 5 * age_int + 5
-            else:
-                bmr = 10 * weight_kg + 6.25 * float(height) - 5 * age_int - 161
+            bmi, bmr = body_metrics(float(height), weight_kg, age_int, gender)
+            registration_date = datetime.now().isoformat()
             
             users_db[username] = {
-                'password': password,
+                'password': hash_password(password),
                 'name': name,
                 'age': age_int,
                 'gender': gender,
                 'height': float(height),
                 'weight': weight_kg,
-                'bmi': round(bmi, 2),
-                'bmr': round(bmr, 2),
-                'registration_date': datetime.now().isoformat()
+                'bmi': bmi,
+                'bmr': bmr,
+                'registration_date': registration_date,
+                'weight_history': [{'effective': registration_date, 'weight': weight_kg}],
+                'goals': {period: dict(targets) for period, targets in DEFAULT_GOALS.items()}
             }
             
+            gym_stats.record_registration(users_db[username])
+            measurements.record(username, 'weight', weight_kg, datetime.fromisoformat(registration_date))
+            
             workouts_db[username] = {
                 'Warm-up': [],
                 'Workout': [],
@@ -132,6 +2261,137 @@ def register():
     return render_template('register.html')
 
 
+@app.route('/api/profile', methods=['GET', 'PATCH'])
+@login_required
+def api_profile():
+    """Read or update the member's profile.
+    
+    A new weight joins the weight history (effective now, or from the
+    optional 'effective' date for a late entry) and the calories of the
+    workouts it covers are recomputed at that weight.
+    """
+    user_id = session.get('user_id')
+    user = users_db.get(user_id)
+    if user is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    if request.method == 'GET':
+        return jsonify({'success': True, 'profile': public_profile(user)})
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        age = int(data.get('age', user['age']))
+        height = float(data.get('height', user['height']))
+        weight = float(data['weight']) if 'weight' in data else None
+        effective = datetime.fromisoformat(data['effective']).isoformat() if data.get('effective') \
+            else datetime.now().isoformat()
+        numbers = (age, height) if weight is None else (age, height, weight)
+        if not all(math.isfinite(value) and value > 0 for value in numbers):
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid numeric values'}), 400
+    if effective > datetime.now().isoformat():
+        return jsonify({'success': False, 'message': 'Effective date cannot be in the future'}), 400
+    gender = data.get('gender')
+    if gender and not (isinstance(gender, str) and gender.lower() in GENDERS):
+        return jsonify({'success': False, 'message': f"Gender must be one of: {', '.join(GENDERS)}"}), 400
+    
+    if data.get('name'):
+        user['name'] = session['user_name'] = str(data['name'])
+    user['gender'] = gender.lower() if gender else user['gender']
+    user['age'] = age
+    user['height'] = height
+    
+    recomputed = record_weight(user_id, weight, effective) if weight is not None else 0
+    refresh_body_metrics(user)
+    
+    return jsonify({'success': True, 'profile': public_profile(user), 'recomputed_workouts': recomputed})
+
+
+@app.route('/api/goals', methods=['GET', 'PATCH'])
+@login_required
+def api_goals():
+    """Read the member's weekly and monthly goals with this period's progress, or change them.
+    
+    PATCH takes {period: {metric: target}} for any of GOAL_PERIODS and
+    GOAL_METRICS; a target of null or 0 removes that goal.
+    """
+    user_id = session.get('user_id')
+    user = users_db.get(user_id)
+    if user is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    goals = user.setdefault('goals', {})
+    if request.method == 'PATCH':
+        data = request.get_json(silent=True) or {}
+        try:
+            if not isinstance(data, dict) or not set(data) <= set(GOAL_PERIODS):
+                raise ValueError
+            changes = {}
+            for period, targets in data.items():
+                if not isinstance(targets, dict) or not set(targets) <= set(GOAL_METRICS):
+                    raise ValueError
+                changes[period] = {metric: float(target or 0) for metric, target in targets.items()}
+                if not all(math.isfinite(target) and target >= 0 for target in changes[period].values()):
+                    raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': f'Goals are {{period: {{metric: target}}}} for periods '
+                                                         f'{", ".join(GOAL_PERIODS)} and metrics {", ".join(GOAL_METRICS)}'}), 400
+        
+        for period, targets in changes.items():
+            period_goals = goals.setdefault(period, {})
+            for metric, target in targets.items():
+                if target:
+                    period_goals[metric] = int(target) if target.is_integer() else target
+                else:
+                    period_goals.pop(metric, None)
+        workout_plans_db.pop(user_id, None)  # next week's plan was built for the old goals
+    
+    return jsonify({'success': True, 'goals': goals, 'status': goal_tracker.status(user_id, goals)})
+
+
+@app.route('/api/metrics', methods=['GET', 'POST'])
+@login_required
+def api_metrics():
+    """Log body measurements, or read their smoothed trends.
+    
+    POST takes any of BODY_METRICS (and an optional ISO 'timestamp');
+    a weight also updates the profile as PATCH /api/profile would.
+    """
+    user_id = session.get('user_id')
+    user = users_db.get(user_id)
+    if user is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            readings = {metric: float(data[metric]) for metric in BODY_METRICS if data.get(metric) is not None}
+            moment = datetime.fromisoformat(data['timestamp']) if data.get('timestamp') else datetime.now()
+            if not readings or not all(math.isfinite(value) and value > 0 for value in readings.values()):
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': f'Provide positive finite values for any of: {", ".join(BODY_METRICS)}'}), 400
+        
+        for metric, value in readings.items():
+            if metric == 'weight':
+                record_weight(user_id, value, moment.isoformat())
+            else:
+                measurements.record(user_id, metric, value, moment)
+        if 'weight' in readings:
+            refresh_body_metrics(user)
+    
+    trends = measurements.trends(user_id)
+    result = {'success': True, 'metrics': trends}
+    if 'weight' in trends:
+        # BMI and BMR at the first and the smoothed current weight
+        start, now = (body_metrics(user['height'], trends['weight'][key], user['age'], user['gender'])
+                      for key in ('first', 'smoothed'))
+        result['bmi'] = {'start': start[0], 'smoothed': now[0], 'change': round(now[0] - start[0], 2)}
+        result['bmr'] = {'start': start[1], 'smoothed': now[1], 'change': round(now[1] - start[1], 2)}
+    return jsonify(result)
+
+
 @app.route('/logout')
 def logout():
     """User logout"""
@@ -167,95 +2427,451 @@ def dashboard():
                     'date': workout_date.strftime('%Y-%m-%d')
                 })
     
+    records = workout_records.summary(user_id, ('streaks', 'consistency', 'personal_records'))
+    goals = goal_tracker.status(user_id, user_info.get('goals', {}))
+    
     return render_template('dashboard.html', 
                          user=user_info,
                          total_workouts=total_workouts,
                          total_duration=total_duration,
-                         recent_workouts=recent_workouts)
+                         recent_workouts=recent_workouts,
+                         streaks=records['streaks'],
+                         consistency=records['consistency'],
+                         personal_records=records['personal_records'],
+                         goals=goals)
+
+
+@app.route('/workouts')
+@login_required
+def workouts():
+    """Workout logging page"""
+    return render_template('workouts.html')
+
+
+@app.route('/api/workouts', methods=['GET', 'POST'])
+@login_required
+def api_workouts():
+    """API endpoint for workout management"""
+    user_id = session.get('user_id')
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        
+        # Retries carrying the same Idempotency-Key replay the first response
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            return idempotent_response(user_id, idempotency_key, data, lambda: log_workout(user_id, data))
+        
+        body, status = log_workout(user_id, data)
+        return jsonify(body), status
+    
+    # GET request - return all workouts (or only the requested fields)
+    try:
+        fields = parse_fields(WORKOUT_FIELDS, default=('workouts',))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    workouts = workouts_db.get(user_id, {})
+    result = {'success': True}
+    if 'workouts' in fields:
+        result['workouts'] = workouts
+    totals = fields - {'workouts'}
+    if totals:
+        result.update(coalesced_summary(user_id, totals))
+    return jsonify(result)
+
+
+@app.route('/api/workouts/summary')
+@login_required
+def workout_summary():
+    """Get workout summary statistics"""
+    user_id = session.get('user_id')
+    
+    try:
+        fields = parse_fields(SUMMARY_FIELDS, default=SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({'success': True, 'summary': coalesced_summary(user_id, fields)})
+
+
+@app.route('/api/exercises/suggest')
+@login_required
+def suggest_exercises():
+    """Typeahead suggestions from the exercise catalog"""
+    try:
+        limit = min(int(request.args.get('limit', 8)), 50)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Limit must be a number'}), 400
+    
+    suggestions = exercise_catalog.suggest(request.args.get('q', ''), session.get('user_id'), limit)
+    return jsonify({'success': True, 'suggestions': suggestions})
+
+
+@app.route('/api/workouts/import', methods=['POST'])
+@login_required
+def import_workouts():
+    """Import workouts from wearable activity files.
+    
+    A multipart 'file' upload (GPX, TCX or CSV, optionally gzipped or in a
+    zip archive) is parsed by a background job. A JSON body of already
+    parsed {'activities': [...]}, as sent by activity_import.py, is
+    inserted directly.
+    """
+    user_id = session.get('user_id')
+    if request.is_json:
+        activities = (request.get_json(silent=True) or {}).get('activities')
+        if not isinstance(activities, list) or len(activities) > IMPORT_BATCH_SIZE:
+            return jsonify({'success': False,
+                            'message': f'Send a list of at most {IMPORT_BATCH_SIZE} activities'}), 400
+        return jsonify({'success': True, **import_activities(user_id, activities)})
+    
+    if (request.content_length or 0) > IMPORT_MAX_BYTES:
+        return jsonify({'success': False, 'message': 'Upload is too large'}), 413
+    upload = request.files.get('file')
+    filename = secure_filename(upload.filename) if upload else ''
+    extensions = ACTIVITY_EXTENSIONS + tuple(ext + '.gz' for ext in ACTIVITY_EXTENSIONS) + ('.zip',)
+    if not filename.lower().endswith(extensions):
+        return jsonify({'success': False, 'message': 'Upload a GPX, TCX, CSV or ZIP file'}), 400
+    
+    # Werkzeug has already spooled a large upload to disk; save() copies it in chunks
+    import_id = uuid.uuid4().hex
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    source = os.path.join(IMPORT_DIR, f'{import_id}-{filename}')
+    upload.save(source)
+    
+    job = job_queue.submit(user_id, 'activity_import', {
+        'source': source,
+        'spool': os.path.join(IMPORT_DIR, f'{import_id}.ndjson')
+    })
+    return job_accepted(job)
+
+
+@app.route('/api/workouts/search')
+@login_required
+def search_workouts():
+    """Search workout history by exercise name within an optional date window.
+    
+    Admins may search another member's history with ?user=.
+    """
+    user_id = request.args.get('user') or session.get('user_id')
+    if user_id != session.get('user_id') and session.get('user_id') not in app.config['ADMIN_USERS']:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    # The index compares ISO strings, so spell both bounds the way timestamps are stored
+    try:
+        since, until = (request.args.get(name) for name in ('since', 'until'))
+        if since:
+            since = parse_time(since).isoformat()
+        if until:
+            try:
+                until = date.fromisoformat(until).isoformat()  # a date covers that whole day
+            except ValueError:
+                until = parse_time(until).isoformat()
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since/until must be ISO dates and limit a number'}), 400
+    
+    workouts, total = workout_search.search(user_id, request.args.get('q', ''), since, until, limit)
+    return jsonify({'success': True, 'total': total, 'workouts': workouts})
+
+
+@app.route('/api/workouts/<workout_id>/samples/<metric>', methods=['GET', 'POST'])
+@login_required
+def workout_samples(workout_id, metric):
+    """Attach sensor samples to a workout, or read them downsampled.
+    
+    POST takes {'samples': [[offset_seconds, value], ...]} or
+    {'values': [...], 'interval': seconds, 'start': offset_seconds} and
+    appends after any samples already stored. GET returns at most
+    ?points= samples chosen by LTTB, plus whole-series stats.
+    """
+    user_id = session.get('user_id')
+    owner, _ = workout_ids.get(workout_id, (None, None))
+    if owner != user_id:
+        return jsonify({'success': False, 'message': 'Workout not found'}), 404
+    if metric not in SAMPLE_METRICS:
+        return jsonify({'success': False, 'message': f'Metric must be one of: {", ".join(SAMPLE_METRICS)}'}), 400
+    
+    key = (workout_id, metric)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            if 'samples' in data:
+                offsets, values = zip(*data['samples']) if data['samples'] else ((), ())
+            else:
+                values = data['values']
+                interval = float(data.get('interval', 1))
+                offsets = float(data.get('start', 0)) + interval * np.arange(len(values))
+            if len(values) > SAMPLE_MAX_UPLOAD:
+                raise ValueError(f'At most {SAMPLE_MAX_UPLOAD} samples per request')
+            series = workout_samples_db.get(key) or SampleSeries(SAMPLE_METRICS[metric], SAMPLE_CHUNK_SIZE)
+            series.append(offsets, values)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': f'Invalid samples: {e}'}), 400
+        workout_samples_db[key] = series
+        if metric == 'heart_rate':
+            update_workout_calories(user_id, [workout_ids[workout_id][1]])
+        return jsonify({'success': True, 'count': series.count, 'stored_bytes': series.nbytes(),
+                        'calories': workout_ids[workout_id][1]['calories']})
+    
+    series = workout_samples_db.get(key)
+    if series is None:
+        return jsonify({'success': False, 'message': 'No samples for this metric'}), 404
+    try:
+        points = min(int(request.args.get('points', 500)), SAMPLE_MAX_POINTS)
+        if points < 3:
+            raise ValueError  # LTTB keeps both ends plus one point per bucket
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Points must be a number of at least 3'}), 400
+    
+    times, values = downsample_lttb(*series.decode(), points)
+    return jsonify({
+        'success': True,
+        'metric': metric,
+        'count': series.count,
+        'stats': series.stats(),
+        'points': [[round(t, 3), v] for t, v in zip(times.tolist(), values.tolist())]
+    })
+
+
+@app.route('/api/workouts/stream')
+@login_required
+def workout_stream():
+    """Server-Sent Events stream of summary updates for the logged-in user.
+    
+    ?fields= limits the summaries to the fields a page renders, as for
+    /api/workouts/summary.
+    """
+    user_id = session.get('user_id')
+    try:
+        fields = parse_fields(SUMMARY_FIELDS, default=SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    channel = user_channel(user_id)
+    
+    # Subscribe before taking the snapshot so no workout falls in between
+    subscription = event_broker.subscribe(channel)
+    snapshot = coalesced_summary(user_id, fields)
+    
+    def generate():
+        try:
+            yield format_sse('summary', snapshot)
+            while True:
+                try:
+                    event_type, data = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                
+                if event_type == 'resync':
+                    yield format_sse('summary', coalesced_summary(user_id, fields))
+                else:
+                    yield format_sse(event_type, data)
+        finally:
+            event_broker.unsubscribe(channel, subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/workouts/export', methods=['POST'])
+@login_required
+def export_workouts():
+    """Start a background export of all the user's workouts"""
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or {}
+    export_format = data.get('format', request.args.get('format', 'csv'))
+    
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'Format must be csv or ndjson'}), 400
+    
+    job = job_queue.submit(user_id, 'workouts_export', {
+        'format': export_format,
+        'rows': list(iter_workout_rows(user_id))
+    })
+    return job_accepted(job)
+
+
+@app.route('/api/reports/weekly', methods=['POST'])
+@login_required
+def weekly_report():
+    """Start (or reuse) a background render of the user's weekly report"""
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or {}
+    report_format = data.get('format', request.args.get('format', 'pdf'))
+    week = data.get('week', request.args.get('week'))
+    
+    if report_format not in ('pdf', 'csv'):
+        return jsonify({'success': False, 'message': 'Format must be pdf or csv'}), 400
+    try:
+        day = datetime.fromisoformat(week).date() if week else datetime.now().date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Week must be a date (YYYY-MM-DD)'}), 400
+    week_start = day - timedelta(days=day.weekday())
+    
+    # Reports are cached per data version and profile: unchanged ones reuse the last render
+    user_info = users_db.get(user_id, {})
+    profile = {key: user_info.get(key) for key in ('name', 'age', 'gender', 'height', 'weight', 'bmi', 'bmr')}
+    cache_key = (user_id, week_start.isoformat(), report_format, data_versions.get(user_id, 0),
+                 tuple(profile.values()))
+    job = jobs_db.get(report_cache.get(cache_key))
+    if job is not None and job['status'] != 'failed':
+        return jsonify({'success': True, 'job': public_job(job)})
+    
+    week_end = week_start + timedelta(days=7)
+    rows = [row for row in iter_workout_rows(user_id)
+            if week_start.isoformat() <= row['timestamp'][:10] < week_end.isoformat()]
+    rows.sort(key=lambda row: row['timestamp'])
+    
+    job = job_queue.submit(user_id, 'weekly_report', {
+        'format': report_format,
+        'week_start': week_start.isoformat(),
+        'user': profile,
+        'rows': rows
+    })
+    report_cache.set(cache_key, job['id'])
+    return job_accepted(job)
+
+
+@app.route('/api/leaderboards')
+@login_required
+def leaderboard():
+    """Gym-wide weekly leaderboard for one metric and category"""
+    metric = request.args.get('metric', 'minutes')
+    category = request.args.get('category', 'all')
+    week = request.args.get('week') or Leaderboards.week_key(datetime.now())
+    
+    if metric not in LEADERBOARD_METRICS:
+        return jsonify({'success': False, 'message': f"Metric must be one of: {', '.join(LEADERBOARD_METRICS)}"}), 400
+    if category != 'all' and category not in MET_VALUES:
+        return jsonify({'success': False, 'message': 'Unknown category'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 10)), LEADERBOARD_SIZE)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Limit must be a number'}), 400
+    
+    entries = [{
+        'rank': rank,
+        'name': users_db.get(member, {}).get('name', member),
+        'score': round(score, 2),
+        'you': member == session.get('user_id')
+    } for rank, (member, score) in enumerate(leaderboards.top(week, metric, category, limit), 1)]
+    
+    return jsonify({'success': True, 'week': week, 'metric': metric, 'category': category, 'leaderboard': entries})
+
+
+@app.route('/api/admin/stats')
+@admin_required
+def admin_stats():
+    """Gym-wide statistics served from the pre-aggregated counters"""
+    return jsonify({'success': True, 'stats': gym_stats.snapshot()})
+
+
+@app.route('/api/admin/stats/verify')
+@admin_required
+def admin_stats_verify():
+    """Recompute the statistics with a full scan and compare them to the counters"""
+    counters = gym_stats.snapshot()
+    recomputed = recompute_gym_stats()
+    return jsonify({
+        'success': True,
+        'mismatches': compare_gym_stats(counters, recomputed),
+        'counters': counters,
+        'recomputed': recomputed
+    })
+
+
+@app.route('/api/admin/exercises/trending')
+@admin_required
+def admin_trending_exercises():
+    """Approximate most-logged exercises over the last hours or days"""
+    try:
+        if 'hours' in request.args:
+            granularity, periods = 'hour', int(request.args['hours'])
+        else:
+            granularity, periods = 'day', int(request.args.get('days', 1))
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'hours, days and limit must be numbers'}), 400
+    
+    if not 1 <= periods <= trending_exercises.retained[granularity]:
+        return jsonify({'success': False,
+                        'message': f'At most {trending_exercises.retained[granularity]} {granularity}s are kept'}), 400
+    
+    trending = trending_exercises.top(granularity, periods, limit=limit)
+    return jsonify({'success': True, 'window': {granularity + 's': periods}, **trending})
+
+
+@app.route('/api/admin/exports/workouts', methods=['POST'])
+@admin_required
+def admin_export_columnar():
+    """Start a columnar export of every member's workouts, partitioned by month"""
+    data = request.get_json(silent=True) or {}
+    export_format = data.get('format', request.args.get('format', 'arrow'))
+    if export_format not in ('arrow', 'parquet'):
+        return jsonify({'success': False, 'message': 'Format must be arrow or parquet'}), 400
+    
+    export_id = datetime.now().strftime('%Y%m%dT%H%M%S-') + uuid.uuid4().hex[:8]
+    job = job_queue.submit(session.get('user_id'), 'columnar_export', {
+        'format': export_format,
+        'source': os.path.join(COLUMNAR_EXPORT_DIR, f'.{export_id}'),
+        'destination': os.path.join(COLUMNAR_EXPORT_DIR, export_id),
+        'batch_rows': COLUMNAR_BATCH_ROWS
+    })
+    return job_accepted(job)
 
 
-@app.route('/workouts')
-@login_required
-def workouts():
-    """Workout logging page"""
-    return render_template('workouts.html')
+@app.route('/api/admin/plans', methods=['POST'])
+@admin_required
+def admin_generate_plans():
+    """Start the nightly batch that builds next week's plan for every member"""
+    batch_id = uuid.uuid4().hex
+    job = job_queue.submit(session.get('user_id'), 'workout_plans', {
+        'inputs': os.path.join(PLAN_DIR, f'{batch_id}-inputs.ndjson'),
+        'spool': os.path.join(PLAN_DIR, f'{batch_id}.ndjson')
+    })
+    return job_accepted(job)
 
 
-@app.route('/api/workouts', methods=['GET', 'POST'])
+@app.route('/api/jobs/<job_id>')
 @login_required
-def api_workouts():
-    """API endpoint for workout management"""
-    user_id = session.get('user_id')
-    
-    if request.method == 'POST':
-        data = request.get_json()
-        category = data.get('category', 'Workout')
-        exercise = data.get('exercise')
-        duration = data.get('duration')
-        
-        if not exercise or not duration:
-            return jsonify({'success': False, 'message': 'Exercise and duration required'}), 400
-        
-        try:
-            duration = int(duration)
-            if duration <= 0:
-                raise ValueError()
-        except ValueError:
-            return jsonify({'success': False, 'message': 'Duration must be a positive number'}), 400
-        
-        workout_entry = {
-            'exercise': exercise,
-            'duration': duration,
-            'category': category,
-            'timestamp': datetime.now().isoformat(),
-            'calories': calculate_calories(category, duration, users_db.get(user_id, {}).get('weight', 70))
-        }
-        
-        if user_id not in workouts_db:
-            workouts_db[user_id] = {cat: [] for cat in MET_VALUES.keys()}
-        
-        if category not in workouts_db[user_id]:
-            workouts_db[user_id][category] = []
-        
-        workouts_db[user_id][category].append(workout_entry)
-        
-        return jsonify({'success': True, 'message': 'Workout logged successfully', 'workout': workout_entry})
-    
-    # GET request - return all workouts
-    workouts = workouts_db.get(user_id, {})
-    return jsonify({'success': True, 'workouts': workouts})
+def job_status(job_id):
+    """Status and progress of a background job"""
+    job = jobs_db.get(job_id)
+    if job is None or job['user_id'] != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': public_job(job)})
 
 
-@app.route('/api/workouts/summary')
+@app.route('/api/jobs/<job_id>/result')
 @login_required
-def workout_summary():
-    """Get workout summary statistics"""
-    user_id = session.get('user_id')
-    workouts = workouts_db.get(user_id, {})
-    
-    summary = {
-        'total_workouts': 0,
-        'total_duration': 0,
-        'total_calories': 0,
-        'by_category': {},
-        'weekly_stats': get_weekly_stats(user_id)
-    }
+def job_result(job_id):
+    """Result of a finished background job"""
+    job = jobs_db.get(job_id)
+    if job is None or job['user_id'] != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
     
-    for category, workout_list in workouts.items():
-        category_duration = sum(w.get('duration', 0) for w in workout_list)
-        category_calories = sum(w.get('calories', 0) for w in workout_list)
-        
-        summary['total_workouts'] += len(workout_list)
-        summary['total_duration'] += category_duration
-        summary['total_calories'] += category_calories
-        
-        summary['by_category'][category] = {
-            'count': len(workout_list),
-            'duration': category_duration,
-            'calories': category_calories
-        }
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'message': f"Job is {job['status']}", 'job': public_job(job)}), 409
     
-    return jsonify({'success': True, 'summary': summary})
+    result = job['result']
+    if isinstance(result, dict) and 'content' in result:
+        return Response(result['content'], mimetype=result['mimetype'], headers={
+            'Content-Disposition': f"attachment; filename={result['filename']}"
+        })
+    return jsonify({'success': True, 'result': result})
+
+
+@app.route('/metrics')
+def metrics():
+    """Internal counters for monitoring"""
+    return jsonify({
+        'single_flight': single_flight.metrics(),
+        'admission': admission.metrics()
+    })
 
 
 @app.route('/progress')
@@ -265,6 +2881,21 @@ def progress():
     return render_template('progress.html')
 
 
+@app.route('/plan')
+@login_required
+def plan():
+    """Next week's workout plan page"""
+    return render_template('plan.html', plan=member_plan(session.get('user_id')))
+
+
+@app.route('/api/plan')
+@login_required
+def api_plan():
+    """Next week's workout plan; ?refresh=1 rebuilds it from the latest training"""
+    plan = member_plan(session.get('user_id'), refresh=request.args.get('refresh') in ('1', 'true'))
+    return jsonify({'success': True, 'plan': plan})
+
+
 @app.route('/diet')
 @login_required
 def diet():
@@ -272,14 +2903,31 @@ def diet():
     user_id = session.get('user_id')
     user_info = users_db.get(user_id, {})
     
-    # Calculate daily calorie needs
-    bmr = user_info.get('bmr', 1800)
-    activity_multiplier = 1.55  # Moderate activity
-    daily_calories = round(bmr * activity_multiplier)
+    daily_calories = daily_calorie_target(user_info)
     
     diet_plan = generate_diet_plan(daily_calories, user_info.get('bmi', 22))
     
-    return render_template('diet.html', user=user_info, daily_calories=daily_calories, diet_plan=diet_plan)
+    # Unknown filters in a hand-edited URL are dropped rather than failing the page
+    diet_filters = [name for value in request.args.getlist('diet') for name in value.split(',') if name in DIETS]
+    meal_plan = plan_meals(daily_calories, diet_filters)
+    
+    return render_template('diet.html', user=user_info, daily_calories=daily_calories, diet_plan=diet_plan,
+                           meal_plan=meal_plan, diets=DIETS, diet_filters=diet_filters)
+
+
+@app.route('/api/meal-plan')
+@login_required
+def api_meal_plan():
+    """A day's meal plan for the member's calorie target (or ?calories=), with ?diet= filters"""
+    user_info = users_db.get(session.get('user_id'), {})
+    try:
+        daily_calories = float(request.args.get('calories') or daily_calorie_target(user_info))
+        diet_filters = [name.strip() for value in request.args.getlist('diet') for name in value.split(',')
+                        if name.strip()]
+        plan = plan_meals(daily_calories, diet_filters)
+    except (ValueError, OverflowError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'plan': plan})
 
 
 @app.route('/health')
@@ -294,13 +2942,879 @@ def health_check():
 
 # Helper functions
 
-def calculate_calories(category, duration_minutes, weight_kg):
-    """Calculate calories burned based on MET values"""
-    met = MET_VALUES.get(category, 4.0)
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(str(password).encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024)
+
+
+def _hash_password_sync(password, n, r):
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, 1)
+    return '$'.join(['scrypt', str(n), str(r), '1',
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def _verify_password_sync(password, stored, n, r):
+    if not stored.startswith('scrypt$'):
+        # Legacy plaintext account: compare, then rehash on success
+        return hmac.compare_digest(str(password).encode(), stored.encode()), True
+    
+    _, stored_n, stored_r, stored_p, salt, digest = stored.split('$')
+    stored_n, stored_r, stored_p = int(stored_n), int(stored_r), int(stored_p)
+    candidate = _scrypt(password, base64.b64decode(salt), stored_n, stored_r, stored_p)
+    valid = hmac.compare_digest(candidate, base64.b64decode(digest))
+    return valid, (stored_n, stored_r) != (n, r)
+
+
+def _run_password_task(fn, *args):
+    if password_pool is None:
+        return fn(*args)
+    return password_pool.submit(fn, *args).result()
+
+
+def hash_password(password):
+    """Hash a password with scrypt at the configured cost"""
+    return _run_password_task(_hash_password_sync, password,
+                              app.config['PASSWORD_SCRYPT_N'], app.config['PASSWORD_SCRYPT_R'])
+
+
+def verify_password(password, stored):
+    """Check a password against its stored form; returns (valid, needs_rehash)"""
+    return _run_password_task(_verify_password_sync, password, stored,
+                              app.config['PASSWORD_SCRYPT_N'], app.config['PASSWORD_SCRYPT_R'])
+
+
+DUMMY_PASSWORD_HASH = _hash_password_sync('unused-dummy-password',
+                                          app.config['PASSWORD_SCRYPT_N'], app.config['PASSWORD_SCRYPT_R'])
+
+
+def rate_limit(limit, client):
+    """Charge one attempt to a client's bucket; returns a 429 response once it is empty"""
+    capacity, rate = RATE_LIMITS[limit]
+    retry_after = rate_limit_db.consume(f'{limit}:{client}', capacity, rate)
+    if not retry_after:
+        return None
+    
+    response = jsonify({'success': False, 'message': 'Too many attempts, please try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def log_workout(user_id, data):
+    """Validate and store a workout, returning (response body, status code)"""
+    category = data.get('category', 'Workout')
+    exercise = data.get('exercise')
+    duration = data.get('duration')
+    
+    if not exercise or not duration:
+        return {'success': False, 'message': 'Exercise and duration required'}, 400
+    
+    try:
+        duration = int(duration)
+        if duration <= 0:
+            raise ValueError()
+    except ValueError:
+        return {'success': False, 'message': 'Duration must be a positive number'}, 400
+    
+    # One spelling per exercise keeps analytics and storage from fragmenting
+    exercise = exercise_catalog.record_use(user_id, exercise, category)
+    
+    workout_entry = {
+        'exercise': exercise,
+        'duration': duration,
+        'category': category,
+        'timestamp': datetime.now().isoformat(),
+        'calories': calculate_calories(category, duration, users_db.get(user_id, {}).get('weight', 70), exercise)
+    }
+    
+    store_workout(user_id, workout_entry)
+    
+    return {'success': True, 'message': 'Workout logged successfully', 'workout': workout_entry}, 200
+
+
+def idempotent_response(user_id, idempotency_key, payload, handler):
+    """Run handler once per (user, Idempotency-Key) and replay its response to retries"""
+    if len(idempotency_key) > 255:
+        return jsonify({'success': False, 'message': 'Idempotency-Key must be at most 255 characters'}), 400
+    
+    fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    cache_key = (user_id, idempotency_key)
+    
+    def execute():
+        stored = idempotency_db.get(cache_key)
+        if stored is not None:
+            return stored, True
+        
+        body, status = handler()
+        stored = {'fingerprint': fingerprint, 'body': body, 'status': status}
+        # Server errors are not stored so the client can retry them
+        if status < 500:
+            idempotency_db.set(cache_key, stored)
+        return stored, False
+    
+    # Concurrent retries of the same key wait for the first one instead of writing twice
+    stored, replayed = single_flight.do(('idempotency',) + cache_key, execute)
+    
+    if stored['fingerprint'] != fingerprint:
+        return jsonify({'success': False, 'message': 'Idempotency-Key was already used with a different request'}), 422
+    
+    response = jsonify(stored['body'])
+    response.status_code = stored['status']
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def normalize_exercise_name(name):
+    """Case- and whitespace-insensitive form of a free-text exercise name"""
+    return ' '.join(str(name).lower().split())
+
+
+def bmi_band(bmi):
+    """Name of the BMI band a value falls in"""
+    return next(name for name, upper in BMI_BANDS if bmi < upper)
+
+
+def merge_counts(counters, keys=()):
+    """Sum several {key: count} dicts, always including the given keys"""
+    merged = {key: 0 for key in keys}
+    for counter in counters:
+        for key, value in counter.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def recompute_gym_stats():
+    """Full-scan recomputation of GymStats.snapshot(), used to verify the counters"""
+    bands = {name: 0 for name, _ in BMI_BANDS}
+    registrations = {}
+    for user in users_db.values():
+        bands[bmi_band(user['bmi'])] += 1
+        week = Leaderboards.week_key(datetime.fromisoformat(user['registration_date']))
+        registrations[week] = registrations.get(week, 0) + 1
+    
+    workouts = 0
+    active = {}
+    minutes = {}
+    for user_id, categories in workouts_db.items():
+        for category, workout_list in categories.items():
+            for workout in workout_list:
+                workouts += 1
+                minutes[category] = minutes.get(category, 0) + workout.get('duration', 0)
+                active.setdefault(workout['timestamp'][:10], set()).add(user_id)
+    
+    members = len(users_db)
+    return {
+        'members': members,
+        'workouts': workouts,
+        'active_users_per_day': {day: len(active[day]) for day in sorted(active)[-GYM_STATS_DAYS:]},
+        'minutes_by_category': minutes,
+        'bmi': {
+            'average': round(sum(user['bmi'] for user in users_db.values()) / members, 2) if members else None,
+            'bands': bands
+        },
+        'registrations_per_week': dict(sorted(registrations.items()))
+    }
+
+
+def compare_gym_stats(counters, recomputed):
+    """Paths where the counters disagree with a full scan (active users within sketch error)"""
+    mismatches = []
+    for key in ('members', 'workouts', 'minutes_by_category', 'bmi', 'registrations_per_week'):
+        if counters[key] != recomputed[key]:
+            mismatches.append(key)
+    
+    for day in set(counters['active_users_per_day']) | set(recomputed['active_users_per_day']):
+        estimate = counters['active_users_per_day'].get(day, 0)
+        exact = recomputed['active_users_per_day'].get(day, 0)
+        if abs(estimate - exact) > max(1, 0.05 * exact):
+            mismatches.append(f'active_users_per_day.{day}')
+    return sorted(mismatches)
+
+
+def public_job(job):
+    """Job record as returned by the API (without owner or result payload)"""
+    view = {key: value for key, value in job.items() if key not in ('user_id', 'result')}
+    view['status_url'] = url_for('job_status', job_id=job['id'])
+    view['result_url'] = url_for('job_result', job_id=job['id'])
+    return view
+
+
+def job_accepted(job):
+    """202 response pointing the client at a queued job"""
+    response = jsonify({'success': True, 'job': public_job(job)})
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job['id'])
+    return response
+
+
+def iter_workout_rows(user_id):
+    """Yield a user's workouts as flat rows with EXPORT_COLUMNS keys.
+    
+    The workouts are snapshotted first: the columnar export preparer yields
+    to request handlers mid-iteration, and they may log new workouts.
+    """
+    snapshot = [(category, list(workout_list)) for category, workout_list in workouts_db.get(user_id, {}).items()]
+    for category, workout_list in snapshot:
+        for workout in workout_list:
+            yield {
+                'user_id': user_id,
+                'timestamp': workout.get('timestamp'),
+                'category': category,
+                'exercise': workout.get('exercise'),
+                'duration': workout.get('duration', 0),
+                'calories': workout.get('calories', 0)
+            }
+
+
+@job_handler('workouts_export')
+def export_workouts_job(params, progress):
+    """Render exported workout rows as CSV or NDJSON"""
+    rows = params['rows']
+    out = io.StringIO()
+    writer = None
+    if params['format'] == 'csv':
+        writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+    
+    for count, row in enumerate(rows, 1):
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row) + '\n')
+        if count % 1000 == 0:
+            progress(count / len(rows), f'{count} of {len(rows)} rows')
+    
+    if writer is not None:
+        return {'content': out.getvalue(), 'mimetype': 'text/csv', 'filename': 'workouts.csv'}
+    return {'content': out.getvalue(), 'mimetype': 'application/x-ndjson', 'filename': 'workouts.ndjson'}
+
+
+def columnar_schema(pa):
+    """Arrow schema of columnar workout exports"""
+    return pa.schema([
+        ('user_id', pa.string()),
+        ('timestamp', pa.timestamp('s')),
+        ('category', pa.dictionary(pa.int16(), pa.string())),
+        ('exercise', pa.dictionary(pa.int32(), pa.string())),
+        ('duration', pa.int32()),
+        ('calories', pa.float64())
+    ])
+
+
+@job_preparer('columnar_export')
+def prepare_columnar_export(job, params):
+    """Spool every member's workout rows into one NDJSON file per month, a batch at a time"""
+    source = params['source']
+    os.makedirs(source, exist_ok=True)
+    months = {}
+    total = 0
+    
+    def spill():
+        for month, lines in months.items():
+            with open(os.path.join(source, f'{month}.ndjson'), 'a', encoding='utf-8') as spool:
+                spool.writelines(lines)
+        months.clear()
+        time.sleep(0)  # let waiting requests run between batches
+    
+    for user_id in list(workouts_db):
+        for row in iter_workout_rows(user_id):
+            months.setdefault(row['timestamp'][:7], []).append(json.dumps(row) + '\n')
+            total += 1
+            if total % params['batch_rows'] == 0:
+                spill()
+    spill()
+    return {**params, 'rows': total}
+
+
+@job_handler('columnar_export')
+def columnar_export_job(params, progress):
+    """Write spooled workout rows as month-partitioned Arrow IPC or Parquet files.
+
+    Output is hive-style (month=YYYY-MM/part-0.arrow) with dictionary-encoded
+    category and exercise columns. Arrow IPC files can be memory-mapped and
+    read without copying (pyarrow.ipc.open_file(pyarrow.memory_map(path))).
+    Months are written one at a time from their spool files: the IPC file
+    format needs one dictionary per file, so a first pass over the month
+    collects its distinct values and the second streams its rows out in
+    record batches. Memory stays at one batch of rows.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    source, destination, total = params['source'], params['destination'], params['rows']
+    schema = columnar_schema(pa)
+    files = []
+    written = 0
+
+    def write_batch(writer, rows, categories, exercises, month_dictionaries):
+        category_values, exercise_values = month_dictionaries
+        writer.write_batch(pa.record_batch([
+            pa.array([r['user_id'] for r in rows], pa.string()),
+            pa.array([datetime.fromisoformat(r['timestamp']).replace(microsecond=0) for r in rows],
+                     pa.timestamp('s')),
+            pa.DictionaryArray.from_arrays(pa.array([categories[r['category']] for r in rows], pa.int16()),
+                                           category_values),
+            pa.DictionaryArray.from_arrays(pa.array([exercises[r['exercise']] for r in rows], pa.int32()),
+                                           exercise_values),
+            pa.array([r['duration'] for r in rows], pa.int32()),
+            pa.array([r['calories'] for r in rows], pa.float64())
+        ], schema=schema))
+    
+    try:
+        for name in sorted(os.listdir(source)):
+            month = name[:-len('.ndjson')]
+            spool_path = os.path.join(source, name)
+            categories, exercises = {}, {}
+            month_rows = 0
+            with open(spool_path, encoding='utf-8') as spool:
+                for line in spool:
+                    row = json.loads(line)
+                    categories.setdefault(row['category'], len(categories))
+                    exercises.setdefault(row['exercise'], len(exercises))
+                    month_rows += 1
+            # The same dictionary arrays are reused for every batch of the month's file
+            month_dictionaries = (pa.array(list(categories), pa.string()), pa.array(list(exercises), pa.string()))
+        
+            directory = os.path.join(destination, f'month={month}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-0.{params['format']}")
+            writer = pq.ParquetWriter(path, schema) if params['format'] == 'parquet' else pa.ipc.new_file(path, schema)
+            rows = []
+            with writer, open(spool_path, encoding='utf-8') as spool:
+                for line in spool:
+                    rows.append(json.loads(line))
+                    if len(rows) == params['batch_rows']:
+                        write_batch(writer, rows, categories, exercises, month_dictionaries)
+                        written += len(rows)
+                        rows = []
+                        progress(written / total, f'{written} of {total} rows')
+                if rows:
+                    write_batch(writer, rows, categories, exercises, month_dictionaries)
+                    written += len(rows)
+            files.append({'month': month, 'path': path, 'rows': month_rows})
+            os.remove(spool_path)
+    finally:
+        shutil.rmtree(source, ignore_errors=True)
+        
+    return {'format': params['format'], 'path': destination, 'rows': total, 'files': files}
+
+
+@job_handler('activity_import')
+def activity_import_job(params, progress):
+    """Parse an uploaded activity file or archive into a spool of activities"""
+    errors = []
+    parsed = 0
+    try:
+        with open(params['spool'], 'w', encoding='utf-8') as spool:
+            for activity in iter_activities(params['source'], errors):
+                spool.write(json.dumps(activity) + '\n')
+                parsed += 1
+                if parsed % 100 == 0:
+                    progress(0.0, f'{parsed} activities parsed')
+    finally:
+        os.remove(params['source'])
+    progress(0.9, f'{parsed} activities parsed; importing')
+    return {'spool': params['spool'], 'errors': errors}
+
+
+@job_finisher('activity_import')
+def finish_activity_import(job, result):
+    """Insert the spooled activities in batches, in the web process"""
+    totals = {'imported': 0, 'skipped': 0, 'rejected': 0}
+    try:
+        with open(result['spool'], encoding='utf-8') as spool:
+            batch = []
+            for line in spool:
+                batch.append(json.loads(line))
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    totals = merge_counts([totals, import_activities(job['user_id'], batch)])
+                    batch = []
+            if batch:
+                totals = merge_counts([totals, import_activities(job['user_id'], batch)])
+    finally:
+        os.remove(result['spool'])
+    return {**totals, 'errors': result['errors']}
+
+
+@job_preparer('workout_plans')
+def prepare_workout_plans(job, params):
+    """Spool plan_inputs() snapshots of every member, PLAN_CHUNK_MEMBERS at a time"""
+    now = datetime.now()
+    user_ids = list(users_db)
+    os.makedirs(PLAN_DIR, exist_ok=True)
+    with open(params['inputs'], 'w', encoding='utf-8') as inputs:
+        for start in range(0, len(user_ids), PLAN_CHUNK_MEMBERS):
+            chunk = plan_inputs(user_ids[start:start + PLAN_CHUNK_MEMBERS], now)
+            inputs.write(json.dumps({**chunk, 'features': chunk['features'].tolist(),
+                                     'goals': chunk['goals'].tolist()}) + '\n')
+            time.sleep(0)  # let waiting requests run between chunks
+    return {**params, 'members': len(user_ids), 'week_start': next_week_start(now.date()).isoformat()}
+
+
+@job_handler('workout_plans')
+def workout_plans_job(params, progress):
+    """Build every member's plan from the spooled plan_inputs() chunks into a spool file"""
+    members, built = params['members'], 0
+    try:
+        with open(params['inputs'], encoding='utf-8') as inputs, \
+                open(params['spool'], 'w', encoding='utf-8') as spool:
+            for line in inputs:
+                chunk = json.loads(line)
+                chunk['features'] = np.array(chunk['features'], dtype=float).reshape(-1, 2 * len(FEATURE_FIELDS))
+                chunk['goals'] = np.array(chunk['goals'], dtype=float).reshape(-1, len(GOAL_METRICS))
+                for user_id, plan in build_plans(chunk):
+                    spool.write(json.dumps([user_id, plan]) + '\n')
+                built += len(chunk['user_ids'])
+                progress(0.9 * built / members, f'{built} of {members} plans built')
+    finally:
+        os.remove(params['inputs'])
+    return {'spool': params['spool'], 'members': members, 'week_start': params['week_start']}
+
+
+@job_finisher('workout_plans')
+def finish_workout_plans(job, result):
+    """Publish the spooled plans, in the web process.
+    
+    workout_plans_db is read by every request because the app runs as a
+    single web process, like the other stores.
+    """
+    try:
+        with open(result['spool'], encoding='utf-8') as spool:
+            for published, line in enumerate(spool, 1):
+                user_id, plan = json.loads(line)
+                workout_plans_db[user_id] = plan
+                if published % PLAN_CHUNK_MEMBERS == 0:
+                    time.sleep(0)  # let waiting requests run between chunks
+    finally:
+        os.remove(result['spool'])
+    return {'members': result['members'], 'week_start': result['week_start']}
+
+
+@job_handler('weekly_report')
+def weekly_report_job(params, progress):
+    """Render a weekly report as a multi-page PDF or as CSV"""
+    rows = params['rows']
+    filename = f"weekly_report_{params['week_start']}.{params['format']}"
+    
+    if params['format'] == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['date', 'category', 'exercise', 'duration', 'calories'])
+        for row in rows:
+            writer.writerow([row['timestamp'][:10], row['category'], row['exercise'],
+                             row['duration'], row['calories']])
+        return {'content': out.getvalue(), 'mimetype': 'text/csv', 'filename': filename}
+    
+    # reportlab is only needed by the worker processes that render PDFs
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    from xml.sax.saxutils import escape
+    
+    # Paragraph text is markup: member-entered values must not open tags or entities
+    user = {key: escape(str(value)) for key, value in params['user'].items() if value is not None}
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+    ])
+    story = [
+        Paragraph(f"Weekly Fitness Report - {user.get('name') or ''}", styles['Title']),
+        Paragraph(f"Week of {params['week_start']}", styles['Heading2']),
+        Paragraph(f"Age: {user.get('age')} | Gender: {user.get('gender')} | Height: {user.get('height')} cm | "
+                  f"Weight: {user.get('weight')} kg | BMI: {user.get('bmi')} | BMR: {user.get('bmr')} kcal/day",
+                  styles['Normal']),
+        Spacer(1, 12)
+    ]
+    
+    by_category = {}
+    for row in rows:
+        totals = by_category.setdefault(row['category'], [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += row['duration']
+        totals[2] += row['calories']
+    summary = [['Category', 'Sessions', 'Duration (min)', 'Calories (kcal)']]
+    summary += [[category, str(count), str(duration), f'{calories:.1f}']
+                for category, (count, duration, calories) in sorted(by_category.items())]
+    story += [Table(summary, style=table_style), Spacer(1, 12)]
+    progress(0.2, 'Summary built')
+    
+    # repeatRows keeps the header on every page the platypus layout splits the table over
+    table_data = [['Date', 'Category', 'Exercise', 'Duration (min)', 'Calories (kcal)']]
+    table_data += [[row['timestamp'][:10], row['category'], row['exercise'],
+                    str(row['duration']), f"{row['calories']:.1f}"] for row in rows]
+    story.append(Table(table_data, colWidths=[70, 80, 170, 80, 80], repeatRows=1,
+                       style=table_style))
+    
+    def number_page(canvas, doc):
+        canvas.setFont('Helvetica', 8)
+        canvas.drawRightString(A4[0] - 40, 20, f'Page {doc.page}')
+    
+    out = io.BytesIO()
+    SimpleDocTemplate(out, pagesize=A4, title=filename).build(
+        story, onFirstPage=number_page, onLaterPages=number_page)
+    return {'content': out.getvalue(), 'mimetype': 'application/pdf', 'filename': filename}
+
+
+def user_channel(user_id):
+    """Pub/sub channel name for a user's live updates"""
+    return f'user:{user_id}'
+
+
+def format_sse(event_type, data):
+    """Encode one Server-Sent Events message"""
+    return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+def store_workout(user_id, workout_entry, notify=True):
+    """Persist a workout entry and update everything derived from it.
+    
+    Bulk writers pass notify=False and send live clients one resync at the end.
+    """
+    category = workout_entry['category']
+    
+    if user_id not in workouts_db:
+        workouts_db[user_id] = {cat: [] for cat in MET_VALUES.keys()}
+    
+    if category not in workouts_db[user_id]:
+        workouts_db[user_id][category] = []
+    
+    workout_entry.setdefault('id', uuid.uuid4().hex)
+    workouts_db[user_id][category].append(workout_entry)
+    workout_ids[workout_entry['id']] = (user_id, workout_entry)
+    bump_data_version(user_id)
+    
+    # Small delta the client applies on top of its last summary
+    if notify:
+        event_broker.publish(user_channel(user_id), 'workout', {
+            'category': category,
+            'date': workout_entry['timestamp'][:10],
+            'duration': workout_entry['duration'],
+            'calories': workout_entry['calories']
+        })
+    
+    workout_search.add(user_id, workout_entry)
+    leaderboards.record(user_id, workout_entry)
+    workout_records.record(user_id, workout_entry)
+    goal_tracker.record(user_id, workout_entry)
+    training_features.record(user_id, workout_entry)
+    gym_stats.record_workout(user_id, workout_entry)
+    trending_exercises.record(workout_entry['exercise'], datetime.fromisoformat(workout_entry['timestamp']))
+
+
+def body_metrics(height_cm, weight_kg, age, gender):
+    """(BMI, BMR) rounded to two places"""
+    bmi = weight_kg / ((height_cm / 100) ** 2)
+    
+    # Mifflin-St Jeor Equation for BMR
+    if gender.lower() == 'male':
+        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
+    else:
+        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
+    return round(bmi, 2), round(bmr, 2)
+
+
+def record_weight(user_id, weight, effective):
+    """Add a weight to the member's history, series and affected workouts.
+    
+    Returns how many workouts had their calories recomputed. The caller
+    refreshes BMI/BMR once it has applied any other profile changes.
+    """
+    user = users_db[user_id]
+    history = user['weight_history']
+    history[:] = [entry for entry in history if entry['effective'] != effective]
+    bisect.insort(history, {'effective': effective, 'weight': weight}, key=lambda entry: entry['effective'])
+    # The current weight is the latest one already in effect
+    in_effect = bisect.bisect_right(history, datetime.now().isoformat(), key=lambda entry: entry['effective'])
+    user['weight'] = history[max(in_effect, 1) - 1]['weight']
+    measurements.record(user_id, 'weight', weight, datetime.fromisoformat(effective))
+    return recompute_workout_calories(user_id, since=effective)
+
+
+def refresh_body_metrics(user):
+    """Recompute a member's BMI and BMR after a profile change"""
+    old_bmi = user['bmi']
+    user['bmi'], user['bmr'] = body_metrics(user['height'], user['weight'], user['age'], user['gender'])
+    gym_stats.record_bmi_change(old_bmi, user['bmi'])
+
+
+def public_profile(user):
+    """A users_db record without its password hash"""
+    return {key: value for key, value in user.items() if key != 'password'}
+
+
+def import_activities(user_id, activities):
+    """Bulk-insert parsed activity files (see activity_import.py) as workouts.
+    
+    Exercise and category come from each activity's sport, and calories
+    from calculate_calories_batch() at the weight valid when it started
+    and the track's average heart rate. Heart-rate tracks are kept as samples. Activities already imported
+    (same start and exercise) are skipped; malformed ones are rejected.
+    """
+    existing = {(workout['timestamp'], workout['exercise'])
+                for workout_list in workouts_db.get(user_id, {}).values() for workout in workout_list}
+    accepted = []
+    skipped = rejected = 0
+    for activity in activities:
+        try:
+            start = parse_time(activity['start']).isoformat()
+            seconds = float(activity['duration_seconds'])
+            heart_rate = activity.get('heart_rate') or []
+            average_heart_rate = sum(float(bpm) for _, bpm in heart_rate) / len(heart_rate) if heart_rate else None
+            if seconds <= 0:
+                raise ValueError
+        except (AttributeError, KeyError, TypeError, ValueError):
+            rejected += 1
+            continue
+        
+        exercise, category = sport_exercise(activity.get('sport') or 'workout')
+        known = exercise_catalog.lookup(exercise)
+        exercise = known['name'] if known else exercise
+        if (start, exercise) in existing:
+            skipped += 1
+            continue
+        existing.add((start, exercise))
+        accepted.append((start, exercise, category, max(1, round(seconds / 60)), heart_rate, average_heart_rate))
+    
+    if accepted:
+        user = users_db.get(user_id, {})
+        starts, exercises, categories, durations, _, heart_rates = zip(*accepted)
+        calories = calculate_calories_batch(categories, durations, weights_at(user_id, starts), exercises=exercises,
+                                            heart_rates=heart_rates, ages=user.get('age'),
+                                            genders=user.get('gender')).tolist()
+        for (start, exercise, category, duration, heart_rate, _), workout_calories in zip(accepted, calories):
+            workout_entry = {
+                'exercise': exercise_catalog.record_use(user_id, exercise, category),
+                'duration': duration,
+                'category': category,
+                'timestamp': start,
+                'calories': workout_calories
+            }
+            store_workout(user_id, workout_entry, notify=False)
+            
+            if heart_rate:
+                series = SampleSeries(SAMPLE_METRICS['heart_rate'], SAMPLE_CHUNK_SIZE)
+                try:
+                    series.append(*zip(*heart_rate))
+                except (TypeError, ValueError):
+                    continue  # keep the workout, drop a malformed track
+                workout_samples_db[(workout_entry['id'], 'heart_rate')] = series
+        event_broker.publish(user_channel(user_id), 'resync', {})
+    
+    return {'imported': len(accepted), 'skipped': skipped, 'rejected': rejected}
+
+
+def exercise_met(exercise, category):
+    """MET for a workout: the catalog's value for a known exercise, else its category's"""
+    entry = exercise_catalog.lookup(exercise) if exercise else None
+    if entry is not None and not entry['custom']:
+        return entry['met']
+    return MET_VALUES.get(category, 4.0)
+
+
+def calculate_calories(category, duration_minutes, weight_kg, exercise=None, heart_rate=None, age=None, gender=None):
+    """Calculate calories burned based on MET values.
+    
+    Known exercises use their own MET from the catalog. Given an average
+    heart rate and the member's age, the Keytel heart-rate equation is used
+    instead whenever it gives a positive estimate.
+    """
+    met = exercise_met(exercise, category)
     calories = met * weight_kg * (duration_minutes / 60)
+    if heart_rate and age:
+        intercept, per_bpm, per_kg, per_year = KEYTEL_COEFFICIENTS[
+            'male' if str(gender).lower() == 'male' else 'female']
+        per_minute = (intercept + per_bpm * heart_rate + per_kg * weight_kg + per_year * age) / KJ_PER_KCAL
+        if per_minute > 0:
+            calories = per_minute * duration_minutes
     return round(calories, 2)
 
 
+def calorie_kernel(mets, durations, weights, heart_rates, ages, males):
+    """Numeric core of calculate_calories_batch(); heart rates and ages are NaN where unknown"""
+    met_calories = mets * weights * (durations / 60)
+    male, female = KEYTEL_COEFFICIENTS['male'], KEYTEL_COEFFICIENTS['female']
+    coefficients = [np.where(males, m, f) for m, f in zip(male, female)]
+    per_minute = (coefficients[0] + coefficients[1] * heart_rates + coefficients[2] * weights +
+                  coefficients[3] * ages) / KJ_PER_KCAL
+    # NaN (no heart rate) compares false, so those rows keep the MET estimate
+    return np.round(np.where(per_minute > 0, per_minute * durations, met_calories), 2)
+
+
+def calculate_calories_batch(categories, durations, weights, exercises=None, heart_rates=None,
+                             ages=None, genders=None):
+    """calculate_calories() over arrays of workouts at once.
+    
+    ages and genders may be single values for one member's workouts;
+    heart_rates may hold None for workouts without samples.
+    """
+    count = len(categories)
+    if exercises is None:
+        exercises = [None] * count
+    # Resolve METs and genders once per distinct value rather than per row
+    mets = {pair: exercise_met(*pair) for pair in set(zip(exercises, categories))}
+    
+    if genders is None or isinstance(genders, str):
+        males = str(genders).lower() == 'male'
+    else:
+        is_male = {gender: str(gender).lower() == 'male' for gender in set(genders)}
+        males = np.fromiter(map(is_male.__getitem__, genders), dtype=bool, count=count)
+    return calorie_kernel(
+        np.fromiter(map(mets.__getitem__, zip(exercises, categories)), dtype=float, count=count),
+        np.asarray(durations, dtype=float),
+        np.asarray(weights, dtype=float),
+        np.full(count, np.nan) if heart_rates is None else np.array(heart_rates, dtype=float),
+        np.asarray(np.nan if ages is None else ages, dtype=float),
+        males
+    )
+
+
+def weights_at(user_id, timestamps):
+    """The member's weight valid at each ISO timestamp, as an array.
+    
+    Times before the first recorded weight use that weight; members
+    without a profile get the default 70 kg.
+    """
+    user = users_db.get(user_id)
+    if user is None:
+        return np.full(len(timestamps), 70.0)
+    history = user['weight_history']
+    change_times = np.array([entry['effective'] for entry in history], dtype='datetime64[us]')
+    weights = np.array([entry['weight'] for entry in history])
+    times = np.array(timestamps, dtype='datetime64[us]')
+    return weights[np.maximum(np.searchsorted(change_times, times, side='right') - 1, 0)]
+
+
+def workout_heart_rate(workout):
+    """Average heart rate from a workout's samples, or None"""
+    series = workout_samples_db.get((workout.get('id'), 'heart_rate'))
+    return series.stats()['avg'] if series is not None else None
+
+
+def update_workout_calories(user_id, workouts):
+    """Recompute stored calories for some of a member's workouts.
+    
+    One vectorised pass at the weight valid at each workout's time, using
+    heart-rate samples where they exist. Derived stores are adjusted by
+    the difference. Returns how many changed.
+    """
+    if not workouts:
+        return 0
+    
+    user = users_db.get(user_id, {})
+    calories = calculate_calories_batch([workout['category'] for workout in workouts],
+                                        [workout['duration'] for workout in workouts],
+                                        weights_at(user_id, [workout['timestamp'] for workout in workouts]),
+                                        exercises=[workout['exercise'] for workout in workouts],
+                                        heart_rates=[workout_heart_rate(workout) for workout in workouts],
+                                        ages=user.get('age'), genders=user.get('gender'))
+    
+    changed = 0
+    stale_records = set()
+    for workout, value in zip(workouts, calories.tolist()):
+        delta = value - workout['calories']
+        if abs(delta) >= 0.005:  # ignore rounding noise between the scalar and batch forms
+            workout['calories'] = value
+            leaderboards.adjust(user_id, workout, 'calories', delta)
+            goal_tracker.adjust(user_id, workout, 'calories', delta)
+            training_features.adjust(user_id, workout, 'calories', delta)
+            if workout_records.adjust(user_id, workout, 'calories'):
+                stale_records.add(workout['exercise'])
+            changed += 1
+    
+    for exercise in stale_records:
+        workout_records.rebuild(user_id, exercise, 'calories', [
+            workout for workout_list in workouts_db.get(user_id, {}).values() for workout in workout_list
+            if workout['exercise'] == exercise])
+    
+    if changed:
+        bump_data_version(user_id)
+        event_broker.publish(user_channel(user_id), 'resync', {})
+    return changed
+
+
+def recompute_workout_calories(user_id, since=None):
+    """Re-derive stored calories from the weight valid at each workout's time.
+    
+    Covers the workouts from `since` on; those logged before the first
+    recorded weight use that weight.
+    """
+    return update_workout_calories(user_id, [
+        workout for workout_list in workouts_db.get(user_id, {}).values() for workout in workout_list
+        if since is None or workout['timestamp'] >= since])
+
+
+def parse_fields(allowed, default):
+    """Resolve the ?fields= query parameter into a set of requested field names"""
+    raw = request.args.get('fields')
+    if not raw:
+        return set(default)
+    
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = fields.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def bump_data_version(user_id):
+    """Mark a user's data as changed"""
+    data_versions[user_id] = data_versions.get(user_id, 0) + 1
+
+
+def coalesced_summary(user_id, fields):
+    """build_workout_summary() shared between identical concurrent requests"""
+    # The date is part of the query because weekly stats are relative to today
+    key = ('summary', user_id, data_versions.get(user_id, 0),
+           tuple(sorted(fields)), datetime.now().date().isoformat())
+    return single_flight.do(key, lambda: build_workout_summary(user_id, fields))
+
+
+def build_workout_summary(user_id, fields=SUMMARY_FIELDS):
+    """Aggregate workout statistics, computing only the requested fields"""
+    workouts = workouts_db.get(user_id, {})
+    summary = {}
+    
+    # Totals and per-category numbers come out of the same pass over the entries
+    totals = {'total_workouts', 'total_duration', 'total_calories'}.intersection(fields)
+    if totals or 'by_category' in fields:
+        total_workouts = total_duration = total_calories = 0
+        by_category = {}
+        for category, workout_list in workouts.items():
+            category_duration = sum(w.get('duration', 0) for w in workout_list)
+            category_calories = sum(w.get('calories', 0) for w in workout_list)
+            
+            total_workouts += len(workout_list)
+            total_duration += category_duration
+            total_calories += category_calories
+            
+            by_category[category] = {
+                'count': len(workout_list),
+                'duration': category_duration,
+                'calories': category_calories
+            }
+        
+        computed = {
+            'total_workouts': total_workouts,
+            'total_duration': total_duration,
+            'total_calories': total_calories,
+            'by_category': by_category
+        }
+        for name in SUMMARY_FIELDS:
+            if name in fields and name in computed:
+                summary[name] = computed[name]
+    
+    if 'weekly_stats' in fields:
+        summary['weekly_stats'] = get_weekly_stats(user_id)
+    
+    # Maintained as workouts are stored, so these cost no scan
+    summary.update(workout_records.summary(user_id, fields))
+    
+    return summary
+
+
 def get_weekly_stats(user_id):
     """Get workout statistics for the last 7 days"""
     workouts = workouts_db.get(user_id, {})
@@ -317,6 +3831,12 @@ def get_weekly_stats(user_id):
     return weekly_data
 
 
+def daily_calorie_target(user):
+    """Daily calorie needs from a member's BMR at a moderate activity level"""
+    activity_multiplier = 1.55  # Moderate activity
+    return round(user.get('bmr', 1800) * activity_multiplier)
+
+
 def generate_diet_plan(daily_calories, bmi):
     """Generate basic diet recommendations"""
     protein_ratio = 0.30
@@ -343,6 +3863,177 @@ def generate_diet_plan(daily_calories, bmi):
     return plan
 
 
+def next_week_start(today=None):
+    """The Monday after today"""
+    today = today or datetime.now().date()
+    return today + timedelta(days=7 - today.weekday())
+
+
+def weekly_goals(user):
+    """A member's goals as per-week amounts in GOAL_METRICS order (nan where unset)"""
+    goals = user.get('goals', {})
+    weekly = []
+    for metric in GOAL_METRICS:
+        targets = [goals.get('week', {}).get(metric), (goals.get('month', {}).get(metric) or 0) * 7 / 30.44]
+        weekly.append(max(target for target in targets if target) if any(targets) else np.nan)
+    return weekly
+
+
+def plan_targets(features, goals):
+    """Weekly volume, sessions and their split over PLAN_CATEGORIES, for many members at once.
+    
+    `features` are TrainingFeatures.snapshot() rows and `goals` weekly_goals()
+    rows. Volume grows from the chronic weekly minutes by PLAN_PROGRESSION,
+    or towards a goal no faster than PLAN_MAX_LOAD_RATIO allows, and holds
+    after a load spike. Categories get sessions in proportion to how far
+    recent training falls short of PLAN_BALANCE.
+    """
+    width = len(FEATURE_FIELDS)
+    column = FEATURE_FIELDS.index
+    acute = features[:, :width] * 7 / PLAN_ACUTE_DAYS  # decayed sums as weekly rates
+    chronic = features[:, width:] * 7 / PLAN_CHRONIC_DAYS
+    minutes_columns = [column(f'minutes:{category}') for category in MET_VALUES]
+    count = len(features)
+    
+    chronic_minutes = chronic[:, minutes_columns].sum(axis=1)
+    load_ratio = np.divide(acute[:, column('load')], chronic[:, column('load')],
+                           out=np.zeros(count), where=chronic[:, column('load')] > 0)
+    kcal_per_minute = np.divide(chronic[:, column('calories')], chronic_minutes,
+                                out=np.full(count, PLAN_KCAL_PER_MINUTE), where=chronic_minutes > 0)
+    goal_calories, goal_minutes, goal_sessions = (goals[:, GOAL_METRICS.index(metric)] for metric in GOAL_METRICS)
+    goal_minutes = np.fmax(goal_minutes, goal_calories / kcal_per_minute)
+    
+    ceiling = np.maximum(chronic_minutes * PLAN_MAX_LOAD_RATIO, PLAN_MINUTES[0])
+    minutes = np.where(np.isnan(goal_minutes), chronic_minutes * PLAN_PROGRESSION, np.minimum(goal_minutes, ceiling))
+    spike = load_ratio > PLAN_MAX_LOAD_RATIO
+    minutes = np.clip(np.where(spike, np.minimum(minutes, chronic_minutes), minutes), *PLAN_MINUTES)
+    
+    # Without a sessions goal, the habit is kept within sensible session lengths
+    habit = np.clip(np.rint(chronic[:, column('sessions')]), *PLAN_SESSIONS)
+    habit = np.clip(habit, np.ceil(minutes / PLAN_SESSION_MINUTES[1]), np.floor(minutes / PLAN_SESSION_MINUTES[0]))
+    sessions = np.clip(np.where(np.isnan(goal_sessions), habit, np.rint(goal_sessions)), 1, 7).astype(int)
+    
+    # Under-trained categories get more than their share, over-trained ones
+    # less, but never under half of it
+    balance = np.array(PLAN_BALANCE)
+    recent = acute[:, [column(f'minutes:{category}') for category in PLAN_CATEGORIES]]
+    total = recent.sum(axis=1, keepdims=True)
+    share = np.divide(recent, total, out=np.tile(balance, (count, 1)), where=total > 0)
+    weights = np.maximum(balance + PLAN_REBALANCE * (balance - share), balance / 2)
+    weights /= weights.sum(axis=1, keepdims=True)
+    
+    # Largest remainder: whole sessions per category in proportion to the weights
+    quota = weights * sessions[:, None]
+    category_sessions = np.floor(quota).astype(int)
+    short = sessions - category_sessions.sum(axis=1)
+    ranks = np.argsort(np.argsort(category_sessions - quota, axis=1, kind='stable'), axis=1)
+    category_sessions += ranks < short[:, None]
+    
+    weights = weights * (category_sessions > 0)
+    category_minutes = minutes[:, None] * weights / weights.sum(axis=1, keepdims=True)
+    session_minutes = np.divide(category_minutes, category_sessions, out=np.zeros_like(category_minutes),
+                                where=category_sessions > 0)
+    session_minutes = np.where(category_sessions > 0,
+                               np.clip(np.rint(session_minutes / 5) * 5, *PLAN_SESSION_MINUTES), 0)
+    
+    return {
+        'sessions': category_sessions,
+        'session_minutes': session_minutes.astype(int),
+        'acute_minutes': acute[:, minutes_columns].sum(axis=1),
+        'chronic_minutes': chronic_minutes,
+        'load_ratio': load_ratio,
+        'goal_minutes': goal_minutes,
+        'focus': np.select([spike, chronic_minutes < PLAN_MINUTES[0]], ['hold', 'start'], 'build')
+    }
+
+
+def schedule_week(week_start, category_sessions, session_minutes, favourites, defaults):
+    """Days of a plan: sessions spread over the week, no category twice running where avoidable"""
+    remaining = dict(zip(PLAN_CATEGORIES, category_sessions.tolist()))
+    total = sum(remaining.values())
+    order = []
+    for _ in range(total):
+        left = [category for category in PLAN_CATEGORIES if remaining[category]]
+        candidates = [category for category in left if not order or category != order[-1]] or left
+        category = max(candidates, key=lambda category: remaining[category])
+        remaining[category] -= 1
+        order.append(category)
+    session_days = {i * 7 // total: category for i, category in enumerate(order)}
+    
+    # The member's own exercises first, then the catalog's, rotating within a category
+    used = dict.fromkeys(PLAN_CATEGORIES, 0)
+    days = []
+    for offset in range(7):
+        day = week_start + timedelta(days=offset)
+        entry = {'date': day.isoformat(), 'day': day.strftime('%A')}
+        category = session_days.get(offset)
+        if category is None:
+            entry['rest'] = True
+        else:
+            own = favourites.get(category, [])
+            choices = own + [name for name in defaults[category] if name not in own]
+            entry.update({
+                'rest': False,
+                'category': category,
+                'exercise': choices[used[category] % len(choices)],
+                'minutes': int(session_minutes[PLAN_CATEGORIES.index(category)])
+            })
+            used[category] += 1
+        days.append(entry)
+    return days
+
+
+def plan_inputs(user_ids, now=None):
+    """Snapshot of everything build_plans() needs, so plans can be built in a worker"""
+    now = now or datetime.now()
+    return {
+        'user_ids': list(user_ids),
+        'features': training_features.snapshot(user_ids, now),
+        'goals': np.array([weekly_goals(users_db.get(user_id, {})) for user_id in user_ids],
+                          dtype=float).reshape(-1, len(GOAL_METRICS)),
+        'favourites': {user_id: exercise_catalog.favourites(user_id) for user_id in user_ids},
+        'week_start': next_week_start(now.date()).isoformat(),
+        'generated_at': now.isoformat()
+    }
+
+
+def build_plans(params):
+    """(user_id, plan) for next week for every member in a plan_inputs() snapshot"""
+    targets = plan_targets(params['features'], params['goals'])
+    week_start = date.fromisoformat(params['week_start'])
+    defaults = {category: [name for name, entry_category, _ in EXERCISE_CATALOG if entry_category == category]
+                for category in PLAN_CATEGORIES}
+    
+    for i, user_id in enumerate(params['user_ids']):
+        days = schedule_week(week_start, targets['sessions'][i], targets['session_minutes'][i],
+                             params['favourites'].get(user_id, {}), defaults)
+        goal_minutes = targets['goal_minutes'][i]
+        yield user_id, {
+            'week': Leaderboards.week_key(week_start),
+            'starts': week_start.isoformat(),
+            'generated_at': params['generated_at'],
+            'focus': str(targets['focus'][i]),
+            'sessions': sum(1 for day in days if not day['rest']),
+            'minutes': sum(day.get('minutes', 0) for day in days),
+            'goal_minutes': None if np.isnan(goal_minutes) else round(float(goal_minutes)),
+            'load': {
+                'acute_weekly_minutes': round(float(targets['acute_minutes'][i]), 1),
+                'chronic_weekly_minutes': round(float(targets['chronic_minutes'][i]), 1),
+                'ratio': round(float(targets['load_ratio'][i]), 2)
+            },
+            'days': days
+        }
+
+
+def member_plan(user_id, refresh=False):
+    """A member's plan for next week: the nightly batch's, or built now"""
+    plan = workout_plans_db.get(user_id)
+    if refresh or plan is None or plan['starts'] != next_week_start().isoformat():
+        (_, plan), = build_plans(plan_inputs([user_id]))
+        workout_plans_db[user_id] = plan
+    return plan
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
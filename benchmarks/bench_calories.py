@@ -0,0 +1,79 @@
+"""
+Calorie engine benchmark for ACEest Fitness Application
+
+Evaluates random workouts (a mix of catalog exercises, categories and
+heart-rate-tracked sessions) through the scalar calculate_calories(), the
+calculate_calories_batch() API and its numeric calorie_kernel(), and
+reports evaluations per second for each.
+
+Usage:
+    python benchmarks/bench_calories.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module  # noqa: E402
+
+
+def make_rows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    catalog = app_module.EXERCISE_CATALOG
+    picks = rng.integers(0, len(catalog), count)
+    heart_rates = np.where(rng.random(count) < 0.3, rng.integers(90, 180, count), np.nan)
+    return {
+        'categories': [catalog[i][1] for i in picks],
+        'exercises': [catalog[i][0] for i in picks],
+        'durations': rng.integers(5, 120, count),
+        'weights': rng.uniform(45, 130, count),
+        'heart_rates': heart_rates,
+        'ages': rng.integers(16, 80, count),
+        'genders': np.where(rng.random(count) < 0.5, 'male', 'female').tolist()
+    }
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def run(count):
+    rows = make_rows(count)
+    results = {}
+    
+    sample = min(count, 100000)  # the scalar path is too slow to run on everything
+    heart_rates = [None if np.isnan(hr) else hr for hr in rows['heart_rates'][:sample]]
+    results['scalar'] = sample / timed(lambda: [
+        app_module.calculate_calories(*row) for row in zip(
+            rows['categories'], rows['durations'].tolist(), rows['weights'].tolist(), rows['exercises'],
+            heart_rates, rows['ages'].tolist(), rows['genders'])])
+    
+    results['batch'] = count / timed(lambda: app_module.calculate_calories_batch(
+        rows['categories'], rows['durations'], rows['weights'], exercises=rows['exercises'],
+        heart_rates=rows['heart_rates'], ages=rows['ages'], genders=rows['genders']))
+    
+    mets = np.array([app_module.exercise_met(e, c) for e, c in zip(rows['exercises'], rows['categories'])])
+    arrays = (mets, rows['durations'].astype(float), rows['weights'], rows['heart_rates'],
+              rows['ages'].astype(float), np.array(rows['genders']) == 'male')
+    results['kernel'] = count / timed(lambda: app_module.calorie_kernel(*arrays))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    
+    for name, rate in run(args.rows).items():
+        print(f'{name:>7}: {rate / 1e6:8.2f} M evaluations/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Login throughput benchmark for ACEest Fitness Application
+
+Registers one account, then logs in from several threads at once through
+the Flask test client and reports successful logins per second.
+
+Usage:
+    python benchmarks/bench_login.py --threads 8 --seconds 5
+    PASSWORD_HASH_WORKERS=0 python benchmarks/bench_login.py   # hash inline
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module  # noqa: E402
+
+
+def run(threads, seconds):
+    app = app_module.app
+    app.config['TESTING'] = True
+    
+    # Throttling would turn this into a 429 benchmark
+    for limit in getattr(app_module, 'RATE_LIMITS', {}):
+        app_module.RATE_LIMITS[limit] = (10 ** 9, 10 ** 9)
+    
+    credentials = {'username': 'bench', 'password': 'bench-password'}
+    app.test_client().post('/register', content_type='application/json', data=json.dumps({
+        **credentials, 'name': 'Bench', 'age': 30, 'gender': 'male', 'height': 180, 'weight': 80
+    }))
+    
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+    
+    def worker(index):
+        client = app.test_client()
+        body = json.dumps(credentials)
+        while time.perf_counter() < deadline:
+            response = client.post('/login', data=body, content_type='application/json')
+            if response.status_code == 200:
+                counts[index] += 1
+    
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    
+    throughput = run(args.threads, args.seconds)
+    print(f'{args.threads} threads: {throughput:.1f} logins/s')
+
+
+if __name__ == '__main__':
+    main()
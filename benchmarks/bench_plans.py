@@ -0,0 +1,66 @@
+"""
+Workout plan batch benchmark for ACEest Fitness Application
+
+Logs random workouts for many members into the incrementally maintained
+training features, then times the nightly batch: snapshotting every
+member's features, goals and favourite exercises, and building next
+week's plans from them. Reports members per second for each step.
+
+Usage:
+    python benchmarks/bench_plans.py --members 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module  # noqa: E402
+
+
+def populate(members, workouts_per_member, seed=0):
+    rng = np.random.default_rng(seed)
+    catalog = [entry for entry in app_module.EXERCISE_CATALOG if entry[1] in app_module.PLAN_CATEGORIES]
+    now = datetime.now()
+    user_ids = [f'member{i}' for i in range(members)]
+    for user_id in user_ids:
+        app_module.users_db[user_id] = {'goals': {'week': {'calories': int(rng.integers(1000, 4000))}}}
+        for pick, days_ago, duration in zip(rng.integers(0, len(catalog), workouts_per_member),
+                                            rng.uniform(0, 42, workouts_per_member),
+                                            rng.integers(15, 90, workouts_per_member).tolist()):
+            name, category, met = catalog[pick]
+            app_module.training_features.record(user_id, {
+                'exercise': name, 'category': category, 'duration': duration, 'calories': met * duration,
+                'timestamp': (now - timedelta(days=days_ago)).isoformat()})
+    return user_ids
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--workouts', type=int, default=12, help='workouts logged per member')
+    args = parser.parse_args()
+    
+    seconds, user_ids = timed(lambda: populate(args.members, args.workouts))
+    print(f'    log: {args.members * args.workouts / seconds:12,.0f} workouts/s')
+    
+    seconds, params = timed(lambda: app_module.plan_inputs(user_ids))
+    print(f'snapshot: {args.members / seconds:12,.0f} members/s')
+    
+    seconds, plans = timed(lambda: dict(app_module.build_plans(params)))
+    print(f'   plans: {args.members / seconds:12,.0f} members/s ({len(plans)} plans in {seconds:.1f}s)')
+
+
+if __name__ == '__main__':
+    main()
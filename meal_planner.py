@@ -0,0 +1,257 @@
+"""
+ACEest Fitness & Gym Management System - Meal Planner
+Description: Day meal plans from a bundled food table that meet calorie and macro targets
+
+Plans a day of breakfast, lunch, dinner and snacks in whole servings of
+foods from FOODS so that calories and protein / carbohydrate / fat grams
+land close to the same 30/40/30 split as generate_diet_plan(), with each
+meal near its share of the day. Dietary filters (vegetarian, vegan,
+pescatarian, gluten_free, dairy_free, nut_free) narrow the table first.
+
+The solver is a greedy construction followed by a local search over
+additions, removals and same-meal swaps; every candidate move is scored at once
+against a numpy index of the allowed foods. Plans depend only on the
+calorie target (rounded to CALORIE_BUCKET) and the filters, so they are
+memoised by that bucket and thousands of members share a few dozen plans.
+
+    >>> plan = plan_meals(2450, diet=('vegetarian',))
+    >>> [meal['meal'] for meal in plan['meals']]
+    ['breakfast', 'lunch', 'dinner', 'snacks']
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+# (food, serving, kcal, protein g, carbs g, fat g, meals, kind, allergens)
+# meals: b = breakfast, l = lunch, d = dinner, s = snacks
+# kind: meat / fish / vegetarian (may contain egg or dairy) / vegan
+FOODS = [
+    ('Rolled oats', '50 g dry', 190, 6.5, 33.0, 3.5, 'b', 'vegan', {'gluten'}),
+    ('Greek yogurt', '170 g', 100, 17.0, 6.0, 0.7, 'bs', 'vegetarian', {'dairy'}),
+    ('Eggs', '2 large', 143, 12.6, 0.7, 9.5, 'b', 'vegetarian', set()),
+    ('Wholemeal toast', '2 slices', 160, 8.0, 28.0, 2.0, 'b', 'vegan', {'gluten'}),
+    ('Banana', '1 medium', 105, 1.3, 27.0, 0.4, 'bs', 'vegan', set()),
+    ('Mixed berries', '150 g', 85, 1.0, 21.0, 0.5, 'bs', 'vegan', set()),
+    ('Peanut butter', '2 tbsp', 190, 8.0, 7.0, 16.0, 'bs', 'vegan', {'nuts'}),
+    ('Semi-skimmed milk', '250 ml', 122, 8.3, 12.0, 4.8, 'b', 'vegetarian', {'dairy'}),
+    ('Soy milk', '250 ml', 100, 8.0, 5.0, 4.5, 'b', 'vegan', set()),
+    ('Tofu scramble', '150 g', 180, 18.0, 4.0, 11.0, 'b', 'vegan', set()),
+    ('Cottage cheese', '150 g', 147, 17.0, 5.0, 6.5, 'bs', 'vegetarian', {'dairy'}),
+    ('Chicken breast', '150 g grilled', 248, 46.5, 0.0, 5.4, 'ld', 'meat', set()),
+    ('Turkey breast', '150 g roasted', 200, 43.0, 0.0, 2.5, 'ld', 'meat', set()),
+    ('Lean beef mince', '150 g cooked', 250, 31.0, 0.0, 14.0, 'd', 'meat', set()),
+    ('Salmon fillet', '150 g baked', 312, 31.0, 0.0, 20.0, 'ld', 'fish', set()),
+    ('Tuna', '120 g canned in water', 139, 30.0, 0.0, 1.2, 'l', 'fish', set()),
+    ('Cod fillet', '150 g baked', 123, 27.0, 0.0, 1.0, 'd', 'fish', set()),
+    ('Lentils', '200 g cooked', 230, 18.0, 40.0, 0.8, 'ld', 'vegan', set()),
+    ('Chickpeas', '200 g cooked', 328, 18.0, 55.0, 5.0, 'ld', 'vegan', set()),
+    ('Firm tofu', '150 g', 216, 24.0, 3.0, 13.0, 'ld', 'vegan', set()),
+    ('Tempeh', '100 g', 192, 20.0, 8.0, 11.0, 'ld', 'vegan', set()),
+    ('Brown rice', '200 g cooked', 246, 5.5, 51.0, 2.0, 'ld', 'vegan', set()),
+    ('Quinoa', '185 g cooked', 222, 8.0, 39.0, 3.6, 'ld', 'vegan', set()),
+    ('Wholewheat pasta', '200 g cooked', 300, 12.0, 60.0, 2.0, 'ld', 'vegan', {'gluten'}),
+    ('Wholemeal wrap', '1 wrap', 180, 6.0, 30.0, 4.0, 'l', 'vegan', {'gluten'}),
+    ('Sweet potato', '200 g baked', 180, 4.0, 41.0, 0.3, 'ld', 'vegan', set()),
+    ('Boiled potatoes', '250 g', 218, 4.5, 50.0, 0.3, 'd', 'vegan', set()),
+    ('Broccoli', '150 g', 51, 4.2, 10.0, 0.6, 'ld', 'vegan', set()),
+    ('Spinach', '100 g', 23, 2.9, 3.6, 0.4, 'ld', 'vegan', set()),
+    ('Mixed salad', '100 g', 20, 1.5, 3.5, 0.2, 'ld', 'vegan', set()),
+    ('Olive oil', '1 tbsp', 119, 0.0, 0.0, 13.5, 'ld', 'vegan', set()),
+    ('Avocado', '1/2 fruit', 160, 2.0, 8.5, 14.7, 'bl', 'vegan', set()),
+    ('Feta', '30 g', 79, 4.3, 1.2, 6.4, 'l', 'vegetarian', {'dairy'}),
+    ('Almonds', '30 g', 174, 6.0, 6.0, 15.0, 's', 'vegan', {'nuts'}),
+    ('Apple', '1 medium', 95, 0.5, 25.0, 0.3, 's', 'vegan', set()),
+    ('Hummus and carrots', '60 g + 100 g', 150, 5.0, 14.0, 8.0, 's', 'vegan', set()),
+    ('Protein bar', '1 bar', 200, 20.0, 22.0, 7.0, 's', 'vegetarian', {'dairy', 'nuts'}),
+    ('Whey protein shake', '30 g in water', 120, 24.0, 3.0, 1.5, 's', 'vegetarian', {'dairy'}),
+    ('Rice cakes', '2 cakes', 70, 1.5, 15.0, 0.5, 's', 'vegan', set()),
+    ('Dark chocolate', '20 g', 120, 1.5, 9.0, 8.5, 's', 'vegetarian', {'dairy'})
+]
+
+# Filter -> (kinds allowed, allergens excluded)
+DIETS = {
+    'vegetarian': ({'vegetarian', 'vegan'}, set()),
+    'vegan': ({'vegan'}, set()),
+    'pescatarian': ({'fish', 'vegetarian', 'vegan'}, set()),
+    'gluten_free': (None, {'gluten'}),
+    'dairy_free': (None, {'dairy'}),
+    'nut_free': (None, {'nuts'})
+}
+
+MEALS = (('breakfast', 'b', 0.25), ('lunch', 'l', 0.35), ('dinner', 'd', 0.30), ('snacks', 's', 0.10))
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats')
+MACRO_SPLIT = ((0.30, 4), (0.40, 4), (0.30, 9))  # share of calories and kcal per gram: protein, carbs, fats
+
+CALORIE_BUCKET = 50  # plans are shared between targets that round to the same 50 kcal
+MAX_SERVINGS = 2  # of one food in one meal
+NUTRIENT_WEIGHTS = np.array([4.0, 2.0, 1.0, 1.0])  # calories matter most, then protein
+MEAL_WEIGHT = 0.5
+REPEAT_PENALTY = 0.01  # per extra serving of a food already in the day, for variety
+MAX_SEARCH_ROUNDS = 200
+
+
+def macro_targets(daily_calories):
+    """[calories, protein g, carbs g, fat g] for a calorie target"""
+    return [daily_calories] + [daily_calories * share / kcal_per_gram for share, kcal_per_gram in MACRO_SPLIT]
+
+
+@lru_cache(maxsize=None)
+def food_index(diet=()):
+    """(rows into FOODS, nutrients per serving, meal mask) for the foods a diet allows"""
+    rows = []
+    for i, (_, _, _, _, _, _, meals, kind, allergens) in enumerate(FOODS):
+        if all((kinds is None or kind in kinds) and not excluded & allergens
+               for kinds, excluded in (DIETS[name] for name in diet)):
+            rows.append(i)
+    nutrients = np.array([FOODS[i][2:6] for i in rows], dtype=float).reshape(-1, len(NUTRIENTS))
+    mask = np.array([[code in FOODS[i][6] for i in rows] for _, code, _ in MEALS], dtype=bool)
+    return rows, nutrients, mask.reshape(len(MEALS), len(rows))
+
+
+class PlanSearch:
+    """Servings per (meal, food) and the cost of moving from them.
+    
+    The cost is the weighted squared relative error of the day's
+    nutrients plus each meal's calorie error, plus a small penalty for
+    repeating a food.
+    """
+
+    def __init__(self, nutrients, mask, targets, meal_targets):
+        self.nutrients = nutrients
+        self.mask = mask
+        self.targets = np.asarray(targets, dtype=float)
+        self.meal_targets = np.asarray(meal_targets, dtype=float)
+        self.servings = np.zeros(mask.shape, dtype=int)
+        self.day = np.zeros(len(self.targets))
+        self.meal_calories = np.zeros(len(self.meal_targets))
+    
+    def cost(self, day, meal_calories, repeats):
+        day_error = ((day - self.targets) / self.targets) ** 2 @ NUTRIENT_WEIGHTS
+        meal_error = (((meal_calories - self.meal_targets) / self.meal_targets) ** 2).sum(axis=-1)
+        return day_error + MEAL_WEIGHT * meal_error + REPEAT_PENALTY * repeats
+    
+    def current(self):
+        return self.cost(self.day, self.meal_calories, self.repeats(self.servings))
+    
+    @staticmethod
+    def repeats(servings):
+        return np.maximum(servings.sum(axis=-2) - 1, 0).sum(axis=-1)
+    
+    def best_addition(self, day, meal_calories, servings):
+        """(cost, meal, food) of the best single serving to add to a state"""
+        # Every (meal, food) candidate at once: shape (meals, foods, ...)
+        new_day = day + self.nutrients[None, :, :]
+        new_meals = np.repeat(meal_calories[None, None, :], self.mask.shape[1], axis=1)
+        new_meals = np.repeat(new_meals, self.mask.shape[0], axis=0)
+        meal_rows = np.arange(self.mask.shape[0])
+        new_meals[meal_rows, :, meal_rows] += self.nutrients[None, :, 0]
+        
+        repeats = self.repeats(servings) + (servings.sum(axis=0) >= 1)[None, :]
+        costs = self.cost(new_day, new_meals, repeats)
+        costs = np.where(self.mask & (servings < MAX_SERVINGS), costs, np.inf)
+        meal, food = np.unravel_index(np.argmin(costs), costs.shape)
+        return costs[meal, food], meal, food
+    
+    def apply(self, meal, food, count):
+        self.servings[meal, food] += count
+        self.day += count * self.nutrients[food]
+        self.meal_calories[meal] += count * self.nutrients[food, 0]
+    
+    def build(self):
+        """Greedy: keep adding the serving that lowers the cost most"""
+        if not self.mask.any():
+            return
+        cost = self.current()
+        while True:
+            new_cost, meal, food = self.best_addition(self.day, self.meal_calories, self.servings)
+            if new_cost >= cost:
+                return
+            self.apply(meal, food, 1)
+            cost = new_cost
+    
+    def improve(self):
+        """Local search: take the best addition, removal or same-meal swap until none helps"""
+        cost = self.current()
+        for _ in range(MAX_SEARCH_ROUNDS):
+            added, meal, food = self.best_addition(self.day, self.meal_calories, self.servings)
+            best, remove, add = (added, None, (meal, food)) if added < cost else (cost, None, None)
+            for meal, food in zip(*np.nonzero(self.servings)):
+                self.apply(meal, food, -1)
+                removed = self.current()
+                if removed < best:
+                    best, remove, add = removed, (meal, food), None
+                
+                # Swaps stay within the meal so its share is still met
+                mask = self.mask
+                self.mask = np.zeros_like(mask)
+                self.mask[meal] = mask[meal]
+                self.mask[meal, food] = False
+                swapped, _, other = self.best_addition(self.day, self.meal_calories, self.servings)
+                self.mask = mask
+                if swapped < best:
+                    best, remove, add = swapped, (meal, food), (meal, other)
+                self.apply(meal, food, 1)
+            
+            if remove is None and add is None:
+                return
+            cost = best
+            if remove is not None:
+                self.apply(*remove, -1)
+            if add is not None:
+                self.apply(*add, 1)
+
+
+def solve(daily_calories, diet=()):
+    """Servings array (meals x allowed foods) for a calorie target, with the food rows"""
+    rows, nutrients, mask = food_index(diet)
+    targets = macro_targets(daily_calories)
+    search = PlanSearch(nutrients, mask, targets, [daily_calories * share for _, _, share in MEALS])
+    search.build()
+    search.improve()
+    return rows, search.servings
+
+
+@lru_cache(maxsize=1024)
+def cached_plan(daily_calories, diet):
+    rows, servings = solve(daily_calories, diet)
+    totals = dict.fromkeys(NUTRIENTS, 0.0)
+    meals = []
+    for (meal, _, share), meal_servings in zip(MEALS, servings):
+        items = []
+        for i in np.nonzero(meal_servings)[0]:
+            food, serving, *amounts = FOODS[rows[i]][:6]
+            count = int(meal_servings[i])
+            item = {'food': food, 'serving': serving, 'servings': count}
+            item.update({name: round(amount * count, 1) for name, amount in zip(NUTRIENTS, amounts)})
+            items.append(item)
+        meal_totals = {name: round(sum(item[name] for item in items), 1) for name in NUTRIENTS}
+        for name in NUTRIENTS:
+            totals[name] += meal_totals[name]
+        meals.append({'meal': meal, 'target_calories': round(daily_calories * share),
+                      'items': items, 'totals': meal_totals})
+    
+    targets = macro_targets(daily_calories)
+    return {
+        'calories': daily_calories,
+        'diet': list(diet),
+        'targets': {name: round(value) for name, value in zip(NUTRIENTS, targets)},
+        'totals': {name: round(value, 1) for name, value in totals.items()},
+        'meals': meals
+    }
+
+
+def plan_meals(daily_calories, diet=()):
+    """A day's meal plan for a calorie target and dietary filters.
+    
+    The target is rounded to CALORIE_BUCKET and the plan is memoised, so
+    the returned dict is shared between callers and must not be modified.
+    Raises ValueError for an unknown filter or a non-positive target.
+    """
+    unknown = set(diet).difference(DIETS)
+    if unknown:
+        raise ValueError(f"Unknown diets: {', '.join(sorted(unknown))}")
+    bucket = max(int(round(daily_calories / CALORIE_BUCKET)) * CALORIE_BUCKET, 0)
+    if bucket <= 0:
+        raise ValueError('Daily calories must be positive')
+    return cached_plan(bucket, tuple(sorted(set(diet))))
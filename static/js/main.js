@@ -141,6 +141,48 @@ function convertToCSV(data) {
     return [headers.join(','), ...rows].join('\n');
 }
 
+// Subscribe to live workout summary updates (Server-Sent Events)
+function subscribeSummary(url, onUpdate) {
+    let summary = null;
+    const source = new EventSource(url);
+    
+    // Full snapshot on connect (and after the server asks us to resync)
+    source.addEventListener('summary', (e) => {
+        summary = JSON.parse(e.data);
+        onUpdate(summary);
+    });
+    
+    // Small delta for each workout logged from any device
+    source.addEventListener('workout', (e) => {
+        if (!summary) return;
+        applyWorkoutDelta(summary, JSON.parse(e.data));
+        onUpdate(summary);
+    });
+    
+    return source;
+}
+
+// Only the fields the stream was asked for are present in the summary
+function applyWorkoutDelta(summary, delta) {
+    if ('total_workouts' in summary) summary.total_workouts += 1;
+    if ('total_duration' in summary) summary.total_duration += delta.duration;
+    if ('total_calories' in summary) summary.total_calories += delta.calories;
+    
+    if (summary.by_category) {
+        if (!summary.by_category[delta.category]) {
+            summary.by_category[delta.category] = { count: 0, duration: 0, calories: 0 };
+        }
+        const category = summary.by_category[delta.category];
+        category.count += 1;
+        category.duration += delta.duration;
+        category.calories += delta.calories;
+    }
+    
+    if (summary.weekly_stats && delta.date in summary.weekly_stats) {
+        summary.weekly_stats[delta.date] += delta.duration;
+    }
+}
+
 // Initialize app on page load
 document.addEventListener('DOMContentLoaded', function() {
     initTooltips();
@@ -0,0 +1,130 @@
+"""
+Unit Tests for the activity file importer
+"""
+
+import gzip
+import io
+import re
+import zipfile
+from datetime import datetime, timedelta
+import pytest
+from activity_import import iter_activities, parse_csv, parse_gpx, parse_tcx, parse_time, sport_exercise
+
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="watch" xmlns="http://www.topografix.com/GPX/1/1"
+     xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">
+  <metadata><time>2026-10-01T07:00:00Z</time></metadata>
+  <trk>
+    <name>Morning Run</name>
+    <type>running</type>
+    <trkseg>
+      {points}
+    </trkseg>
+  </trk>
+</gpx>
+"""
+
+TRKPT = """<trkpt lat="51.5" lon="-0.12"><time>{time}Z</time>
+        <extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>{hr}</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions>
+      </trkpt>"""
+
+TCX = """<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">
+  <Activities>
+    <Activity Sport="Biking">
+      <Id>2026-10-02T18:00:00Z</Id>
+      <Lap StartTime="2026-10-02T18:00:00Z">
+        <TotalTimeSeconds>1200</TotalTimeSeconds>
+        <AverageHeartRateBpm><Value>140</Value></AverageHeartRateBpm>
+        <Track>
+          <Trackpoint><Time>2026-10-02T18:00:00Z</Time><HeartRateBpm><Value>120</Value></HeartRateBpm></Trackpoint>
+          <Trackpoint><Time>2026-10-02T18:10:00Z</Time><HeartRateBpm><Value>150</Value></HeartRateBpm></Trackpoint>
+        </Track>
+      </Lap>
+      <Lap StartTime="2026-10-02T18:20:00Z"><TotalTimeSeconds>600</TotalTimeSeconds></Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+def gpx(seconds, heart_rate=True):
+    start = datetime(2026, 10, 1, 7, 0)
+    points = '\n      '.join(TRKPT.format(time=(start + timedelta(seconds=i)).isoformat(), hr=120 + i % 30)
+                               for i in range(seconds))
+    if not heart_rate:
+        points = re.sub(r'<extensions>.*?</extensions>', '', points, flags=re.S)
+    return GPX.format(points=points).encode()
+
+
+class TestParsers:
+    """Test the streaming GPX, TCX and CSV parsers"""
+
+    def test_gpx_track(self):
+        """Test a track's sport, duration and heart rate are read"""
+        activities = list(parse_gpx(io.BytesIO(gpx(600)), 'run.gpx'))
+        assert len(activities) == 1
+        activity = activities[0]
+        assert activity['sport'] == 'running'
+        assert activity['start'] == parse_time('2026-10-01T07:00:00Z').isoformat()
+        assert activity['duration_seconds'] == 599
+        assert len(activity['heart_rate']) == 600
+        assert activity['heart_rate'][1] == [1.0, 121]
+    
+    def test_tcx_laps(self):
+        """Test TCX duration comes from its laps and lap averages are not samples"""
+        activity, = parse_tcx(io.BytesIO(TCX.encode()), 'ride.tcx')
+        assert activity['sport'] == 'Biking'
+        assert activity['duration_seconds'] == 1800
+        assert activity['heart_rate'] == [[0.0, 120], [600.0, 150]]
+    
+    def test_csv_aliases(self):
+        """Test common export headers are recognised"""
+        rows = ('Activity Date,Activity Type,Elapsed Time\n'
+                '"Oct 3, 2026, 6:30:00 AM",Swim,1500\n'
+                '2026-10-04T06:30:00,Yoga,3600\n')
+        activities = list(parse_csv(io.StringIO(rows)))
+        assert [(a['sport'], a['start'], a['duration_seconds']) for a in activities] == [
+            ('Swim', '2026-10-03T06:30:00', 1500.0), ('Yoga', '2026-10-04T06:30:00', 3600.0)]
+        
+        with pytest.raises(ValueError):
+            list(parse_csv(io.StringIO('name,notes\nx,y\n')))
+    
+    def test_sport_mapping(self):
+        """Test sports map onto exercises and categories"""
+        assert sport_exercise('Biking') == ('Cycling', 'Cardio')
+        assert sport_exercise('strength_training') == ('Strength Training', 'Strength')
+        assert sport_exercise('kite surfing') == ('Kite Surfing', 'Workout')
+
+
+class TestArchives:
+    """Test archives and compressed files are read as streams"""
+
+    def test_zip_of_mixed_files(self, tmp_path):
+        """Test every activity file in a zip is parsed and bad files are reported"""
+        path = str(tmp_path / 'export.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('activities/run.gpx', gpx(120))
+            archive.writestr('activities/ride.tcx.gz', gzip.compress(TCX.encode()))
+            archive.writestr('activities/broken.gpx', b'<gpx><trk>')
+            archive.writestr('README.txt', b'not an activity')
+        
+        errors = []
+        activities = list(iter_activities(path, errors))
+        assert sorted(a['source'] for a in activities) == ['ride.tcx', 'run.gpx']
+        assert len(errors) == 1 and errors[0].startswith('broken.gpx')
+    
+    def test_large_gpx_streams(self, tmp_path):
+        """Test trackpoints are discarded as they are read"""
+        import tracemalloc
+        path = tmp_path / 'long.gpx'
+        path.write_bytes(gpx(3600 * 10, heart_rate=False))
+        
+        tracemalloc.start()
+        activity, = iter_activities(str(path))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        assert activity['duration_seconds'] == 3600 * 10 - 1
+        assert peak < path.stat().st_size / 4  # the whole tree would take several times the file
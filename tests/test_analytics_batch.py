@@ -0,0 +1,95 @@
+"""
+Unit Tests for the offline analytics batch job
+"""
+
+import csv
+import gzip
+import json
+import os
+import pytest
+from analytics_batch import run_batch, partition_of
+
+
+def write_export(path, rows):
+    """Write workout rows as an NDJSON export"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as out:
+        for row in rows:
+            out.write(json.dumps(row) + '\n')
+
+
+def workout(user_id, day, category='Cardio', duration=30):
+    return {'user_id': user_id, 'timestamp': f'{day}T08:00:00', 'category': category,
+            'exercise': 'Running', 'duration': duration, 'calories': duration * 5.0}
+
+
+def read_csv(path):
+    with open(path, newline='') as source:
+        return list(csv.DictReader(source))
+
+
+@pytest.fixture
+def exports(tmp_path):
+    """Two export files with members spread over three months"""
+    directory = tmp_path / 'exports'
+    directory.mkdir()
+    write_export(str(directory / 'part-1.ndjson'), [
+        workout('alice', '2026-07-03'),
+        workout('alice', '2026-08-10', 'Strength', 20),
+        workout('bob', '2026-07-15'),
+    ])
+    write_export(str(directory / 'part-2.ndjson.gz'), [
+        workout('alice', '2026-09-28'),
+        workout('carol', '2026-08-02'),
+        workout('carol', '2026-09-01'),
+    ])
+    return str(directory)
+
+
+class TestAnalyticsBatch:
+    """Test the split / analyse / merge pipeline"""
+    
+    def test_retention_cohorts(self, exports, tmp_path):
+        """Test members are grouped by first-active month"""
+        output = str(tmp_path / 'out')
+        run_batch([exports], output, workers=2, partitions=3)
+        
+        cohorts = {(r['cohort'], int(r['months_since_first'])): r for r in read_csv(os.path.join(output, 'cohorts.csv'))}
+        assert cohorts[('2026-07', 0)]['active_members'] == '2'
+        assert cohorts[('2026-07', 1)]['active_members'] == '1'
+        assert cohorts[('2026-07', 1)]['retention'] == '0.5'
+        assert cohorts[('2026-08', 1)]['active_members'] == '1'
+    
+    def test_category_trends(self, exports, tmp_path):
+        """Test sessions and minutes are totalled per month and category"""
+        output = str(tmp_path / 'out')
+        run_batch([exports], output, workers=2)
+        
+        trends = {(r['month'], r['category']): r for r in read_csv(os.path.join(output, 'category_trends.csv'))}
+        assert trends[('2026-07', 'Cardio')]['sessions'] == '2'
+        assert trends[('2026-08', 'Strength')]['minutes'] == '20'
+    
+    def test_churn_signals(self, exports, tmp_path):
+        """Test members inactive for two weeks are flagged"""
+        output = str(tmp_path / 'out')
+        summary = run_batch([exports], output, workers=1, as_of='2026-09-30')
+        
+        churn = {r['user_id']: r for r in read_csv(os.path.join(output, 'churn_signals.csv'))}
+        assert churn['alice']['churn_risk'] == '0'
+        assert churn['bob']['churn_risk'] == '1'
+        assert churn['carol']['days_inactive'] == '29'
+        assert summary['members'] == 3
+        assert summary['members_at_risk'] == 2
+    
+    def test_results_independent_of_partitioning(self, exports, tmp_path):
+        """Test the partition count does not change the results"""
+        run_batch([exports], str(tmp_path / 'a'), workers=1, partitions=1)
+        run_batch([exports], str(tmp_path / 'b'), workers=2, partitions=7)
+        
+        for name in ('cohorts.csv', 'category_trends.csv'):
+            assert read_csv(str(tmp_path / 'a' / name)) == read_csv(str(tmp_path / 'b' / name))
+    
+    def test_partition_is_stable(self):
+        """Test users hash to the same partition in every process"""
+        assert partition_of('alice', 8) == partition_of('alice', 8)
+        assert 0 <= partition_of('bob', 8) < 8
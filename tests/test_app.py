@@ -5,7 +5,13 @@ Test Suite covers all Flask routes and business logic
 
 import pytest
 import json
-from app import app, users_db, workouts_db, calculate_calories, get_weekly_stats, generate_diet_plan
+import os
+import threading
+import time
+import numpy as np
+from datetime import date, datetime, timedelta, timezone
+import app as app_module
+from app import app, users_db, workouts_db, data_versions, jobs_db, report_cache, workout_ids, workout_samples_db, idempotency_db, rate_limit_db, event_broker, leaderboards, gym_stats, trending_exercises, exercise_catalog, workout_search, measurements, workout_records, goal_tracker, training_features, workout_plans_db, single_flight, SingleFlight, TTLCache, AdmissionController, TokenBucketStore, TopK, Leaderboards, HyperLogLog, SpaceSaving, TrendingExercises, ExerciseCatalog, EXERCISE_CATALOG, WorkoutSearchIndex, MetricSeries, WorkoutRecords, GoalTracker, TrainingFeatures, plan_targets, PLAN_CATEGORIES, SampleSeries, downsample_lttb, hash_password, verify_password, calculate_calories, calculate_calories_batch, get_weekly_stats, SUMMARY_FIELDS, generate_diet_plan
 
 
 @pytest.fixture
@@ -13,12 +19,32 @@ def client():
     """Create test client"""
     app.config['TESTING'] = True
     app.config['SECRET_KEY'] = 'test-secret-key'
+    app.config['PASSWORD_SCRYPT_N'] = 2 ** 8  # cheap hashes keep the suite fast
     
     with app.test_client() as client:
         with app.app_context():
             # Clear databases before each test
             users_db.clear()
             workouts_db.clear()
+            data_versions.clear()
+            jobs_db.clear()
+            report_cache.clear()
+            workout_ids.clear()
+            workout_samples_db.clear()
+            idempotency_db.clear()
+            rate_limit_db.clear()
+            event_broker.clear()
+            leaderboards.clear()
+            gym_stats.clear()
+            trending_exercises.clear()
+            exercise_catalog.reset_usage()
+            workout_search.clear()
+            measurements.clear()
+            workout_records.clear()
+            goal_tracker.clear()
+            training_features.clear()
+            workout_plans_db.clear()
+            single_flight.reset()
             yield client
 
 
@@ -53,6 +79,16 @@ def authenticated_client(client):
     return client
 
 
+def register_and_login(client, username, weight=70):
+    """Register a member and log the client in as them"""
+    client.post('/register', content_type='application/json', data=json.dumps({
+        'username': username, 'password': 'pass123', 'name': username.title(),
+        'age': 30, 'gender': 'female', 'height': 170, 'weight': weight
+    }))
+    client.post('/login', content_type='application/json',
+                data=json.dumps({'username': username, 'password': 'pass123'}))
+
+
 class TestHealthCheck:
     """Test health check endpoint"""
     
@@ -296,6 +332,1514 @@ class TestWorkouts:
         assert 'weekly_stats' in summary
 
 
+class TestSparseFieldsets:
+    """Test ?fields= selection on the workout APIs"""
+    
+    def test_workouts_totals_only(self, authenticated_client):
+        """Test requesting only totals from the workout list"""
+        for duration in (20, 40):
+            authenticated_client.post('/api/workouts',
+                                    data=json.dumps({'category': 'Cardio', 'exercise': 'Rowing', 'duration': duration}),
+                                    content_type='application/json')
+        
+        response = authenticated_client.get('/api/workouts?fields=total_workouts,total_duration')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert 'workouts' not in data
+        assert data['total_workouts'] == 2
+        assert data['total_duration'] == 60
+        assert 'total_calories' not in data
+    
+    def test_summary_weekly_stats_only(self, authenticated_client):
+        """Test summary only returns the requested parts"""
+        response = authenticated_client.get('/api/workouts/summary?fields=weekly_stats')
+        assert response.status_code == 200
+        
+        summary = json.loads(response.data)['summary']
+        assert list(summary.keys()) == ['weekly_stats']
+        assert len(summary['weekly_stats']) == 7
+    
+    def test_unknown_field_rejected(self, authenticated_client):
+        """Test unknown field names return 400"""
+        response = authenticated_client.get('/api/workouts/summary?fields=weekly_stats,bogus')
+        assert response.status_code == 400
+        
+        data = json.loads(response.data)
+        assert data['success'] is False
+        assert 'bogus' in data['message']
+
+
+class TestLiveUpdates:
+    """Test Server-Sent Events summary stream"""
+    
+    def test_stream_sends_snapshot_then_deltas(self, authenticated_client):
+        """Test stream starts with a summary and pushes logged workouts"""
+        response = authenticated_client.get('/api/workouts/stream')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        
+        events = (chunk.decode() for chunk in response.response)
+        first = next(events)
+        assert first.startswith('event: summary')
+        assert json.loads(first.split('data: ', 1)[1])['total_workouts'] == 0
+        
+        authenticated_client.post('/api/workouts',
+                                data=json.dumps({'category': 'Cardio', 'exercise': 'Running', 'duration': 25}),
+                                content_type='application/json')
+        
+        delta = next(events)
+        assert delta.startswith('event: workout')
+        payload = json.loads(delta.split('data: ', 1)[1])
+        assert payload['category'] == 'Cardio'
+        assert payload['duration'] == 25
+        
+        response.close()
+        assert event_broker.subscriber_count() == 0
+    
+    def test_stream_limits_fields(self, authenticated_client):
+        """Test ?fields= trims the stream's summaries and unknown fields are rejected"""
+        response = authenticated_client.get('/api/workouts/stream?fields=weekly_stats,by_category')
+        first = next(chunk.decode() for chunk in response.response)
+        assert set(json.loads(first.split('data: ', 1)[1])) == {'weekly_stats', 'by_category'}
+        response.close()
+        
+        assert authenticated_client.get('/api/workouts/stream?fields=bogus').status_code == 400
+        assert event_broker.subscriber_count() == 0
+    
+    def test_broker_resyncs_slow_subscriber(self):
+        """Test a full subscriber queue is replaced by a resync marker"""
+        event_broker.clear()
+        subscription = event_broker.subscribe('user:slow')
+        for i in range(event_broker.max_pending + 5):
+            event_broker.publish('user:slow', 'workout', {'i': i})
+        
+        assert subscription.qsize() <= event_broker.max_pending
+        event_types = [subscription.get_nowait()[0] for _ in range(subscription.qsize())]
+        assert 'resync' in event_types
+
+
+class TestSingleFlight:
+    """Test request coalescing for aggregate computations"""
+    
+    def test_concurrent_calls_share_one_execution(self):
+        """Test callers with the same key wait for the running call"""
+        flight = SingleFlight()
+        release = threading.Event()
+        executions = []
+        
+        def compute():
+            executions.append(1)
+            release.wait(5)
+            return {'total': 42}
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do(('user', 1), compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        
+        # Let every follower attach to the leader before releasing it
+        while flight.metrics()['calls'] < 5:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        assert len(executions) == 1
+        assert results == [{'total': 42}] * 5
+        assert flight.metrics() == {'calls': 5, 'executions': 1, 'coalesced': 4, 'in_flight': 0}
+    
+    def test_errors_propagate_to_waiters(self):
+        """Test a failing call raises for the caller and is not retained"""
+        flight = SingleFlight()
+        
+        with pytest.raises(ZeroDivisionError):
+            flight.do('key', lambda: 1 / 0)
+        assert flight.do('key', lambda: 'ok') == 'ok'
+    
+    def test_metrics_endpoint(self, authenticated_client):
+        """Test coalescing counters are exposed"""
+        authenticated_client.get('/api/workouts/summary')
+        
+        response = authenticated_client.get('/metrics')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['single_flight']['calls'] == 1
+        assert data['single_flight']['executions'] == 1
+
+
+class TestIdempotency:
+    """Test Idempotency-Key handling on workout POSTs"""
+    
+    def post_workout(self, client, workout, key):
+        return client.post('/api/workouts',
+                           data=json.dumps(workout),
+                           content_type='application/json',
+                           headers={'Idempotency-Key': key})
+    
+    def test_retry_replays_first_response(self, authenticated_client):
+        """Test a retried POST does not log the workout twice"""
+        workout = {'category': 'Cardio', 'exercise': 'Rowing', 'duration': 20}
+        
+        first = self.post_workout(authenticated_client, workout, 'kiosk-1-abc')
+        retry = self.post_workout(authenticated_client, workout, 'kiosk-1-abc')
+        
+        assert first.status_code == 200
+        assert retry.status_code == 200
+        assert retry.headers.get('Idempotent-Replayed') == 'true'
+        assert json.loads(retry.data) == json.loads(first.data)
+        assert len(workouts_db['testuser']['Cardio']) == 1
+    
+    def test_key_reused_with_different_payload(self, authenticated_client):
+        """Test reusing a key for another request is rejected"""
+        self.post_workout(authenticated_client, {'exercise': 'Rowing', 'duration': 20}, 'key-2')
+        response = self.post_workout(authenticated_client, {'exercise': 'Rowing', 'duration': 45}, 'key-2')
+        
+        assert response.status_code == 422
+        assert sum(len(w) for w in workouts_db['testuser'].values()) == 1
+    
+    def test_validation_errors_are_replayed(self, authenticated_client):
+        """Test a rejected request replays the same error"""
+        self.post_workout(authenticated_client, {'exercise': 'Rowing'}, 'key-3')
+        response = self.post_workout(authenticated_client, {'exercise': 'Rowing'}, 'key-3')
+        
+        assert response.status_code == 400
+        assert response.headers.get('Idempotent-Replayed') == 'true'
+    
+    def test_ttl_cache_bounds(self):
+        """Test entries expire after the TTL and the oldest are evicted at capacity"""
+        now = [0.0]
+        cache = TTLCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+        
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        assert cache.get('a') is None
+        assert cache.get('c') == 3
+        
+        now[0] = 11
+        assert cache.get('b') is None
+        assert len(cache) == 0
+
+
+class TestAdmissionControl:
+    """Test the concurrency limiter and load shedding"""
+    
+    def start_waiter(self, controller, priority, results):
+        thread = threading.Thread(target=lambda: results.append((priority, controller.acquire(priority))))
+        thread.start()
+        return thread
+    
+    def wait_for_queue(self, controller, depth):
+        while controller.metrics()['queue_depth'] < depth:
+            time.sleep(0.001)
+    
+    def test_highest_priority_admitted_first(self):
+        """Test a released slot goes to the most important waiter"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+        assert controller.acquire(app_module.PRIORITY_NORMAL) is None
+        
+        results = []
+        low = self.start_waiter(controller, app_module.PRIORITY_LOW, results)
+        self.wait_for_queue(controller, 1)
+        critical = self.start_waiter(controller, app_module.PRIORITY_CRITICAL, results)
+        self.wait_for_queue(controller, 2)
+        
+        controller.release()
+        critical.join()
+        assert results == [(app_module.PRIORITY_CRITICAL, None)]
+        
+        controller.release()
+        low.join()
+        assert results[1] == (app_module.PRIORITY_LOW, None)
+    
+    def test_low_priority_shed_first(self):
+        """Test low priority requests only get a small share of the queue"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+        controller.acquire(app_module.PRIORITY_NORMAL)
+        
+        results = []
+        waiter = self.start_waiter(controller, app_module.PRIORITY_LOW, results)
+        self.wait_for_queue(controller, 1)
+        
+        assert controller.acquire(app_module.PRIORITY_LOW) == 'queue_full'
+        controller.release()
+        waiter.join()
+        assert controller.metrics()['shed'] == {f'queue_full:{app_module.PRIORITY_LOW}': 1}
+    
+    def test_critical_displaces_waiter_when_full(self):
+        """Test a full queue makes room for a critical request"""
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        controller.acquire(app_module.PRIORITY_NORMAL)
+        
+        results = []
+        waiter = self.start_waiter(controller, app_module.PRIORITY_NORMAL, results)
+        self.wait_for_queue(controller, 1)
+        critical = self.start_waiter(controller, app_module.PRIORITY_CRITICAL, results)
+        
+        waiter.join()
+        assert results == [(app_module.PRIORITY_NORMAL, 'displaced')]
+        controller.release()
+        critical.join()
+        assert results[1] == (app_module.PRIORITY_CRITICAL, None)
+    
+    def test_deadline_exceeded(self):
+        """Test queued requests give up after the deadline"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+        controller.acquire(app_module.PRIORITY_NORMAL)
+        
+        assert controller.acquire(app_module.PRIORITY_NORMAL) == 'timeout'
+        assert controller.metrics()['queue_depth'] == 0
+    
+    def test_shed_request_gets_503(self, authenticated_client, monkeypatch):
+        """Test shed requests get a fast 503 with Retry-After"""
+        monkeypatch.setattr(app_module, 'admission', AdmissionController(0, 0, 0))
+        
+        response = authenticated_client.get('/api/workouts')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(app_module.ADMISSION_RETRY_AFTER)
+
+
+class TestRateLimiting:
+    """Test token-bucket throttling of login and register"""
+    
+    def test_login_throttled_per_username(self, client):
+        """Test repeated failed logins for one account get 429"""
+        login_data = json.dumps({'username': 'victim', 'password': 'guess'})
+        capacity = app_module.RATE_LIMITS['login_user'][0]
+        
+        for _ in range(capacity):
+            response = client.post('/login', data=login_data, content_type='application/json')
+            assert response.status_code == 401
+        
+        response = client.post('/login', data=login_data, content_type='application/json')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+    
+    def test_register_throttled_per_ip(self, client):
+        """Test registration bursts from one address are throttled"""
+        capacity = app_module.RATE_LIMITS['register_ip'][0]
+        for i in range(capacity):
+            client.post('/register', data=json.dumps({'username': f'bot{i}'}), content_type='application/json')
+        
+        response = client.post('/register', data=json.dumps({'username': 'bot'}), content_type='application/json')
+        assert response.status_code == 429
+    
+    def test_bucket_refills_over_time(self):
+        """Test tokens come back at the configured rate"""
+        now = [1000.0]
+        store = TokenBucketStore(clock=lambda: now[0])
+        
+        assert store.consume('k', capacity=2, rate=1) == 0
+        assert store.consume('k', capacity=2, rate=1) == 0
+        assert store.consume('k', capacity=2, rate=1) == pytest.approx(1.0)
+        
+        now[0] += 1
+        assert store.consume('k', capacity=2, rate=1) == 0
+    
+    def test_full_buckets_evicted(self):
+        """Test refilled buckets are dropped once the key limit is hit"""
+        now = [0.0]
+        store = TokenBucketStore(max_keys=2, clock=lambda: now[0])
+        store.consume('a', capacity=1, rate=1)
+        store.consume('b', capacity=1, rate=1)
+        
+        now[0] += 5
+        store.consume('c', capacity=1, rate=1)
+        assert len(store) == 1
+    
+    def test_key_limit_is_hard(self):
+        """Test the store never grows past max_keys even when no bucket is full"""
+        now = [0.0]
+        store = TokenBucketStore(max_keys=100, clock=lambda: now[0])
+        for i in range(1000):
+            now[0] += 0.001
+            store.consume(f'ip:{i}', capacity=5, rate=0.01)
+            assert len(store) <= 100
+        # The newest client keeps its bucket: one token was taken above, four remain
+        for _ in range(4):
+            assert store.consume('ip:999', capacity=5, rate=0.01) == 0
+        assert store.consume('ip:999', capacity=5, rate=0.01) > 0
+        assert len(store._by_full_at) <= 2 * len(store) + 64
+    
+    def test_non_string_credentials_rejected(self, client):
+        """Test a JSON username or password that isn't a string is a 400, not a 500"""
+        for bad in ({'username': 123, 'password': 'x'}, {'username': ['a'], 'password': 'x'},
+                    {'username': 'a', 'password': {'p': 1}}):
+            assert client.post('/login', data=json.dumps(bad), content_type='application/json').status_code == 400
+        
+        response = client.post('/register', content_type='application/json', data=json.dumps({
+            'username': 42, 'password': 'secret', 'name': 'N', 'age': 30, 'gender': 'male', 'height': 170, 'weight': 70
+        }))
+        assert response.status_code == 400
+        assert 42 not in users_db
+    
+    def test_check_is_cheap(self):
+        """Test a bucket check costs well under a millisecond"""
+        store = TokenBucketStore()
+        start = time.perf_counter()
+        for i in range(10000):
+            store.consume(f'ip:{i % 100}', capacity=1000, rate=10)
+        assert (time.perf_counter() - start) / 10000 < 0.0001
+
+
+class TestPasswordHashing:
+    """Test scrypt password storage and rehash on login"""
+    
+    def login(self, client, username, password):
+        return client.post('/login',
+                           data=json.dumps({'username': username, 'password': password}),
+                           content_type='application/json')
+    
+    def test_register_stores_hash(self, authenticated_client):
+        """Test passwords are never stored in plaintext"""
+        stored = users_db['testuser']['password']
+        assert stored.startswith('scrypt$')
+        assert 'testpass123' not in stored
+    
+    def test_wrong_password_rejected(self, authenticated_client):
+        """Test a hashed account rejects the wrong password"""
+        response = self.login(authenticated_client, 'testuser', 'wrongpass')
+        assert response.status_code == 401
+    
+    def test_plaintext_account_rehashed_on_login(self, client):
+        """Test legacy plaintext passwords are upgraded on the next login"""
+        users_db['legacy'] = {'password': 'oldpass', 'name': 'Legacy User'}
+        
+        response = self.login(client, 'legacy', 'oldpass')
+        assert response.status_code == 200
+        assert users_db['legacy']['password'].startswith('scrypt$')
+        
+        # The upgraded hash still verifies
+        client.get('/logout')
+        assert self.login(client, 'legacy', 'oldpass').status_code == 200
+    
+    def test_cost_change_requests_rehash(self):
+        """Test hashes made at an old cost are flagged for rehashing"""
+        stored = hash_password('secret')
+        assert verify_password('secret', stored) == (True, False)
+        
+        app.config['PASSWORD_SCRYPT_N'] = 2 ** 9
+        try:
+            assert verify_password('secret', stored) == (True, True)
+            assert verify_password('other', stored)[0] is False
+        finally:
+            app.config['PASSWORD_SCRYPT_N'] = 2 ** 8
+
+
+def wait_for_job(client, status_url, timeout=60):
+    """Poll a job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = json.loads(client.get(status_url).data)['job']
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('job did not finish in time')
+
+
+class TestBackgroundJobs:
+    """Test the background job subsystem"""
+    
+    def test_export_runs_in_worker(self, authenticated_client):
+        """Test an export job is queued, runs and serves its result"""
+        for exercise in ('Running', 'Rowing'):
+            authenticated_client.post('/api/workouts',
+                                    data=json.dumps({'category': 'Cardio', 'exercise': exercise, 'duration': 30}),
+                                    content_type='application/json')
+        
+        response = authenticated_client.post('/api/workouts/export',
+                                           data=json.dumps({'format': 'csv'}),
+                                           content_type='application/json')
+        assert response.status_code == 202
+        job = json.loads(response.data)['job']
+        assert job['status'] == 'queued'
+        assert response.headers['Location'].endswith(job['status_url'])
+        
+        job = wait_for_job(authenticated_client, job['status_url'])
+        assert job['status'] == 'done'
+        assert job['progress'] == 1.0
+        
+        result = authenticated_client.get(job['result_url'])
+        assert result.status_code == 200
+        assert result.mimetype == 'text/csv'
+        lines = result.data.decode().strip().splitlines()
+        assert lines[0] == 'user_id,timestamp,category,exercise,duration,calories'
+        assert len(lines) == 3
+    
+    def test_unfinished_job_result(self, authenticated_client):
+        """Test the result of a running job is not served yet"""
+        jobs_db['pending'] = {'id': 'pending', 'user_id': 'testuser', 'kind': 'workouts_export',
+                              'status': 'running', 'progress': 0.5, 'finished_at': None}
+        
+        response = authenticated_client.get('/api/jobs/pending/result')
+        assert response.status_code == 409
+        assert json.loads(response.data)['job']['progress'] == 0.5
+    
+    def test_other_users_job_hidden(self, authenticated_client):
+        """Test jobs are only visible to their owner"""
+        jobs_db['theirs'] = {'id': 'theirs', 'user_id': 'someone-else', 'status': 'done', 'finished_at': None}
+        
+        assert authenticated_client.get('/api/jobs/theirs').status_code == 404
+        assert authenticated_client.get('/api/jobs/missing').status_code == 404
+    
+    def test_late_progress_keeps_finished_status(self, authenticated_client):
+        """Test a progress event arriving after the outcome doesn't reopen the job"""
+        jobs_db['finished'] = {'id': 'finished', 'user_id': 'testuser', 'kind': 'workouts_export',
+                               'status': 'done', 'progress': 1.0, 'message': None,
+                               'started_at': None, 'finished_at': datetime.now().isoformat()}
+        
+        app_module.job_queue._apply(('finished', 'running', (0.5, 'late')))
+        job = json.loads(authenticated_client.get('/api/jobs/finished').data)['job']
+        assert job['status'] == 'done'
+        assert job['progress'] == 1.0
+    
+    def test_dead_worker_is_replaced(self, authenticated_client):
+        """Test a worker process that dies is replaced and later jobs still run"""
+        export = lambda: json.loads(authenticated_client.post('/api/workouts/export').data)['job']
+        assert wait_for_job(authenticated_client, export()['status_url'])['status'] == 'done'
+        
+        queue = app_module.job_queue
+        killed = [worker.process for worker in queue._idle]
+        for process in killed:
+            process.kill()
+        deadline = time.time() + 30
+        while time.time() < deadline and (len(queue._idle) < queue.workers or
+                                          any(worker.process in killed for worker in queue._idle)):
+            time.sleep(0.05)
+        
+        assert all(worker.process.is_alive() for worker in queue._idle)
+        assert wait_for_job(authenticated_client, export()['status_url'])['status'] == 'done'
+
+
+class TestWeeklyReports:
+    """Test server-side weekly report generation"""
+    
+    def request_report(self, client, report_format):
+        return client.post('/api/reports/weekly',
+                           data=json.dumps({'format': report_format}),
+                           content_type='application/json')
+    
+    def log_workouts(self, client, count):
+        for i in range(count):
+            client.post('/api/workouts',
+                        data=json.dumps({'category': 'Strength', 'exercise': f'Set {i}', 'duration': 10}),
+                        content_type='application/json')
+    
+    def test_pdf_report_spans_pages(self, authenticated_client):
+        """Test a long week is split over several PDF pages"""
+        self.log_workouts(authenticated_client, 120)
+        
+        response = self.request_report(authenticated_client, 'pdf')
+        assert response.status_code == 202
+        job = wait_for_job(authenticated_client, json.loads(response.data)['job']['status_url'])
+        assert job['status'] == 'done'
+        
+        pdf = authenticated_client.get(job['result_url'])
+        assert pdf.mimetype == 'application/pdf'
+        assert pdf.data.startswith(b'%PDF')
+        assert pdf.data.count(b'/Type /Page\n') > 1
+    
+    def test_pdf_escapes_member_fields(self, authenticated_client):
+        """Test markup characters in profile fields don't break the PDF render"""
+        users_db['testuser'].update({'name': 'Tom & Jerry <b', 'gender': '<i>'})
+        self.log_workouts(authenticated_client, 1)
+        
+        response = self.request_report(authenticated_client, 'pdf')
+        job = wait_for_job(authenticated_client, json.loads(response.data)['job']['status_url'])
+        assert job['status'] == 'done', job['error']
+        assert authenticated_client.get(job['result_url']).data.startswith(b'%PDF')
+    
+    def test_report_cached_by_data_version(self, authenticated_client):
+        """Test unchanged data reuses the render and new workouts invalidate it"""
+        self.log_workouts(authenticated_client, 2)
+        
+        first = json.loads(self.request_report(authenticated_client, 'csv').data)['job']
+        wait_for_job(authenticated_client, first['status_url'])
+        
+        again = self.request_report(authenticated_client, 'csv')
+        assert again.status_code == 200
+        assert json.loads(again.data)['job']['id'] == first['id']
+        
+        self.log_workouts(authenticated_client, 1)
+        fresh = self.request_report(authenticated_client, 'csv')
+        assert fresh.status_code == 202
+        job = wait_for_job(authenticated_client, json.loads(fresh.data)['job']['status_url'])
+        
+        csv_lines = authenticated_client.get(job['result_url']).data.decode().strip().splitlines()
+        assert csv_lines[0] == 'date,category,exercise,duration,calories'
+        assert len(csv_lines) == 4
+    
+    def test_profile_edit_invalidates_cached_report(self, authenticated_client):
+        """Test a profile change that leaves workouts alone still renders a fresh report"""
+        self.log_workouts(authenticated_client, 1)
+        first = json.loads(self.request_report(authenticated_client, 'csv').data)['job']
+        wait_for_job(authenticated_client, first['status_url'])
+        
+        authenticated_client.patch('/api/profile', content_type='application/json', data=json.dumps({'age': 41}))
+        fresh = self.request_report(authenticated_client, 'csv')
+        assert fresh.status_code == 202
+        assert json.loads(fresh.data)['job']['id'] != first['id']
+        assert isinstance(report_cache, TTLCache)
+    
+    def test_invalid_week(self, authenticated_client):
+        """Test a malformed week is rejected"""
+        response = authenticated_client.post('/api/reports/weekly?week=last-week')
+        assert response.status_code == 400
+
+
+class TestLeaderboards:
+    """Test gym-wide weekly leaderboards"""
+    
+    def log(self, client, category, duration):
+        client.post('/api/workouts',
+                    data=json.dumps({'category': category, 'exercise': 'Session', 'duration': duration}),
+                    content_type='application/json')
+    
+    def test_ranks_members_by_metric(self, client):
+        """Test members are ranked per metric, overall and per category"""
+        register_and_login(client, 'alice')
+        self.log(client, 'Cardio', 30)
+        self.log(client, 'Strength', 30)
+        register_and_login(client, 'bob')
+        self.log(client, 'Cardio', 45)
+        
+        data = json.loads(client.get('/api/leaderboards?metric=minutes').data)
+        assert [(e['name'], e['score']) for e in data['leaderboard']] == [('Alice', 60), ('Bob', 45)]
+        assert data['leaderboard'][1]['you'] is True
+        
+        cardio = json.loads(client.get('/api/leaderboards?metric=minutes&category=Cardio').data)
+        assert [e['name'] for e in cardio['leaderboard']] == ['Bob', 'Alice']
+        
+        sessions = json.loads(client.get('/api/leaderboards?metric=sessions&limit=1').data)
+        assert [(e['name'], e['score']) for e in sessions['leaderboard']] == [('Alice', 2)]
+    
+    def test_invalid_metric(self, authenticated_client):
+        """Test unknown metrics are rejected"""
+        assert authenticated_client.get('/api/leaderboards?metric=steps').status_code == 400
+    
+    def test_top_k_keeps_best(self):
+        """Test only the best K are ordered and drops trigger a rebuild"""
+        board = TopK(2)
+        for member, score in (('a', 5), ('b', 3), ('c', 4), ('d', 1)):
+            board.set(member, score)
+        assert board.top() == [(5, 'a'), (4, 'c')]
+        
+        board.set('a', 2)
+        assert board.top() == [(4, 'c'), (3, 'b')]
+    
+    def test_old_weeks_roll_off(self):
+        """Test weeks beyond the retention window are dropped"""
+        boards = Leaderboards(k=5, retention_weeks=2)
+        for day in ('2026-01-05', '2026-01-12', '2026-01-19'):
+            boards.record('alice', {'timestamp': f'{day}T10:00:00', 'category': 'Cardio',
+                                    'duration': 10, 'calories': 50.0})
+        
+        assert boards.top('2026-W02', 'minutes') == []
+        assert boards.top('2026-W04', 'minutes') == [('alice', 10)]
+
+
+class TestAdminStats:
+    """Test gym-wide statistics for staff"""
+    
+    @pytest.fixture
+    def admin_client(self, client):
+        app.config['ADMIN_USERS'] = {'staff'}
+        yield client
+        app.config['ADMIN_USERS'] = set()
+    
+    def test_stats_from_counters(self, admin_client):
+        """Test counters reflect registrations and logged workouts"""
+        register_and_login(admin_client, 'member', weight=95)
+        admin_client.post('/api/workouts', content_type='application/json',
+                           data=json.dumps({'category': 'Cardio', 'exercise': 'Bike', 'duration': 40}))
+        register_and_login(admin_client, 'staff')
+        
+        response = admin_client.get('/api/admin/stats')
+        assert response.status_code == 200
+        stats = json.loads(response.data)['stats']
+        assert stats['members'] == 2
+        assert stats['workouts'] == 1
+        assert stats['minutes_by_category'] == {'Cardio': 40}
+        assert stats['bmi']['bands']['obese'] == 1
+        assert stats['bmi']['bands']['normal'] == 1
+        assert list(stats['active_users_per_day'].values()) == [1]
+        assert sum(stats['registrations_per_week'].values()) == 2
+    
+    def test_verify_matches_full_scan(self, admin_client):
+        """Test the full-scan recompute agrees with the counters"""
+        register_and_login(admin_client, 'staff')
+        admin_client.post('/api/workouts', content_type='application/json',
+                          data=json.dumps({'category': 'Strength', 'exercise': 'Squat', 'duration': 20}))
+        
+        report = json.loads(admin_client.get('/api/admin/stats/verify').data)
+        assert report['mismatches'] == []
+    
+    def test_members_cannot_read_stats(self, authenticated_client):
+        """Test non-staff get 403"""
+        assert authenticated_client.get('/api/admin/stats').status_code == 403
+    
+    def test_hyperloglog_merges_shards(self):
+        """Test sketches from two shards count the union of users"""
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(1000):
+            first.add(f'user{i}')
+        for i in range(500, 1500):
+            second.add(f'user{i}')
+        
+        first.merge(second)
+        assert abs(first.count() - 1500) < 1500 * 0.05
+
+
+class TestTrendingExercises:
+    """Test approximate gym-wide popular exercise tracking"""
+    
+    def test_space_saving_error_bound(self):
+        """Test estimates never undercount and stay within N / capacity"""
+        summary = SpaceSaving(capacity=5)
+        stream = ['squat'] * 40 + ['row'] * 25 + [f'rare{i}' for i in range(35)]
+        for item in stream:
+            summary.add(item)
+        
+        bound = len(stream) / summary.capacity
+        assert 40 <= summary.counters['squat'][0] <= 40 + bound
+        assert 25 <= summary.counters['row'][0] <= 25 + bound
+        assert len(summary.counters) == 5
+    
+    def test_windows_merge_buckets(self):
+        """Test hour and day windows cover the right buckets"""
+        trending = TrendingExercises(capacity=10, hours=48, days=30)
+        now = datetime(2026, 10, 19, 12, 30)
+        for hours_ago, exercise, times in ((0, 'Bench Press', 3), (1, 'bench  press', 2), (5, 'Deadlift', 4)):
+            for _ in range(times):
+                trending.record(exercise, now - timedelta(hours=hours_ago))
+        
+        last_hour = trending.top('hour', 1, now=now)
+        assert last_hour['exercises'] == [{'exercise': 'bench press', 'count': 3, 'max_error': 0}]
+        
+        last_day = trending.top('day', 1, now=now)
+        assert [(e['exercise'], e['count']) for e in last_day['exercises']] == [('bench press', 5), ('deadlift', 4)]
+        assert last_day['total'] == 9
+    
+    def test_admin_endpoint(self, client):
+        """Test staff can query trending exercises"""
+        app.config['ADMIN_USERS'] = {'staff'}
+        try:
+            register_and_login(client, 'staff')
+            for exercise in ('Rowing', 'rowing', 'Squat'):
+                client.post('/api/workouts', content_type='application/json',
+                            data=json.dumps({'category': 'Strength', 'exercise': exercise, 'duration': 10}))
+            
+            data = json.loads(client.get('/api/admin/exercises/trending?hours=1').data)
+            assert data['exercises'][0] == {'exercise': 'rowing', 'count': 2, 'max_error': 0}
+            assert client.get('/api/admin/exercises/trending?days=99').status_code == 400
+        finally:
+            app.config['ADMIN_USERS'] = set()
+
+
+class TestProfileUpdates:
+    """Test profile updates and weight-history calorie recomputation"""
+
+    def seed(self, timestamps):
+        for timestamp in timestamps:
+            app_module.store_workout('alice', {'exercise': 'Intervals', 'duration': 60, 'category': 'Cardio',
+                                               'timestamp': timestamp,
+                                               'calories': calculate_calories('Cardio', 60, 70)})
+    
+    def test_batch_matches_scalar(self):
+        """Test the vectorised calculation agrees with calculate_calories"""
+        rows = [('Cardio', 30, 70.0), ('Strength', 45, 82.5), ('Unknown', 10, 55.0)]
+        batch = calculate_calories_batch(*zip(*rows))
+        assert batch.tolist() == pytest.approx([calculate_calories(*row) for row in rows])
+    
+    def register(self, client):
+        register_and_login(client, 'alice', weight=70)
+        users_db['alice']['weight_history'][0]['effective'] = '2019-01-01T00:00:00'
+    
+    def test_weight_change_recomputes_covered_workouts(self, client):
+        """Test workouts use the weight valid when they were logged"""
+        self.register(client)
+        self.seed(['2020-01-01T08:00:00', '2026-05-01T08:00:00', '2026-07-01T08:00:00'])
+        
+        response = client.patch('/api/profile', content_type='application/json',
+                                data=json.dumps({'weight': 60, 'effective': '2026-06-01'}))
+        data = json.loads(response.data)
+        assert data['recomputed_workouts'] == 1
+        assert data['profile']['weight'] == 60
+        assert 'password' not in data['profile']
+        
+        calories = {w['timestamp'][:7]: w['calories'] for w in workouts_db['alice']['Cardio']}
+        assert calories == {'2020-01': 560.0, '2026-05': 560.0, '2026-07': 480.0}
+        
+        # A late entry for an earlier date leaves the current weight alone
+        client.patch('/api/profile', content_type='application/json',
+                     data=json.dumps({'weight': 80, 'effective': '2026-04-01'}))
+        profile = json.loads(client.get('/api/profile').data)['profile']
+        assert profile['weight'] == 60
+        assert [entry['weight'] for entry in profile['weight_history']] == [70, 80, 60]
+        calories = {w['timestamp'][:7]: w['calories'] for w in workouts_db['alice']['Cardio']}
+        assert calories == {'2020-01': 560.0, '2026-05': 640.0, '2026-07': 480.0}
+    
+    def test_derived_stores_follow(self, client):
+        """Test BMI, gym stats and leaderboards reflect the update"""
+        self.register(client)
+        client.post('/api/workouts', content_type='application/json',
+                    data=json.dumps({'category': 'Cardio', 'exercise': 'Running', 'duration': 60}))
+        
+        response = client.patch('/api/profile', content_type='application/json',
+                                data=json.dumps({'weight': 95, 'effective': '2020-01-01'}))
+        profile = json.loads(response.data)['profile']
+        assert profile['bmi'] == round(95 / 1.7 ** 2, 2)
+        
+        board = json.loads(client.get('/api/leaderboards?metric=calories').data)['leaderboard']
+        assert board[0]['score'] == calculate_calories('Cardio', 60, 95, exercise='Running')
+        assert app_module.compare_gym_stats(gym_stats.snapshot(), app_module.recompute_gym_stats()) == []
+    
+    def test_invalid_values(self, authenticated_client):
+        """Test bad numbers are rejected"""
+        for body in ({'weight': -5}, {'age': 'old'}, {'weight': 70, 'effective': 'yesterday'}):
+            response = authenticated_client.patch('/api/profile', data=json.dumps(body),
+                                                  content_type='application/json')
+            assert response.status_code == 400
+
+    def test_future_weight_is_not_current(self, authenticated_client):
+        """Test a weight dated in the future neither replaces today's weight nor is accepted as a profile edit"""
+        tomorrow = (datetime.now() + timedelta(days=1)).isoformat()
+        response = authenticated_client.patch('/api/profile', content_type='application/json',
+                                              data=json.dumps({'weight': 120, 'effective': tomorrow}))
+        assert response.status_code == 400
+        
+        authenticated_client.post('/api/metrics', content_type='application/json',
+                                  data=json.dumps({'weight': 120, 'timestamp': tomorrow}))
+        assert users_db['testuser']['weight'] == 70
+
+    def test_invalid_profile_edit_leaves_record_unchanged(self, authenticated_client):
+        """Test a bad gender or non-finite number is rejected before any field is written"""
+        before = dict(users_db['testuser'])
+        for change in ({'gender': 5, 'age': 41}, {'gender': 'robot'}, {'weight': 'inf'}, {'height': 'nan', 'name': 'X'}):
+            response = authenticated_client.patch('/api/profile', content_type='application/json',
+                                                  data=json.dumps(change))
+            assert response.status_code == 400
+        assert users_db['testuser'] == before
+        
+        response = authenticated_client.patch('/api/profile', content_type='application/json',
+                                              data=json.dumps({'gender': 'Female'}))
+        assert json.loads(response.data)['profile']['gender'] == 'female'
+        assert authenticated_client.get('/api/metrics').status_code == 200
+
+
+class TestBodyMetrics:
+    """Test body-metric series, smoothing and weekly rollups"""
+
+    def test_backfill_matches_in_order_smoothing(self):
+        """Test a backdated reading re-smooths to the same result as in-order logging"""
+        start = datetime(2026, 9, 1, 7, 0)
+        readings = [(start + timedelta(days=day), 80 - day * 0.2 + (day % 3) * 0.5) for day in range(30)]
+        
+        in_order = MetricSeries(7 * 86400)
+        for moment, value in readings:
+            in_order.add(moment, value)
+        backfilled = MetricSeries(7 * 86400)
+        for moment, value in readings[:10] + readings[11:] + readings[10:11]:
+            backfilled.add(moment, value)
+        
+        assert list(backfilled.smoothed) == pytest.approx(list(in_order.smoothed))
+        assert backfilled.trend(4) == in_order.trend(4)
+    
+    def test_weekly_rollups(self):
+        """Test rollups aggregate each ISO week"""
+        series = MetricSeries(7 * 86400)
+        for day, value in ((5, 81.0), (6, 80.0), (7, 79.0), (12, 78.0)):  # Mon 5 Oct 2026 starts a week
+            series.add(datetime(2026, 10, day, 7, 0), value)
+        
+        trend = series.trend(2)
+        assert [(w['week'], w['count'], w['average'], w['min'], w['max']) for w in trend['weekly']] == [
+            ('2026-W41', 3, 80.0, 79.0, 81.0), ('2026-W42', 1, 78.0, 78.0, 78.0)]
+        assert trend['latest'] == 78.0 and trend['first'] == 81.0
+        assert 78.0 < trend['smoothed'] < 80.0  # lags the latest reading
+        assert trend['weekly_change'] == pytest.approx(trend['smoothed'] - trend['weekly'][0]['smoothed'], abs=0.02)
+    
+    def test_same_moment_replaces_reading(self):
+        """Test re-recording a moment corrects the reading instead of adding a second one"""
+        series = MetricSeries(7 * 86400)
+        corrected = MetricSeries(7 * 86400)
+        for day, value in ((5, 81.0), (6, 90.0), (7, 79.0)):
+            series.add(datetime(2026, 10, day, 7, 0), value)
+            corrected.add(datetime(2026, 10, day, 7, 0), 80.0 if day == 6 else value)
+        series.add(datetime(2026, 10, 6, 7, 0), 80.0)
+        
+        assert series.trend(1) == corrected.trend(1)
+        assert series.trend(1)['weekly'][0]['count'] == 3
+        assert series.trend(1)['weekly'][0]['max'] == 81.0
+    
+    def test_profile_correction_is_one_reading(self, authenticated_client):
+        """Test correcting a dated weight through the profile keeps one reading for that date"""
+        for weight in (75, 72):
+            authenticated_client.patch('/api/profile', content_type='application/json',
+                                       data=json.dumps({'weight': weight, 'effective': '2026-06-01'}))
+        weight = json.loads(authenticated_client.get('/api/metrics').data)['metrics']['weight']
+        assert weight['readings'] == 2  # registration plus the corrected date
+        assert weight['first'] == 72
+    
+    def test_non_finite_readings_rejected(self, authenticated_client):
+        """Test nan and inf measurements are rejected and nothing is recorded"""
+        for reading in ({'waist': 'nan'}, {'weight': 'inf'}, {'weight': 71, 'hips': '-inf'}):
+            response = authenticated_client.post('/api/metrics', content_type='application/json',
+                                                 data=json.dumps(reading))
+            assert response.status_code == 400
+        metrics = json.loads(authenticated_client.get('/api/metrics').data)['metrics']
+        assert metrics['weight']['readings'] == 1
+        assert 'waist' not in metrics
+    
+    def test_endpoint_updates_profile(self, client):
+        """Test logged weights feed the profile and BMI/BMR changes"""
+        register_and_login(client, 'alice', weight=80)
+        two_weeks_ago = (datetime.now() - timedelta(days=14)).isoformat()
+        client.post('/api/metrics', content_type='application/json',
+                    data=json.dumps({'weight': 78, 'timestamp': two_weeks_ago}))
+        assert users_db['alice']['weight'] == 80  # a backdated reading is not the current weight
+        
+        response = client.post('/api/metrics', content_type='application/json',
+                               data=json.dumps({'weight': 76, 'waist': 84}))
+        data = json.loads(response.data)
+        assert users_db['alice']['weight'] == 76
+        assert data['metrics']['weight']['readings'] == 3
+        assert data['metrics']['waist']['latest'] == 84
+        assert 76 < data['metrics']['weight']['smoothed'] < 80
+        assert data['bmi']['start'] == round(78 / 1.7 ** 2, 2)
+        assert data['bmi']['change'] > 0 and data['bmr']['change'] > 0
+        
+        assert client.post('/api/metrics', content_type='application/json',
+                           data=json.dumps({'height': 180})).status_code == 400
+
+
+class TestWorkoutSamples:
+    """Test compressed per-workout sensor samples"""
+
+    def heart_rate(self, seconds):
+        import numpy as np
+        rng = np.random.default_rng(7)
+        return np.clip(120 + np.cumsum(rng.integers(-1, 2, seconds)), 60, 200)
+    
+    def test_round_trip_and_size(self):
+        """Test an hour of per-second heart rate decodes exactly and stays small"""
+        hr = self.heart_rate(3600)
+        series = SampleSeries(scale=1, chunk_size=512)
+        series.append(range(1800), hr[:1800])
+        series.append(range(1800, 3600), hr[1800:])  # re-encodes only the partial chunk
+        
+        times, values = series.decode()
+        assert values.tolist() == hr.tolist()
+        assert times.tolist() == list(range(3600))
+        assert [chunk[2] for chunk in series.chunks] == [512] * 7 + [16]
+        assert series.nbytes() < 8 * 1024
+        assert series.stats()['max'] == hr.max()
+        
+        with pytest.raises(ValueError):
+            series.append([10], [100])  # before the last sample
+    
+    def test_lttb_keeps_extremes(self):
+        """Test downsampling keeps the endpoints and a sharp peak"""
+        import numpy as np
+        times = np.arange(1000, dtype=float)
+        values = np.full(1000, 100.0)
+        values[437] = 190
+        
+        sampled_times, sampled_values = downsample_lttb(times, values, 50)
+        assert len(sampled_times) == 50
+        assert sampled_times[0] == 0 and sampled_times[-1] == 999
+        assert 190 in sampled_values
+    
+    def test_endpoint(self, authenticated_client):
+        """Test samples are attached to the member's own workout and read back downsampled"""
+        response = authenticated_client.post('/api/workouts', content_type='application/json',
+                                             data=json.dumps({'category': 'Cardio', 'exercise': 'Running',
+                                                              'duration': 60}))
+        workout_id = json.loads(response.data)['workout']['id']
+        url = f'/api/workouts/{workout_id}/samples/heart_rate'
+        
+        hr = self.heart_rate(3600).tolist()
+        response = authenticated_client.post(url, content_type='application/json',
+                                             data=json.dumps({'values': hr, 'interval': 1}))
+        assert json.loads(response.data)['count'] == 3600
+        
+        data = json.loads(authenticated_client.get(f'{url}?points=120').data)
+        assert len(data['points']) == 120
+        assert data['points'][0] == [0, hr[0]]
+        assert data['stats']['min'] == min(hr)
+        for points in (0, -5, 2):
+            assert authenticated_client.get(f'{url}?points={points}').status_code == 400
+        
+        assert authenticated_client.get(f'/api/workouts/{workout_id}/samples/steps').status_code == 400
+        assert authenticated_client.get('/api/workouts/unknown/samples/heart_rate').status_code == 404
+        assert authenticated_client.post(url, content_type='application/json',
+                                         data=json.dumps({'samples': [[5, 'fast']]})).status_code == 400
+
+
+class TestCalorieEngine:
+    """Test per-exercise METs, heart-rate estimates and the batch API"""
+
+    def test_exercise_met(self):
+        """Test catalog exercises use their own MET and others their category's"""
+        assert calculate_calories('Cardio', 60, 70, 'Running') == round(9.8 * 70, 2)
+        assert calculate_calories('Cardio', 60, 70, 'jump rope') == round(12.3 * 70, 2)
+        assert calculate_calories('Cardio', 60, 70, 'Underwater Hockey') == calculate_calories('Cardio', 60, 70)
+    
+    def test_heart_rate_estimate(self):
+        """Test the Keytel equation is used when heart rate and age are known"""
+        expected = (-55.0969 + 0.6309 * 150 + 0.1988 * 80 + 0.2017 * 40) / 4.184 * 30
+        assert calculate_calories('Cardio', 30, 80, 'Running', heart_rate=150, age=40, gender='Male') == \
+            round(expected, 2)
+        # An implausibly low heart rate gives a negative estimate; fall back to METs
+        assert calculate_calories('Cardio', 30, 80, 'Running', heart_rate=40, age=40, gender='male') == \
+            calculate_calories('Cardio', 30, 80, 'Running')
+    
+    def test_batch_matches_scalar(self):
+        """Test every branch of the batch API agrees with the scalar form"""
+        rows = [('Cardio', 30, 80.0, 'Running', 150, 40, 'male'),
+                ('Strength', 45, 62.5, 'Deadlift', None, 35, 'female'),
+                ('Cardio', 20, 70.0, 'Cycling', 135, 28, 'female'),
+                ('Cardio', 30, 80.0, 'Running', 40, 40, 'male'),
+                ('Workout', 10, 90.0, None, None, None, None)]
+        categories, durations, weights, exercises, heart_rates, ages, genders = zip(*rows)
+        batch = calculate_calories_batch(categories, durations, weights, exercises=exercises,
+                                         heart_rates=heart_rates, ages=ages, genders=genders)
+        assert batch.tolist() == pytest.approx([calculate_calories(*row) for row in rows])
+    
+    def test_samples_update_calories(self, authenticated_client):
+        """Test attaching heart-rate samples re-estimates the workout"""
+        response = authenticated_client.post('/api/workouts', content_type='application/json',
+                                             data=json.dumps({'category': 'Cardio', 'exercise': 'Running',
+                                                              'duration': 30}))
+        workout = json.loads(response.data)['workout']
+        assert workout['calories'] == calculate_calories('Cardio', 30, 70, 'Running')
+        
+        response = authenticated_client.post(f"/api/workouts/{workout['id']}/samples/heart_rate",
+                                             content_type='application/json',
+                                             data=json.dumps({'values': [140] * 1800}))
+        expected = calculate_calories('Cardio', 30, 70, 'Running', heart_rate=140, age=25, gender='male')
+        assert json.loads(response.data)['calories'] == expected
+        assert leaderboards.top(Leaderboards.week_key(datetime.now()), 'calories')[0][1] == expected
+
+
+class TestWorkoutRecords:
+    """Test incrementally maintained streaks, consistency and personal records"""
+
+    def workout(self, day, exercise='Running', duration=30, calories=200.0):
+        return {'exercise': exercise, 'duration': duration, 'category': 'Cardio',
+                'timestamp': f'2026-10-{day:02d}T07:00:00', 'calories': calories}
+    
+    def test_backfill_joins_streaks(self):
+        """Test a backfilled day bridges two streaks and any order gives the same result"""
+        today = date(2026, 10, 15)
+        days = [1, 2, 4, 5, 9, 10, 11, 14, 3]
+        
+        records = WorkoutRecords(4)
+        for day in days[:-1]:
+            records.record('alice', self.workout(day))
+        assert records.summary('alice', ('streaks',), today)['streaks']['longest'] == 3
+        
+        records.record('alice', self.workout(days[-1]))
+        streaks = records.summary('alice', ('streaks',), today)['streaks']
+        assert streaks == {'current': 1, 'longest': 5, 'longest_from': '2026-10-01',
+                           'longest_to': '2026-10-05', 'last_active': '2026-10-14'}
+        
+        shuffled = WorkoutRecords(4)
+        for day in sorted(days, reverse=True):
+            shuffled.record('alice', self.workout(day))
+        assert shuffled.summary('alice', SUMMARY_FIELDS, today) == records.summary('alice', SUMMARY_FIELDS, today)
+        
+        # The streak lapses once a whole day passes without a workout
+        assert records.summary('alice', ('streaks',), date(2026, 10, 16))['streaks']['current'] == 0
+    
+    def test_consistency_and_records(self):
+        """Test weekly consistency and per-exercise records"""
+        records = WorkoutRecords(4)
+        for day, duration in ((1, 30), (2, 45), (13, 20), (14, 45), (14, 50)):  # Mon 12 Oct 2026 starts a week
+            records.record('alice', self.workout(day, duration=duration, calories=duration * 5.0))
+        records.record('alice', self.workout(13, exercise='Rowing', duration=25))
+        
+        summary = records.summary('alice', ('consistency', 'personal_records'), date(2026, 10, 15))
+        consistency = summary['consistency']
+        assert [(w['week'], w['days']) for w in consistency['by_week']] == [
+            ('2026-W39', 0), ('2026-W40', 2), ('2026-W41', 0), ('2026-W42', 2)]
+        assert (consistency['active_weeks'], consistency['ratio'], consistency['week_streak']) == (2, 0.5, 1)
+        
+        running = summary['personal_records']['Running']
+        assert running['sessions'] == 5
+        assert running['duration'] == {'value': 50, 'date': '2026-10-14'}
+        assert running['calories'] == {'value': 250.0, 'date': '2026-10-14'}
+        assert summary['personal_records']['Rowing']['sessions'] == 1
+    
+    def test_records_follow_recomputed_calories(self, client):
+        """Test a record holder whose calories fall hands the record back"""
+        register_and_login(client, 'alice', weight=70)
+        users_db['alice']['weight_history'][0]['effective'] = '2019-01-01T00:00:00'
+        for timestamp in ('2026-05-01T08:00:00', '2026-07-01T08:00:00'):
+            app_module.store_workout('alice', {'exercise': 'Intervals', 'duration': 60, 'category': 'Cardio',
+                                               'timestamp': timestamp,
+                                               'calories': calculate_calories('Cardio', 60, 70)})
+        
+        def calorie_record():
+            summary = json.loads(client.get('/api/workouts/summary?fields=personal_records').data)['summary']
+            return summary['personal_records']['Intervals']['calories']
+        
+        assert calorie_record() == {'value': 560.0, 'date': '2026-05-01'}
+        client.patch('/api/profile', content_type='application/json',
+                     data=json.dumps({'weight': 90, 'effective': '2026-06-01'}))
+        assert calorie_record() == {'value': 720.0, 'date': '2026-07-01'}
+        client.patch('/api/profile', content_type='application/json',
+                     data=json.dumps({'weight': 50, 'effective': '2026-06-15'}))
+        assert calorie_record() == {'value': 560.0, 'date': '2026-05-01'}
+    
+    def test_summary_and_dashboard(self, authenticated_client):
+        """Test today's workout starts a streak shown in the summary and dashboard"""
+        authenticated_client.post('/api/workouts', content_type='application/json',
+                                  data=json.dumps({'category': 'Cardio', 'exercise': 'Running', 'duration': 30}))
+        
+        summary = json.loads(authenticated_client.get('/api/workouts/summary').data)['summary']
+        assert summary['streaks']['current'] == 1
+        assert summary['consistency']['by_week'][-1]['days'] == 1
+        assert summary['personal_records']['Running']['duration']['value'] == 30
+        
+        page = authenticated_client.get('/dashboard').data.decode()
+        assert 'Current Streak' in page and 'Personal Records' in page
+
+
+class TestGoals:
+    """Test weekly and monthly goals with calendar rollover"""
+
+    def workout(self, timestamp, duration=30, calories=200.0):
+        return {'exercise': 'Running', 'duration': duration, 'category': 'Cardio',
+                'timestamp': timestamp, 'calories': calories}
+    
+    def test_rollover(self):
+        """Test counters reset when the week or month turns, without a rescan"""
+        goals = {'week': {'minutes': 150, 'sessions': 3}, 'month': {'calories': 1000}}
+        tracker = GoalTracker()
+        now = datetime(2026, 10, 28, 12, 0)  # Wednesday of the last week of October
+        for timestamp in ('2026-10-26T07:00:00', '2026-10-27T07:00:00', '2026-10-20T07:00:00'):
+            tracker.record('alice', self.workout(timestamp), now=now)
+        tracker.record('alice', self.workout('2026-09-30T07:00:00'), now=now)  # closed month: ignored
+        
+        status = tracker.status('alice', goals, now=now)
+        assert status['week']['period'] == '2026-W44'
+        assert (status['week']['starts'], status['week']['ends']) == ('2026-10-26', '2026-11-01')
+        assert status['week']['goals']['minutes'] == {'target': 150, 'progress': 60, 'remaining': 90,
+                                                      'percent': 40.0, 'on_track': True}
+        assert status['month']['goals']['calories']['progress'] == 600.0
+        
+        # Monday 2 November: both the week and the month start again
+        status = tracker.status('alice', goals, now=datetime(2026, 11, 2, 9, 0))
+        assert status['week']['goals']['sessions']['progress'] == 0
+        assert status['month']['period'] == '2026-11' and status['month']['goals']['calories']['progress'] == 0
+        assert not status['month']['goals']['calories']['on_track']  # a day in with nothing logged
+    
+    def test_endpoint(self, client):
+        """Test goals start from the default, can be changed and show progress"""
+        register_and_login(client, 'alice')
+        data = json.loads(client.get('/api/goals').data)
+        assert data['goals'] == {'week': {'calories': 2000}}
+        
+        response = client.patch('/api/goals', content_type='application/json', data=json.dumps(
+            {'week': {'calories': None, 'minutes': 150}, 'month': {'sessions': 12}}))
+        assert json.loads(response.data)['goals'] == {'week': {'minutes': 150}, 'month': {'sessions': 12}}
+        
+        client.post('/api/workouts', content_type='application/json',
+                    data=json.dumps({'category': 'Cardio', 'exercise': 'Running', 'duration': 45}))
+        status = json.loads(client.get('/api/goals').data)['status']
+        assert status['week']['goals']['minutes']['progress'] == 45
+        assert status['month']['goals']['sessions']['progress'] == 1
+        
+        for bad in ({'year': {'sessions': 1}}, {'week': {'steps': 1}}, {'week': {'minutes': -5}},
+                    {'week': {'minutes': 'nan'}}, {'month': {'calories': 'inf'}}):
+            assert client.patch('/api/goals', content_type='application/json',
+                                data=json.dumps(bad)).status_code == 400
+        
+        assert 'This Month' in client.get('/dashboard').data.decode()
+
+
+class TestMealPlan:
+    """Test meal plans on the diet page and API"""
+
+    def test_api(self, client):
+        """Test the plan follows the member's calorie target and filters"""
+        register_and_login(client, 'alice')
+        data = json.loads(client.get('/api/meal-plan?diet=vegan').data)
+        target = round(users_db['alice']['bmr'] * 1.55)
+        assert abs(data['plan']['calories'] - target) <= 25
+        assert data['plan']['diet'] == ['vegan']
+        
+        custom = json.loads(client.get('/api/meal-plan?calories=3000').data)['plan']
+        assert custom['calories'] == 3000 and [meal['meal'] for meal in custom['meals']] == [
+            'breakfast', 'lunch', 'dinner', 'snacks']
+        
+        for bad in ('?diet=paleo', '?calories=-100', '?calories=lots'):
+            assert client.get('/api/meal-plan' + bad).status_code == 400
+    
+    def test_diet_page_filters(self, client):
+        """Test the diet page shows the filtered plan and ignores unknown filters"""
+        register_and_login(client, 'alice')
+        page = client.get('/diet?diet=vegan&diet=bogus').data.decode()
+        assert 'Your Meal Plan' in page
+        assert 'value="vegan" checked' in page
+        assert 'Chicken breast' not in page
+
+
+class TestWorkoutPlans:
+    """Test incremental training features and next week's plan"""
+    
+    NOW = datetime(2026, 10, 28, 20, 0)
+
+    def workouts(self, days, category='Cardio', exercise='Running', duration=40):
+        return [{'exercise': exercise, 'duration': duration, 'category': category, 'calories': duration * 8.0,
+                 'timestamp': (self.NOW - timedelta(days=day)).replace(hour=7).isoformat()} for day in days]
+    
+    def targets(self, features, user_ids, goals=None):
+        goals = np.full((len(user_ids), 3), np.nan) if goals is None else np.array(goals, dtype=float)
+        return plan_targets(features.snapshot(user_ids, self.NOW), goals)
+    
+    def test_features_ignore_logging_order(self):
+        """Test backfilled workouts give the same features as in-order logging"""
+        entries = self.workouts(range(0, 40, 2)) + self.workouts([3, 10, 17], 'Strength', 'Squat', 30)
+        in_order, shuffled = TrainingFeatures(7, 28), TrainingFeatures(7, 28)
+        for entry in sorted(entries, key=lambda entry: entry['timestamp']):
+            in_order.record('alice', entry)
+        for entry in entries[::3] + entries[1::3] + entries[2::3]:
+            shuffled.record('alice', entry)
+        
+        assert shuffled.snapshot(['alice'], self.NOW) == pytest.approx(in_order.snapshot(['alice'], self.NOW))
+        assert not in_order.snapshot(['nobody'], self.NOW).any()
+    
+    def test_targets(self):
+        """Test balance, load spikes, beginners and goals in one vectorised pass"""
+        features = TrainingFeatures(7, 28)
+        for entry in self.workouts(range(0, 42, 2)):  # six weeks of cardio only
+            features.record('runner', entry)
+        for entry in self.workouts(range(7, 42, 2), duration=30) + self.workouts(range(7), duration=90):
+            features.record('spiker', entry)
+        
+        members = ['runner', 'spiker', 'newcomer', 'goal-setter']
+        goals = [[np.nan] * 3] * 3 + [[np.nan, 150, 5]]  # GOAL_METRICS: calories, minutes, sessions
+        targets = self.targets(features, members, goals)
+        
+        assert list(targets['focus']) == ['build', 'hold', 'start', 'start']
+        cardio, strength = PLAN_CATEGORIES.index('Cardio'), PLAN_CATEGORIES.index('Strength')
+        runner_minutes = targets['sessions'][0] * targets['session_minutes'][0]
+        assert runner_minutes[strength] > runner_minutes[cardio]  # pulled towards the neglected category
+        planned = (targets['sessions'] * targets['session_minutes']).sum(axis=1)
+        assert targets['load_ratio'][1] > 1.3 and planned[1] <= targets['chronic_minutes'][1] * 1.05
+        assert targets['sessions'][2].sum() == 3 and planned[2] >= 90
+        assert targets['sessions'][3].sum() == 5
+    
+    def test_api_and_page(self, client):
+        """Test the plan uses the member's exercises and is rebuilt when goals change"""
+        register_and_login(client, 'alice')
+        for _ in range(3):
+            client.post('/api/workouts', content_type='application/json',
+                        data=json.dumps({'category': 'Strength', 'exercise': 'Deadlift', 'duration': 45}))
+        
+        plan = json.loads(client.get('/api/plan').data)['plan']
+        assert len(plan['days']) == 7 and plan['days'][0]['day'] == 'Monday'
+        assert len([day for day in plan['days'] if not day['rest']]) == plan['sessions']
+        assert json.loads(client.get('/api/plan').data)['plan'] == plan  # stored until the inputs change
+        
+        client.patch('/api/goals', content_type='application/json', data=json.dumps({'week': {'sessions': 6}}))
+        plan = json.loads(client.get('/api/plan').data)['plan']
+        assert plan['sessions'] == 6
+        assert 'Deadlift' in [day.get('exercise') for day in plan['days'] if day.get('category') == 'Strength']
+        assert "Next Week's Plan" in client.get('/plan').data.decode()
+    
+    def test_nightly_batch(self, client, monkeypatch):
+        """Test the batch job builds a plan for every member, a chunk of members at a time"""
+        monkeypatch.setattr(app_module, 'PLAN_CHUNK_MEMBERS', 2)
+        app.config['ADMIN_USERS'] = {'staff'}
+        try:
+            for user_id in ('alice', 'bob', 'staff'):
+                register_and_login(client, user_id)
+            response = client.post('/api/admin/plans')
+            assert response.status_code == 202
+            job = wait_for_job(client, json.loads(response.data)['job']['status_url'])
+            assert job['status'] == 'done', job['error']
+            assert json.loads(client.get(job['result_url']).data)['result']['members'] == 3
+            assert sorted(workout_plans_db) == ['alice', 'bob', 'staff']
+        finally:
+            app.config['ADMIN_USERS'] = set()
+
+
+class TestActivityImport:
+    """Test importing wearable activity files as workouts"""
+
+    def activities(self):
+        return [
+            {'sport': 'running', 'start': '2026-10-01T07:00:00', 'duration_seconds': 1800,
+             'heart_rate': [[0, 120], [1, 122], [2, 125]]},
+            {'sport': 'Biking', 'start': '2026-10-02T18:00:00', 'duration_seconds': 3600},
+            {'sport': 'running', 'start': 'yesterday', 'duration_seconds': 60}
+        ]
+    
+    def test_json_batch(self, client):
+        """Test parsed activities become workouts with MET calories and samples"""
+        register_and_login(client, 'alice', weight=70)
+        users_db['alice']['weight_history'][0]['effective'] = '2019-01-01T00:00:00'
+        
+        response = client.post('/api/workouts/import', content_type='application/json',
+                               data=json.dumps({'activities': self.activities()}))
+        assert json.loads(response.data) == {'success': True, 'imported': 2, 'skipped': 0, 'rejected': 1}
+        
+        run, ride = workouts_db['alice']['Cardio']
+        heart_rate_calories = calculate_calories('Cardio', 30, 70, 'Running', heart_rate=367 / 3, age=30, gender='female')
+        assert (run['exercise'], run['duration'], run['calories']) == ('Running', 30, heart_rate_calories)
+        assert ride['calories'] == calculate_calories('Cardio', 60, 70, 'Cycling')
+        assert ride['exercise'] == 'Cycling'
+        assert workout_samples_db[(run['id'], 'heart_rate')].count == 3
+        
+        again = client.post('/api/workouts/import', content_type='application/json',
+                            data=json.dumps({'activities': self.activities()[:2]}))
+        assert json.loads(again.data)['skipped'] == 2
+    
+    def test_offset_start_is_stored_local(self, client):
+        """Test an offset-aware start is stored as local naive time and the dashboard still renders"""
+        register_and_login(client, 'alice')
+        start = datetime.now().replace(microsecond=0).astimezone(timezone.utc)
+        response = client.post('/api/workouts/import', content_type='application/json',
+                               data=json.dumps({'activities': [
+                                   {'sport': 'running', 'start': start.isoformat(), 'duration_seconds': 1800},
+                                   {'sport': 'running', 'start': 5, 'duration_seconds': 60}
+                               ]}))
+        assert json.loads(response.data)['rejected'] == 1
+        
+        run, = workouts_db['alice']['Cardio']
+        assert run['timestamp'] == start.astimezone().replace(tzinfo=None).isoformat()
+        assert client.get('/dashboard').status_code == 200
+    
+    def test_file_upload(self, client):
+        """Test an uploaded CSV is parsed in the background and inserted"""
+        import io
+        register_and_login(client, 'alice')
+        upload = io.BytesIO(b'start,sport,duration\n2026-10-03T06:30:00,Yoga,45\n2026-10-04T06:30:00,Swim,30\n')
+        response = client.post('/api/workouts/import', content_type='multipart/form-data',
+                               data={'file': (upload, 'activities.csv')})
+        assert response.status_code == 202
+        
+        job = wait_for_job(client, json.loads(response.data)['job']['status_url'])
+        assert job['status'] == 'done', job['error']
+        result = json.loads(client.get(job['result_url']).data)['result']
+        assert result == {'imported': 2, 'skipped': 0, 'rejected': 0, 'errors': []}
+        assert [w['exercise'] for w in workouts_db['alice']['Flexibility']] == ['Yoga']
+        
+        bad = client.post('/api/workouts/import', content_type='multipart/form-data',
+                          data={'file': (io.BytesIO(b'x'), 'notes.txt')})
+        assert bad.status_code == 400
+
+
+class TestExerciseCatalog:
+    """Test the exercise catalog and typeahead suggestions"""
+
+    def test_prefix_match_ignores_case_and_punctuation(self):
+        """Test names match on any word, whatever the spelling"""
+        catalog = ExerciseCatalog(EXERCISE_CATALOG)
+        assert catalog.lookup('benchpress')['name'] == 'Bench Press'
+        assert catalog.lookup('PUSH UPS')['name'] == 'Push-ups'
+        assert [s['name'] for s in catalog.suggest('bench p')] == ['Bench Press']
+        assert 'Overhead Press' in [s['name'] for s in catalog.suggest('pres')]
+        assert catalog.suggest('!!') == []
+    
+    def test_ranked_by_user_then_global_usage(self):
+        """Test a member's own favourites come first"""
+        catalog = ExerciseCatalog(EXERCISE_CATALOG)
+        for _ in range(3):
+            catalog.record_use('bob', 'Stretching', 'Flexibility')
+        catalog.record_use('alice', 'stair climber', 'Cardio')
+        
+        assert [s['name'] for s in catalog.suggest('st', 'alice')][:2] == ['Stair Climber', 'Stretching']
+        assert [s['name'] for s in catalog.suggest('st', 'bob')][0] == 'Stretching'
+    
+    def test_custom_exercises_shared_after_enough_members(self):
+        """Test an unknown exercise is canonicalised and only shared once popular"""
+        catalog = ExerciseCatalog(EXERCISE_CATALOG)
+        assert catalog.record_use('alice', '  Sled   Push ', 'Strength') == 'Sled Push'
+        assert catalog.record_use('bob', 'sled push', 'Strength') == 'Sled Push'
+        assert catalog.suggest('sled', 'carol') == []
+        assert catalog.suggest('sled', 'bob')[0] == {'name': 'Sled Push', 'category': 'Strength', 'met': 5.0}
+        
+        catalog.record_use('dave', 'SledPush', 'Strength')
+        assert [s['name'] for s in catalog.suggest('sled', 'carol')] == ['Sled Push']
+    
+    def test_suggest_endpoint_and_canonical_logging(self, authenticated_client):
+        """Test logged names are canonicalised and the endpoint answers"""
+        response = authenticated_client.post('/api/workouts', content_type='application/json',
+                                             data=json.dumps({'category': 'Strength', 'exercise': 'benchpress',
+                                                              'duration': 20}))
+        assert json.loads(response.data)['workout']['exercise'] == 'Bench Press'
+        
+        data = json.loads(authenticated_client.get('/api/exercises/suggest?q=be&limit=1').data)
+        assert data['suggestions'] == [{'name': 'Bench Press', 'category': 'Strength', 'met': 6.0}]
+    
+    def test_suggest_is_fast(self):
+        """Test a short prefix over a large catalog answers well under 5 ms"""
+        catalog = ExerciseCatalog([(f'Exercise {i}', 'Workout', 5.0) for i in range(20000)] + EXERCISE_CATALOG)
+        start = time.perf_counter()
+        for _ in range(20):
+            catalog.suggest('ex', 'alice')
+        assert (time.perf_counter() - start) / 20 < 0.005
+
+    def test_suggest_stays_fast_with_custom_exercises(self):
+        """Test ranking doesn't scan every exercise members have added"""
+        catalog = ExerciseCatalog(EXERCISE_CATALOG)
+        for i in range(20000):
+            catalog.record_use(f'member{i % 50}', f'Drill {i}', 'Workout')
+        for _ in range(5):
+            catalog.record_use('alice', 'Drill 77', 'Workout')
+        
+        start = time.perf_counter()
+        for _ in range(20):
+            catalog.suggest('dr', 'carol')
+        assert (time.perf_counter() - start) / 20 < 0.005
+        assert catalog.suggest('dr', 'alice')[0]['name'] == 'Drill 77'
+        assert catalog.suggest('drill7', 'alice')[0]['name'] == 'Drill 77'
+
+
+class TestWorkoutSearch:
+    """Test full-text search over workout history"""
+
+    def workout(self, exercise, timestamp):
+        return {'exercise': exercise, 'category': 'Strength', 'duration': 30,
+                'timestamp': timestamp, 'calories': 100.0}
+    
+    def test_terms_and_window(self):
+        """Test every term must match and the window is inclusive"""
+        index = WorkoutSearchIndex()
+        for exercise, timestamp in (('Romanian Deadlift', '2026-07-02T08:00:00'),
+                                    ('Deadlift', '2026-09-30T18:00:00'),
+                                    ('Deadlift', '2026-10-01T08:00:00'),
+                                    ('Bench Press', '2026-08-01T08:00:00')):
+            index.add('alice', self.workout(exercise, timestamp))
+        
+        workouts, total = index.search('alice', 'deadlift', since='2026-07-01', until='2026-09-30')
+        assert total == 2
+        assert [w['timestamp'][:10] for w in workouts] == ['2026-09-30', '2026-07-02']
+        assert index.search('alice', 'romanian DEADLIFT')[1] == 1
+        assert index.search('alice', 'deadlift squat') == ([], 0)
+        assert index.search('bob', 'deadlift') == ([], 0)
+        assert index.search('alice', '', since='2026-08-01', until='2026-08-01')[1] == 1
+    
+    def test_backfilled_workouts_stay_ordered(self):
+        """Test workouts added out of order come back newest first"""
+        index = WorkoutSearchIndex()
+        for day in (5, 1, 9, 3):
+            index.add('alice', self.workout('Squat', f'2026-10-0{day}T07:00:00'))
+        workouts, _ = index.search('alice', 'squat', limit=3)
+        assert [w['timestamp'][8:10] for w in workouts] == ['09', '05', '03']
+    
+    def test_large_history_is_fast(self):
+        """Test a rare term in a 100k-entry history answers quickly"""
+        index = WorkoutSearchIndex()
+        start = datetime(2020, 1, 1)
+        for i in range(100000):
+            exercise = 'Deadlift' if i % 1000 == 0 else 'Running'
+            index.add('alice', self.workout(exercise, (start + timedelta(hours=i)).isoformat()))
+        
+        began = time.perf_counter()
+        _, total = index.search('alice', 'deadlift', since='2021-01-01', until='2021-12-31')
+        assert time.perf_counter() - began < 0.01
+        assert total == 9
+    
+    def test_endpoint(self, client):
+        """Test members search their own history and only admins search others'"""
+        register_and_login(client, 'alice')
+        client.post('/api/workouts', content_type='application/json',
+                    data=json.dumps({'category': 'Strength', 'exercise': 'Deadlift', 'duration': 20}))
+        
+        data = json.loads(client.get('/api/workouts/search?q=deadlift&since=2020-01-01').data)
+        assert data['total'] == 1 and data['workouts'][0]['exercise'] == 'Deadlift'
+        assert client.get('/api/workouts/search?q=deadlift&since=last-week').status_code == 400
+        assert client.get('/api/workouts/search?q=deadlift&user=bob').status_code == 403
+    
+    def test_endpoint_normalizes_bounds(self, client):
+        """Test space-separated and basic-format bounds match the same workouts as extended ISO"""
+        register_and_login(client, 'alice')
+        for timestamp in ('2026-10-05T09:00:00', '2026-10-05T11:00:00', '2026-10-06T08:00:00'):
+            app_module.store_workout('alice', self.workout('Squat', timestamp))
+        
+        def total(query):
+            return json.loads(client.get(f'/api/workouts/search?q=squat&{query}').data)['total']
+        
+        assert total('since=2026-10-05T10:00') == total('since=2026-10-05 10:00') == 2
+        assert total('since=20261006') == total('since=2026-10-06') == 1
+        assert total('until=2026-10-05 10:00') == total('until=2026-10-05T10:00') == 1
+        assert total('until=20261005') == total('until=2026-10-05') == 2
+
+
+class TestColumnarExport:
+    """Test the month-partitioned Arrow/Parquet bulk export"""
+    
+    @pytest.fixture
+    def admin_client(self, client, tmp_path, monkeypatch):
+        app.config['ADMIN_USERS'] = {'staff'}
+        monkeypatch.setattr(app_module, 'COLUMNAR_EXPORT_DIR', str(tmp_path))
+        monkeypatch.setattr(app_module, 'COLUMNAR_BATCH_ROWS', 2)
+        register_and_login(client, 'staff')
+        yield client
+        app.config['ADMIN_USERS'] = set()
+    
+    def seed(self):
+        for user_id, day, exercise in (('alice', '2026-08-30', 'Rowing'), ('alice', '2026-09-01', 'Rowing'),
+                                       ('bob', '2026-09-02', 'Squat'), ('bob', '2026-09-03', 'Rowing'),
+                                       ('bob', '2026-09-04', 'Squat')):
+            app_module.store_workout(user_id, {'exercise': exercise, 'duration': 30, 'category': 'Strength',
+                                               'timestamp': f'{day}T07:30:00', 'calories': 150.0})
+    
+    def test_arrow_export_memory_maps(self, admin_client):
+        """Test Arrow IPC files are partitioned by month and dictionary-encoded"""
+        import pyarrow as pa
+        self.seed()
+        
+        response = admin_client.post('/api/admin/exports/workouts?format=arrow')
+        assert response.status_code == 202
+        job = wait_for_job(admin_client, json.loads(response.data)['job']['status_url'])
+        assert job['status'] == 'done', job['error']
+        
+        manifest = json.loads(admin_client.get(job['result_url']).data)['result']
+        assert manifest['rows'] == 5
+        assert [(f['month'], f['rows']) for f in manifest['files']] == [('2026-08', 1), ('2026-09', 4)]
+        
+        with pa.memory_map(manifest['files'][1]['path']) as source:
+            reader = pa.ipc.open_file(source)
+            assert reader.num_record_batches == 2  # COLUMNAR_BATCH_ROWS rows per batch
+            table = reader.read_all()
+        assert table.num_rows == 4
+        assert pa.types.is_dictionary(table.schema.field('exercise').type)
+        assert sorted(table.column('exercise').to_pylist()) == ['Rowing', 'Rowing', 'Squat', 'Squat']
+    
+    def test_parquet_export(self, admin_client):
+        """Test the Parquet variant writes the same partitions"""
+        import pyarrow.parquet as pq
+        self.seed()
+        
+        response = admin_client.post('/api/admin/exports/workouts', data=json.dumps({'format': 'parquet'}),
+                                     content_type='application/json')
+        job = wait_for_job(admin_client, json.loads(response.data)['job']['status_url'])
+        manifest = json.loads(admin_client.get(job['result_url']).data)['result']
+        
+        assert pq.read_table(manifest['files'][1]['path']).num_rows == 4
+        assert os.listdir(os.path.dirname(manifest['path'])) == [os.path.basename(manifest['path'])]  # spool removed
+    
+    def test_rows_survive_workouts_logged_mid_export(self, client):
+        """Test a workout in a new category logged while rows are read doesn't break the iteration"""
+        self.seed()
+        rows = app_module.iter_workout_rows('alice')
+        next(rows)
+        app_module.store_workout('alice', {'exercise': 'Yoga', 'duration': 30, 'category': 'Mobility',
+                                           'timestamp': '2026-09-05T07:30:00', 'calories': 90.0})
+        assert len(list(rows)) == 1
+    
+    def test_export_requires_admin(self, authenticated_client):
+        """Test members cannot start bulk exports"""
+        assert authenticated_client.post('/api/admin/exports/workouts').status_code == 403
+
+
 class TestPages:
     """Test page rendering"""
     
@@ -0,0 +1,54 @@
+"""
+Unit Tests for the meal planner
+"""
+
+import pytest
+from meal_planner import DIETS, FOODS, MEALS, PlanSearch, food_index, macro_targets, plan_meals
+
+
+def planned_foods(plan):
+    by_name = {food[0]: food for food in FOODS}
+    return [by_name[item['food']] for meal in plan['meals'] for item in meal['items']]
+
+
+class TestPlans:
+    """Test plans meet their targets and respect dietary filters"""
+
+    @pytest.mark.parametrize('calories', [1200, 1800, 2450, 3200, 4000])
+    @pytest.mark.parametrize('diet', [(), ('vegan',), ('vegetarian', 'gluten_free'),
+                                      ('pescatarian', 'dairy_free', 'nut_free')])
+    def test_targets_met(self, calories, diet):
+        """Test calories land within 5% and each macro within 20% of target (servings are whole)"""
+        plan = plan_meals(calories, diet)
+        assert plan['totals']['calories'] == pytest.approx(calories, rel=0.05)
+        for name in ('protein', 'carbs', 'fats'):
+            assert plan['totals'][name] == pytest.approx(plan['targets'][name], rel=0.2)
+        for meal in plan['meals']:
+            assert meal['items'], meal['meal']
+    
+    def test_filters(self):
+        """Test filtered plans only use allowed foods"""
+        assert {food[7] for food in planned_foods(plan_meals(2200, ['vegan']))} == {'vegan'}
+        assert not any('gluten' in food[8] or food[7] == 'meat'
+                       for food in planned_foods(plan_meals(2200, ['pescatarian', 'gluten_free'])))
+        
+        with pytest.raises(ValueError):
+            plan_meals(2200, ['paleo'])
+        with pytest.raises(ValueError):
+            plan_meals(10)
+    
+    def test_memoised_by_bucket(self):
+        """Test nearby targets and filter order share one cached plan"""
+        assert plan_meals(1990, ['vegan', 'nut_free']) is plan_meals(2010, ['nut_free', 'vegan'])
+        assert plan_meals(2030)['calories'] == 2050
+    
+    def test_local_search_improves_greedy(self):
+        """Test the local search never ends above the greedy construction"""
+        for diet in [()] + [(name,) for name in DIETS]:
+            rows, nutrients, mask = food_index(diet)
+            search = PlanSearch(nutrients, mask, macro_targets(2600), [2600 * share for _, _, share in MEALS])
+            search.build()
+            greedy = search.current()
+            search.improve()
+            assert search.current() <= greedy
+            assert (search.servings >= 0).all() and not (search.servings & ~mask).any()